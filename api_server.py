@@ -0,0 +1,323 @@
+"""
+Read-only HTTP/JSON API over the ledger for other local tools, on asyncio and the standard
+library. It only listens on 127.0.0.1. Start it with:
+
+    python -m cli serve --port 8765
+
+    GET /transactions?page=1&page_size=50&from=&to=&account=&description=&min_amount=&max_amount=
+    GET /transactions/<id>
+    GET /balances?from=&to=&account=&description=
+    GET /orphan-batches?status=
+    GET /orphan-batches/<id>/lines?status=
+
+Queries run on a thread pool over a fixed set of read-only Database connections, so
+concurrent clients read in parallel instead of queueing on one connection, and a burst of
+clients waits for a free connection instead of opening more. Every response carries an
+ETag built from SQLite's data_version, which changes whenever any connection (the
+application included) commits. Responses are cached until then, and a client sending the
+current ETag in If-None-Match gets 304 Not Modified without a query being run.
+"""
+import re
+import sys
+import json
+import asyncio
+import secrets
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qsl
+
+from database import Database
+from journal_queries import (lines_source, transaction_page_query, transaction_count_query,
+                             account_balances_export_query)
+
+API_HOST = '127.0.0.1'
+API_PORT = 8765
+
+# Read-only connections, and worker threads, shared by all clients
+READER_CONNECTIONS = 4
+
+# Responses kept for the current data version
+RESPONSE_CACHE_SIZE = 256
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Longest request head (request line and headers) accepted
+MAX_HEAD_BYTES = 16 * 1024
+
+HTTP_REASONS = {200: "OK", 304: "Not Modified", 400: "Bad Request", 404: "Not Found",
+                405: "Method Not Allowed", 431: "Request Header Fields Too Large",
+                500: "Internal Server Error"}
+
+
+class ApiError(Exception):
+    """An error response: HTTP status and message"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def _integer(query, name, default=None, minimum=None, maximum=None):
+    value = query.get(name)
+    if value in (None, ''):
+        return default
+    try:
+        number = int(value)
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+    if minimum is not None and number < minimum:
+        raise ApiError(400, f"{name} must be at least {minimum}")
+    if maximum is not None and number > maximum:
+        raise ApiError(400, f"{name} must be at most {maximum}")
+    return number
+
+
+def _amount(query, name):
+    value = query.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise ApiError(400, f"{name} must be a number")
+
+
+def filter_params(reader, query):
+    """The transactions filter dict from the query string (from, to, account, description, amounts)"""
+    params = {}
+    for name, key in (('from', 'date_from'), ('to', 'date_to'), ('description', 'description')):
+        if query.get(name):
+            params[key] = query[name]
+    if query.get('account'):
+        account_id = reader.refs.account_id(query['account'])
+        if account_id is None:
+            raise ApiError(404, f"Unknown account: {query['account']}")
+        params['account_id'] = account_id
+    for name in ('min_amount', 'max_amount'):
+        amount = _amount(query, name)
+        if amount is not None:
+            params[name] = amount
+    return params
+
+
+def get_transactions(reader, query):
+    page = _integer(query, 'page', 1, minimum=1)
+    page_size = _integer(query, 'page_size', DEFAULT_PAGE_SIZE, minimum=1, maximum=MAX_PAGE_SIZE)
+    params = filter_params(reader, query)
+
+    lines = lines_source(reader, params)
+    count_query, count_params = transaction_count_query(params, lines)
+    total = reader.conn.execute(count_query, count_params).fetchone()[0]
+    page_query, page_params = transaction_page_query(params, page_size, (page - 1) * page_size, lines)
+    transactions = []
+    for row in reader.conn.execute(page_query, page_params):
+        transactions.append({
+            'id': row[0],
+            'date': None if row[1] == 'N/A' else row[1],
+            'description': row[2],
+            'amount': float(row[3]),
+            'currency': row[4],
+            'credit_accounts': row[5].split('\n') if row[5] else [],
+            'debit_accounts': row[6].split('\n') if row[6] else [],
+        })
+    return {'page': page, 'page_size': page_size, 'total': total, 'transactions': transactions}
+
+
+def get_transaction(reader, query, transaction_id):
+    transaction = reader.get_transaction_by_id(int(transaction_id))
+    if transaction is None:
+        raise ApiError(404, f"No transaction {transaction_id}")
+    transaction['lines'] = reader.get_transaction_details(transaction['id'])
+    return transaction
+
+
+def get_balances(reader, query):
+    params = filter_params(reader, query)
+    balances_query, params = account_balances_export_query(params, lines_source(reader, params))
+    return {'balances': [
+        {'account': row[0], 'category': row[1], 'currency': row[2],
+         'total_debit': row[3], 'total_credit': row[4], 'balance': row[5]}
+        for row in reader.conn.execute(balances_query, params)
+    ]}
+
+
+def get_orphan_batches(reader, query):
+    return {'batches': reader.get_orphan_batch_summaries(query.get('status') or None)}
+
+
+def get_orphan_lines(reader, query, batch_id):
+    return {'lines': reader.get_orphan_lines(int(batch_id), status=query.get('status') or None)}
+
+
+ROUTES = [
+    (re.compile(r'/transactions/?'), get_transactions),
+    (re.compile(r'/transactions/(\d+)'), get_transaction),
+    (re.compile(r'/balances/?'), get_balances),
+    (re.compile(r'/orphan-batches/?'), get_orphan_batches),
+    (re.compile(r'/orphan-batches/(\d+)/lines'), get_orphan_lines),
+]
+
+
+class ReaderPool:
+    """
+    size read-only Database connections handed out one request at a time, with a thread
+    pool of the same size to run the queries on. A request waits for a free connection, so
+    at most size queries run at once however many clients are connected.
+    """
+
+    def __init__(self, db_name, size=READER_CONNECTIONS):
+        self._executor = ThreadPoolExecutor(max_workers=size, thread_name_prefix='api-reader')
+        self._idle = asyncio.Queue()
+        for _ in range(size):
+            self._idle.put_nowait(Database(db_name, read_only=True))
+        # Readers never write, so their reference caches are cleared when the data version moves
+        self._seen_versions = {}
+
+    async def run(self, version, handler, *args):
+        """handler(reader, *args) on a worker thread with a free reader"""
+        reader = await self._idle.get()
+        try:
+            if self._seen_versions.get(id(reader)) != version:
+                reader.refs.clear()
+                self._seen_versions[id(reader)] = version
+            return await asyncio.get_running_loop().run_in_executor(self._executor, handler, reader, *args)
+        finally:
+            self._idle.put_nowait(reader)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        while not self._idle.empty():
+            self._idle.get_nowait().close_connection()
+
+
+class LedgerApi:
+    """The API server: routing, ETags and the response cache over a ReaderPool"""
+
+    def __init__(self, db_name, readers=READER_CONNECTIONS, cache_size=RESPONSE_CACHE_SIZE):
+        self.pool = ReaderPool(db_name, readers)
+        # PRAGMA data_version on a connection that never writes moves with every commit by anyone else
+        self._watcher = Database(db_name, read_only=True)
+        # data_version restarts with each connection, so ETags also name this server instance
+        self._instance = secrets.token_hex(4)
+        self._cache = OrderedDict()
+        self._cache_size = cache_size
+
+    def version(self):
+        return self._watcher.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def close(self):
+        self.pool.close()
+        self._watcher.close_connection()
+
+    async def respond(self, method, target, headers):
+        """(status, extra headers, body bytes) for one request"""
+        if method not in ('GET', 'HEAD'):
+            raise ApiError(405, f"{method} is not supported; the API is read-only")
+        url = urlsplit(target)
+        for pattern, handler in ROUTES:
+            match = pattern.fullmatch(url.path)
+            if match:
+                break
+        else:
+            raise ApiError(404, f"No endpoint at {url.path}")
+
+        version = self.version()
+        etag = f'"{self._instance}-{version}"'
+        if etag in [tag.strip() for tag in headers.get('if-none-match', '').split(',')]:
+            return 304, {'ETag': etag}, b''
+
+        query = dict(parse_qsl(url.query))
+        key = (url.path, tuple(sorted(query.items())))
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == etag:
+            self._cache.move_to_end(key)
+            return 200, {'ETag': etag}, cached[1]
+
+        result = await self.pool.run(version, handler, query, *match.groups())
+        body = json.dumps(result).encode('utf-8')
+        self._cache[key] = (etag, body)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return 200, {'ETag': etag}, body
+
+    async def handle_connection(self, reader, writer):
+        """Serve the requests of one keep-alive connection"""
+        try:
+            while True:
+                try:
+                    head = await reader.readuntil(b'\r\n\r\n')
+                except asyncio.LimitOverrunError:
+                    await self._write(writer, 'GET', 431, {}, b'', close=True)
+                    break
+                except asyncio.IncompleteReadError:
+                    break
+
+                request_line, *header_lines = head.decode('iso-8859-1').split('\r\n')
+                try:
+                    method, target, http_version = request_line.split(' ')
+                except ValueError:
+                    await self._write(writer, 'GET', 400, {}, b'', close=True)
+                    break
+                headers = {}
+                for line in header_lines:
+                    name, _, value = line.partition(':')
+                    if name:
+                        headers[name.strip().lower()] = value.strip()
+                if headers.get('content-length'):
+                    await reader.readexactly(int(headers['content-length']))
+
+                connection = headers.get('connection', '').lower()
+                close = connection == 'close' or (http_version == 'HTTP/1.0' and connection != 'keep-alive')
+                try:
+                    status, extra, body = await self.respond(method, target, headers)
+                except ApiError as e:
+                    status, extra, body = e.status, {}, json.dumps({'error': str(e)}).encode('utf-8')
+                except Exception as e:
+                    print(f"API error on {method} {target}: {e}", file=sys.stderr)
+                    status, extra, body = 500, {}, json.dumps({'error': str(e)}).encode('utf-8')
+                await self._write(writer, method, status, extra, body, close)
+                if close:
+                    break
+        except (ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    @staticmethod
+    async def _write(writer, method, status, extra, body, close=False):
+        lines = [f"HTTP/1.1 {status} {HTTP_REASONS[status]}",
+                 "Content-Type: application/json",
+                 f"Content-Length: {len(body)}",
+                 "Cache-Control: no-cache"]
+        lines += [f"{name}: {value}" for name, value in extra.items()]
+        if close:
+            lines.append("Connection: close")
+        writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('iso-8859-1'))
+        if method != 'HEAD':
+            writer.write(body)
+        await writer.drain()
+
+
+async def serve(db_name, port=API_PORT, readers=READER_CONNECTIONS, ready=None):
+    """Run the API on 127.0.0.1:port until cancelled; ready(server) is called once it listens"""
+    api = LedgerApi(db_name, readers)
+    server = await asyncio.start_server(api.handle_connection, API_HOST, port, limit=MAX_HEAD_BYTES)
+    try:
+        if ready:
+            ready(server)
+        async with server:
+            await server.serve_forever()
+    finally:
+        api.close()
+
+
+def run_server(db_name, port=API_PORT, readers=READER_CONNECTIONS):
+    """Serve the API until interrupted (Ctrl+C)"""
+    def ready(server):
+        print(f"Serving {db_name} on http://{API_HOST}:{port}/ with {readers} readers", file=sys.stderr)
+    try:
+        asyncio.run(serve(db_name, port, readers, ready))
+    except KeyboardInterrupt:
+        pass
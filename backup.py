@@ -0,0 +1,309 @@
+"""
+Online backups of the database file with SQLite's backup API, safe while the application
+is writing.
+
+create_snapshot() copies the database page by page through its own read-only connection,
+BACKUP_STEP_PAGES pages per step. Each step holds a shared lock on the file only for as long
+as it takes to copy those pages, so a write from the application waits at most one step
+(a few milliseconds); a write that lands during the copy makes SQLite restart it, so the
+snapshot is always a consistent state. Under constant writes the copy falls back to larger
+steps so that it still finishes. The copy is checked with PRAGMA integrity_check,
+gzip-compressed next to the others and the oldest snapshots beyond keep are removed.
+backup_in_background() runs the same on a worker thread.
+
+Closed years archived out of the database (Database.archive_year) live in files of their
+own, listed with the time they were last written in the archived_years table. Each backup
+also copies every archive listed in its snapshot, once per archived_at: the copy is named
+after that time (<archive name>-<YYYYmmdd-HHMMSS>.db.gz), so a snapshot is restored
+together with the archive copies named after the archived_at values it lists. An archive
+copy is removed once a newer copy of the same year was already in place when the oldest
+kept snapshot was taken. Copies of years restored since are left alone.
+"""
+import os
+import re
+import glob
+import gzip
+import shutil
+import sqlite3
+import datetime
+import tempfile
+import threading
+import time
+from urllib.request import pathname2url
+
+BACKUP_DIRECTORY = 'backups'
+
+# Snapshots kept per database; older ones are removed after each backup
+BACKUP_KEEP = 10
+
+# Pages copied per backup step (4 KB pages, so 512 KB at a time)
+BACKUP_STEP_PAGES = 128
+
+# Seconds to wait before retrying a step while a writer holds the file
+BACKUP_BUSY_SLEEP = 0.05
+
+# A write from another connection restarts the copy. After this many restarts the copy starts
+# over with steps BACKUP_STEP_GROWTH times larger, and finally as one step, which holds
+# writers off for the whole copy but cannot be restarted.
+BACKUP_MAX_RESTARTS = 3
+BACKUP_STEP_GROWTH = 16
+
+# Snapshot names: <database name>-<YYYYmmdd-HHMMSS>[-n].db.gz
+SNAPSHOT_SUFFIX = '.db.gz'
+_TIMESTAMP_FORMAT = "%Y%m%d-%H%M%S"
+
+
+class BackupError(Exception):
+    """A snapshot that could not be written or failed its integrity check"""
+
+
+class _TooManyRestarts(Exception):
+    """Raised from the backup progress callback to start over with larger steps"""
+
+
+def _snapshot_prefix(db_name):
+    return os.path.splitext(os.path.basename(db_name))[0] + '-'
+
+
+def list_snapshots(db_name, directory=BACKUP_DIRECTORY):
+    """Paths of the snapshots of db_name in directory, newest first"""
+    prefix = _snapshot_prefix(db_name)
+    pattern = re.compile(re.escape(prefix) + r'\d{8}-\d{6}(-\d+)?' + re.escape(SNAPSHOT_SUFFIX) + '$')
+    paths = [path for path in glob.glob(os.path.join(glob.escape(directory), prefix + '*' + SNAPSHOT_SUFFIX))
+             if pattern.match(os.path.basename(path))]
+    # Names sort by time; the -n suffix of same-second snapshots sorts after the plain name
+    return sorted(paths, key=lambda path: os.path.basename(path)[len(prefix):].replace(SNAPSHOT_SUFFIX, ''),
+                  reverse=True)
+
+
+def rotate_snapshots(db_name, directory=BACKUP_DIRECTORY, keep=BACKUP_KEEP):
+    """Remove all but the newest keep snapshots; returns the removed paths"""
+    removed = list_snapshots(db_name, directory)[keep:]
+    for path in removed:
+        os.remove(path)
+    return removed
+
+
+def check_integrity(conn):
+    """Problems PRAGMA integrity_check reports for a connection's database (empty if it is sound)"""
+    problems = [row[0] for row in conn.execute("PRAGMA integrity_check")]
+    return [] if problems == ['ok'] else problems
+
+
+def verify_snapshot(path):
+    """Decompress a snapshot to a temporary file and return its integrity_check problems"""
+    handle, temp_path = tempfile.mkstemp(suffix='.db')
+    try:
+        with os.fdopen(handle, 'wb') as target, gzip.open(path, 'rb') as source:
+            shutil.copyfileobj(source, target, 1024 * 1024)
+        conn = sqlite3.connect(temp_path)
+        try:
+            return check_integrity(conn)
+        finally:
+            conn.close()
+    finally:
+        os.remove(temp_path)
+
+
+def _snapshot_path(db_name, directory, now):
+    base = os.path.join(directory, _snapshot_prefix(db_name) + now.strftime(_TIMESTAMP_FORMAT))
+    path, number = base + SNAPSHOT_SUFFIX, 1
+    while os.path.exists(path):
+        number += 1
+        path = f"{base}-{number}{SNAPSHOT_SUFFIX}"
+    return path
+
+
+def _snapshot_time(path):
+    """The YYYYmmdd-HHMMSS part of a snapshot name"""
+    return re.search(r'(\d{8}-\d{6})(-\d+)?' + re.escape(SNAPSHOT_SUFFIX) + '$', os.path.basename(path)).group(1)
+
+
+def _compress(copy_path, path):
+    with open(copy_path, 'rb') as copy, gzip.open(path + '.partial', 'wb', compresslevel=6) as compressed:
+        shutil.copyfileobj(copy, compressed, 1024 * 1024)
+    os.replace(path + '.partial', path)
+
+
+def archived_files(conn):
+    """(file name, archived_at) of the year archives a database lists (none before archiving existed)"""
+    try:
+        return conn.execute("SELECT file_name, archived_at FROM archived_years ORDER BY year").fetchall()
+    except sqlite3.OperationalError:
+        return []
+
+
+def archive_copy_path(file_name, archived_at, directory=BACKUP_DIRECTORY):
+    """Path of the backup copy of an archive file as of its archived_at"""
+    stamp = datetime.datetime.strptime(archived_at, "%Y-%m-%d %H:%M:%S").strftime(_TIMESTAMP_FORMAT)
+    return os.path.join(directory, _snapshot_prefix(file_name) + stamp + SNAPSHOT_SUFFIX)
+
+
+def copy_archives(db_name, archives, directory=BACKUP_DIRECTORY):
+    """
+    Copy the archive files of (file name, archived_at) pairs, found next to db_name, that
+    have no copy for that archived_at yet. Archives are written only while they are being
+    archived into, so each is copied in one backup step. Returns the new copy paths.
+    """
+    written = []
+    for file_name, archived_at in archives:
+        path = archive_copy_path(file_name, archived_at, directory)
+        if os.path.exists(path):
+            continue
+        archive_path = os.path.join(os.path.dirname(os.path.abspath(db_name)), file_name)
+        if not os.path.exists(archive_path):
+            raise BackupError(f"The archive {archive_path} listed in the database is missing")
+        copy_path = path[:-len('.gz')] + '.partial'
+        source = sqlite3.connect(f"file:{pathname2url(archive_path)}?mode=ro", uri=True)
+        try:
+            target = sqlite3.connect(copy_path)
+            try:
+                source.backup(target, sleep=BACKUP_BUSY_SLEEP)
+                problems = check_integrity(target)
+            finally:
+                target.close()
+            if problems:
+                raise BackupError(f"The copy of {file_name} failed the integrity check: " + "; ".join(problems[:5]))
+            _compress(copy_path, path)
+        finally:
+            source.close()
+            for leftover in (copy_path, path + '.partial'):
+                if os.path.exists(leftover):
+                    os.remove(leftover)
+        written.append(path)
+    return written
+
+
+def rotate_archive_copies(db_name, archives, directory=BACKUP_DIRECTORY):
+    """
+    Remove the copies of each (file name, archived_at) archive that no kept snapshot of
+    db_name needs: those replaced by a newer copy before the oldest kept snapshot was taken.
+    Returns the removed paths.
+    """
+    snapshots = list_snapshots(db_name, directory)
+    if not snapshots:
+        return []
+    oldest = _snapshot_time(snapshots[-1])
+    removed = []
+    for file_name, archived_at in archives:
+        copies = list_snapshots(file_name, directory)
+        for newer, older in zip(copies, copies[1:]):
+            if _snapshot_time(newer) <= oldest:
+                os.remove(older)
+                removed.append(older)
+    return removed
+
+
+def create_snapshot(db_name, directory=BACKUP_DIRECTORY, keep=BACKUP_KEEP, step_pages=BACKUP_STEP_PAGES,
+                    progress=None):
+    """
+    Back up db_name into a new compressed snapshot in directory, then rotate the snapshots.
+    progress(pages_done, pages_total) is called after every step.
+
+    The year archives the snapshot lists are copied too (see copy_archives).
+
+    Returns a report dict: path, pages, steps, step_pages (the step size that completed,
+    -1 for one step), restarts (copies started over because the database was written
+    meanwhile), max_step_ms, size, compressed_size, archives (new archive copies), removed
+    (rotated out snapshots and archive copies) and seconds. Raises BackupError if a copy
+    fails its integrity check or a listed archive is missing.
+    """
+    start = time.perf_counter()
+    os.makedirs(directory, exist_ok=True)
+    path = _snapshot_path(db_name, directory, datetime.datetime.now())
+    copy_path = path[:-len('.gz')] + '.partial'
+    stats = {'steps': 0, 'restarts': 0, 'max_step': 0.0, 'pages': 0, 'step_pages': step_pages}
+
+    source = sqlite3.connect(f"file:{pathname2url(os.path.abspath(db_name))}?mode=ro", uri=True)
+    try:
+        target = sqlite3.connect(copy_path)
+        try:
+            last = {}
+
+            def on_step(status, remaining, total):
+                now = time.perf_counter()
+                busy = status in (sqlite3.SQLITE_BUSY, sqlite3.SQLITE_LOCKED)
+                if not busy:
+                    stats['max_step'] = max(stats['max_step'], now - last['time'])
+                stats['steps'] += 1
+                stats['pages'] = total
+                done = total - remaining
+                if last['done'] is not None and done < last['done']:
+                    stats['restarts'] += 1
+                    last['restarts'] += 1
+                    if last['restarts'] > BACKUP_MAX_RESTARTS:
+                        raise _TooManyRestarts()
+                last['done'] = done
+                if progress:
+                    progress(done, total)
+                # A busy step is followed by BACKUP_BUSY_SLEEP, which is not part of the next step
+                last['time'] = time.perf_counter() + (BACKUP_BUSY_SLEEP if busy else 0)
+
+            for pages in (step_pages, step_pages * BACKUP_STEP_GROWTH, -1):
+                last.update(time=time.perf_counter(), done=None, restarts=0)
+                try:
+                    source.backup(target, pages=pages, progress=on_step, sleep=BACKUP_BUSY_SLEEP)
+                except _TooManyRestarts:
+                    continue
+                stats['step_pages'] = pages
+                break
+            problems = check_integrity(target)
+            # The archives as of this snapshot, which must be backed up with it
+            archives = archived_files(target)
+        finally:
+            target.close()
+        if problems:
+            raise BackupError("Snapshot failed the integrity check: " + "; ".join(problems[:5]))
+
+        size = os.path.getsize(copy_path)
+        archive_copies = copy_archives(db_name, archives, directory)
+        _compress(copy_path, path)
+    finally:
+        source.close()
+        for leftover in (copy_path, path + '.partial'):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+    return {
+        'path': path,
+        'pages': stats['pages'],
+        'steps': stats['steps'],
+        'step_pages': stats['step_pages'],
+        'restarts': stats['restarts'],
+        'max_step_ms': stats['max_step'] * 1000,
+        'size': size,
+        'compressed_size': os.path.getsize(path),
+        'archives': archive_copies,
+        'removed': rotate_snapshots(db_name, directory, keep) + rotate_archive_copies(db_name, archives, directory),
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def backup_in_background(db_name, directory=BACKUP_DIRECTORY, keep=BACKUP_KEEP, on_done=None):
+    """
+    Run create_snapshot() on a new thread and return the thread. on_done(report, error) is
+    called on that thread when it finishes, with error None on success.
+    """
+    def run():
+        try:
+            report = create_snapshot(db_name, directory, keep)
+        except Exception as e:
+            if on_done:
+                on_done(None, e)
+            return
+        if on_done:
+            on_done(report, None)
+
+    thread = threading.Thread(target=run, name='database-backup')
+    thread.start()
+    return thread
+
+
+def format_backup_report(report):
+    """One line describing a create_snapshot() report"""
+    return (f"{os.path.basename(report['path'])}: {report['size'] / 1048576:.1f} MB "
+            f"({report['compressed_size'] / 1048576:.1f} MB compressed), {report['pages']} pages in "
+            f"{report['steps']} steps, longest step {report['max_step_ms']:.1f} ms, "
+            f"{report['restarts']} restarts, {report['seconds']:.2f}s"
+            + (f", {len(report['archives'])} year archives copied" if report['archives'] else "")
+            + (f", {len(report['removed'])} old snapshots removed" if report['removed'] else ""))
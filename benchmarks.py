@@ -0,0 +1,416 @@
+"""
+Benchmarks for the database layer.
+
+Each benchmark builds its own throw-away database in a temp directory, so the real
+finance.db is never touched. Run one or all of them from the project root:
+
+    python benchmarks.py                       # run everything
+    python benchmarks.py transaction_line_indexes
+    python benchmarks.py statement_import
+    python benchmarks.py similarity_clusters
+    python benchmarks.py orphan_indexes
+"""
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from database import Database, TRANSACTION_LINE_INDEXES, ORPHAN_INDEXES
+from csv_import import import_csv_file, parse_csv_file
+from statement_formats import import_statement_file, parse_statement_file
+from similarity import cluster_lines
+from categorization import apply_rules
+
+# The transaction_lines indexes as they were before the covering set was introduced
+LEGACY_TRANSACTION_LINE_INDEXES = {
+    'idx_transaction_lines_account_id': 'ON transaction_lines (account_id)',
+    'idx_transaction_lines_transaction_id': 'ON transaction_lines (transaction_id)',
+    'idx_transaction_lines_classification_id': 'ON transaction_lines (classification_id)',
+    'idx_transaction_lines_date': 'ON transaction_lines (date)',
+    'idx_transaction_lines_transaction_date': 'ON transaction_lines (transaction_id, date)',
+}
+
+# Partial debit/credit-side indexes, measured to show what they would add on top of the cover index
+SIDE_PARTIAL_INDEXES = {
+    'idx_bench_debit_side': 'ON transaction_lines (transaction_id, account_id, debit, date, classification_id) '
+                            'WHERE debit > 0',
+    'idx_bench_credit_side': 'ON transaction_lines (transaction_id, account_id, credit, date, classification_id) '
+                             'WHERE credit > 0',
+}
+
+
+def _timed(func, repeat=1):
+    """Run func repeat times and return the total elapsed seconds"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return time.perf_counter() - start
+
+
+def _new_database(directory, name):
+    """Create an empty database with the application schema"""
+    path = os.path.join(directory, name)
+    database = Database(path)
+    return database, path
+
+
+def _seed_reference_data(database, accounts=60, classifications=20):
+    """Insert the categories, currencies, accounts and classifications the generated lines point to"""
+    cursor = database.cursor
+    cursor.execute("INSERT INTO cat (name) VALUES ('Bench')")
+    cursor.execute("INSERT INTO currency (id, name, exchange_rate) VALUES (1, 'USD', 1.0)")
+    cursor.executemany("INSERT INTO accounts (name, cat_id, default_currency_id) VALUES (?, 1, 1)",
+                       [(f"Account {i}",) for i in range(accounts)])
+    cursor.executemany("INSERT INTO classifications (name) VALUES (?)",
+                       [(f"Class {i}",) for i in range(classifications)])
+    database.conn.commit()
+
+
+def _generate_journal(transactions, accounts=60, classifications=20, seed=42):
+    """Build (transactions, lines) rows for a balanced journal spread over five years"""
+    rng = random.Random(seed)
+    transaction_rows = []
+    line_rows = []
+    for transaction_id in range(1, transactions + 1):
+        transaction_rows.append((transaction_id, f"Payment {rng.randint(1, 500)}", 1))
+        date = f"{rng.randint(2020, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        amount = round(rng.uniform(1, 2000), 2)
+        classification_id = rng.randint(1, classifications) if rng.random() < 0.3 else None
+        line_rows.append((transaction_id, rng.randint(1, accounts), amount, None, date, classification_id))
+        # Occasionally split the credit side in two
+        if rng.random() < 0.2:
+            part = round(amount / 2, 2)
+            line_rows.append((transaction_id, rng.randint(1, accounts), None, part, date, None))
+            line_rows.append((transaction_id, rng.randint(1, accounts), None, round(amount - part, 2), date, None))
+        else:
+            line_rows.append((transaction_id, rng.randint(1, accounts), None, amount, date, None))
+    return transaction_rows, line_rows
+
+# The orphan staging indexes before the deliberate set: duplicate detection only
+LEGACY_ORPHAN_INDEXES = {
+    'idx_orphan_lines_fingerprint': 'ON orphan_transaction_lines (fingerprint)',
+}
+
+
+def _apply_index_set(cursor, indexes, tables=('transaction_lines',)):
+    """Replace every index of tables with the given set"""
+    existing = [row[0] for row in cursor.execute(
+        f"SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name IN ({', '.join('?' * len(tables))}) "
+        "AND name NOT LIKE 'sqlite_autoindex%'", tables)]
+    for index_name in existing:
+        cursor.execute(f"DROP INDEX {index_name}")
+    for index_name, definition in indexes.items():
+        cursor.execute(f"CREATE INDEX {index_name} {definition}")
+
+
+def bench_transaction_line_indexes(transactions=50000, lookups=2000):
+    """
+    Compare transaction_lines index sets: insert cost (write amplification), file size,
+    and the read patterns the application uses.
+    """
+    index_sets = {
+        'legacy': LEGACY_TRANSACTION_LINE_INDEXES,
+        'covering': TRANSACTION_LINE_INDEXES,
+        'covering + side partials': {**TRANSACTION_LINE_INDEXES, **SIDE_PARTIAL_INDEXES},
+    }
+    transaction_rows, line_rows = _generate_journal(transactions)
+    rng = random.Random(7)
+    transaction_ids = [rng.randint(1, transactions) for _ in range(lookups)]
+    account_ids = [rng.randint(1, 60) for _ in range(lookups // 10)]
+
+    queries = {
+        # get_transaction_lines_by_type
+        'lines by type': (lambda c, i: c.execute("""
+            SELECT tl.id, tl.account_id, a.name, tl.debit, tl.credit, tl.date, tl.classification_id, c.name
+            FROM transaction_lines tl
+            JOIN accounts a ON tl.account_id = a.id
+            LEFT JOIN classifications c ON tl.classification_id = c.id
+            WHERE tl.transaction_id = ? AND tl.debit IS NOT NULL AND tl.debit > 0
+        """, (transaction_ids[i],)).fetchall(), lookups),
+        # get_credit_card_statement
+        'account statement': (lambda c, i: c.execute("""
+            SELECT tl.date, t.description, tl.debit - tl.credit
+            FROM transaction_lines tl
+            JOIN transactions t ON tl.transaction_id = t.id
+            WHERE tl.account_id = ? AND tl.date BETWEEN '2023-03-01' AND '2023-03-31'
+            ORDER BY tl.date
+        """, (account_ids[i],)).fetchall(), len(account_ids)),
+        # Classification totals
+        'classification totals': (lambda c, i: c.execute("""
+            SELECT SUM(IFNULL(debit, 0)), SUM(IFNULL(credit, 0))
+            FROM transaction_lines WHERE classification_id = ? AND date >= '2022-01-01'
+        """, (i % 20 + 1,)).fetchall(), 200),
+        # Journal page (get_transactions_with_summary) filtered by a date range
+        'journal page by date': (lambda c, i: c.execute("""
+            WITH filtered_lines AS (
+                SELECT tl.transaction_id, tl.date, tl.debit, tl.account_id FROM transaction_lines tl
+                WHERE tl.date >= '2024-06-01' AND tl.date <= '2024-06-30')
+            SELECT t.id, t.description, t.currency_id, SUM(IFNULL(fl.debit, 0)), MIN(fl.date), COUNT(*)
+            FROM transactions t JOIN filtered_lines fl ON t.id = fl.transaction_id
+            GROUP BY t.id ORDER BY MIN(fl.date) DESC LIMIT 20
+        """).fetchall(), 50),
+        # Amount match in get_counterpart_suggestions
+        'credit amount match': (lambda c, i: c.execute("""
+            SELECT tl2.account_id, COUNT(*) FROM transaction_lines tl2
+            WHERE tl2.transaction_id IN (
+                SELECT transaction_id FROM transaction_lines WHERE credit > 0 AND credit BETWEEN ? AND ?)
+            AND tl2.debit IS NOT NULL AND tl2.debit > 0
+            GROUP BY tl2.account_id
+        """, (100.0 + i, 105.0 + i)).fetchall(), 200),
+    }
+
+    directory = tempfile.mkdtemp(prefix="pfc_bench_")
+    try:
+        print(f"transaction_lines index sets: {transactions} transactions, {len(line_rows)} lines")
+        print(f"{'index set':<26}{'insert s':>10}{'lines/s':>10}{'size MB':>9}"
+              + "".join(f"{name:>24}" for name in queries))
+        for label, indexes in index_sets.items():
+            database, path = _new_database(directory, f"{label.replace(' ', '_').replace('+', '')}.db")
+            _seed_reference_data(database)
+            cursor = database.cursor
+            _apply_index_set(cursor, indexes)
+            database.conn.commit()
+
+            def insert_journal():
+                cursor.executemany("INSERT INTO transactions (id, description, currency_id) VALUES (?, ?, ?)",
+                                   transaction_rows)
+                cursor.executemany("""
+                    INSERT INTO transaction_lines (transaction_id, account_id, debit, credit, date, classification_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                """, line_rows)
+                database.conn.commit()
+
+            insert_seconds = _timed(insert_journal)
+            cursor.execute("ANALYZE")
+            database.conn.commit()
+            size_mb = os.path.getsize(path) / (1024 * 1024)
+
+            timings = []
+            for name, (query, repeat) in queries.items():
+                counter = iter(range(repeat))
+                elapsed = _timed(lambda: query(cursor, next(counter)), repeat)
+                timings.append(f"{elapsed * 1000 / repeat:.3f} ms")
+            print(f"{label:<26}{insert_seconds:>10.2f}{len(line_rows) / insert_seconds:>10.0f}{size_mb:>9.1f}"
+                  + "".join(f"{t:>24}" for t in timings))
+            database.close_connection()
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+def _generate_statement(transactions, seed=11):
+    """(date, description, amount) tuples of a statement spread over five years, oldest first"""
+    rng = random.Random(seed)
+    rows = []
+    for _ in range(transactions):
+        date = f"{rng.randint(2020, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        amount = round(rng.uniform(-900, 600), 2) or 1.0
+        rows.append((date, f"Card purchase {rng.randint(1, 3000)}", amount))
+    rows.sort()
+    return rows
+
+
+def _write_statement_files(directory, rows, name):
+    """Write rows as the same statement in CSV, OFX 1.x (SGML) and QIF; returns {format: path}"""
+    paths = {fmt: os.path.join(directory, f"{name}.{fmt}") for fmt in ('csv', 'ofx', 'qif')}
+    with open(paths['csv'], 'w', newline='', encoding='utf-8') as f:
+        f.write("Date,Description,Amount\n")
+        f.writelines(f"{date},{description},{amount:.2f}\n" for date, description, amount in rows)
+    with open(paths['ofx'], 'w', encoding='utf-8') as f:
+        f.write("OFXHEADER:100\nDATA:OFXSGML\nVERSION:102\nENCODING:USASCII\nCHARSET:1252\n\n"
+                "<OFX><BANKMSGSRSV1><STMTTRNRS><STMTRS><CURDEF>USD\n"
+                "<BANKACCTFROM><BANKID>1<ACCTID>Account 1<ACCTTYPE>CHECKING</BANKACCTFROM>\n<BANKTRANLIST>\n")
+        for number, (date, description, amount) in enumerate(rows):
+            f.write(f"<STMTTRN><TRNTYPE>{'CREDIT' if amount > 0 else 'DEBIT'}<DTPOSTED>{date.replace('-', '')}120000"
+                    f"<TRNAMT>{amount:.2f}<FITID>{number}<NAME>{description}</STMTTRN>\n")
+        f.write("</BANKTRANLIST></STMTRS></STMTTRNRS></BANKMSGSRSV1></OFX>\n")
+    with open(paths['qif'], 'w', encoding='utf-8') as f:
+        f.write("!Type:Bank\n")
+        for date, description, amount in rows:
+            year, month, day = date.split('-')
+            f.write(f"D{int(month)}/{int(day):>2}'{year[2:]}\nT{amount:,.2f}\nP{description}\n^\n")
+    return paths
+
+
+def bench_statement_import(sizes=(10000, 40000, 160000)):
+    """
+    Parse and import the same statement as CSV, OFX and QIF at growing sizes. Parse rate
+    (rows/s) should stay flat as the files grow; import includes duplicate checks and the
+    chunked inserts into the orphan tables.
+    """
+    directory = tempfile.mkdtemp(prefix="pfc_bench_")
+    try:
+        print(f"{'format':<8}{'rows':>9}{'MB':>7}{'parse s':>9}{'parse rows/s':>14}{'import s':>10}{'import rows/s':>15}")
+        for size in sizes:
+            paths = _write_statement_files(directory, _generate_statement(size), f"statement_{size}")
+            for fmt, path in paths.items():
+                mapping = {'account': 'Account 1', 'currency': 'USD', 'date_format': 'Auto-detect'}
+                if fmt == 'csv':
+                    mapping.update(has_header=True, columns={'date': 'Date', 'description': 'Description',
+                                                             'amount': 'Amount'})
+                    parse, import_file = parse_csv_file, import_csv_file
+                else:
+                    parse, import_file = parse_statement_file, import_statement_file
+                parse_seconds = _timed(lambda: parse(path, mapping))
+
+                database, _ = _new_database(directory, f"import_{size}_{fmt}.db")
+                _seed_reference_data(database)
+                report = import_file(database, path, mapping)
+                database.close_connection()
+                print(f"{fmt:<8}{report['rows']:>9}{os.path.getsize(path) / (1024 * 1024):>7.1f}{parse_seconds:>9.2f}"
+                      f"{report['rows'] / parse_seconds:>14.0f}{report['seconds']:>10.2f}{report['rows_per_second']:>15.0f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+# Spellings of the same payees as different banks and card networks print them
+MERCHANT_VARIANTS = [
+    ["AMAZON MARKETPLACE", "AMZN Mktp US", "Amazon.com", "AMAZON MKTPLACE PMTS"],
+    ["UBER TRIP", "UBER *TRIP HELP.UBER.COM", "UBER BV"],
+    ["NETFLIX.COM", "NETFLIX COM", "Netflix Subscription"],
+    ["SHELL OIL", "SHELL SERVICE STATION", "SHELL"],
+    ["STARBUCKS COFFEE", "STARBUCKS STORE", "SBUX"],
+    ["TESCO STORES", "TESCO EXPRESS", "TESCO METRO"],
+    ["SPOTIFY AB", "SPOTIFY P0", "Spotify Premium"],
+    ["SALARY ACME CORP", "ACME CORP PAYROLL"],
+]
+
+
+def _generate_descriptions(lines, payees=400, seed=5):
+    """(payee, description) pairs: the known merchants plus generated payees, with card numbers and references"""
+    rng = random.Random(seed)
+    kinds = ["MARKET", "CAFE", "PHARMACY", "AUTO", "BOOKS", "TRAVEL", "HOME", "RESTAURANT", "HOTEL", "BAKERY"]
+    variants = list(MERCHANT_VARIANTS)
+    while len(variants) < payees:
+        name = "".join(rng.choice("bcdfghjklmnprstvwz") + rng.choice("aeiou") for _ in range(rng.randint(2, 4))).upper()
+        kind = rng.choice(kinds)
+        variants.append([f"{name} {kind}", f"{name} {kind[:4]}", name])
+    rows = []
+    for _ in range(lines):
+        payee = rng.randrange(len(variants))
+        description = rng.choice(variants[payee])
+        if rng.random() < 0.6:
+            description = f"POS {rng.randint(1000, 9999)} {description} {rng.randint(100000, 999999)}"
+        rows.append((payee, description))
+    return rows
+
+
+def bench_similarity_clusters(sizes=(5000, 20000, 80000)):
+    """
+    Cluster generated orphan descriptions with MinHash/LSH. Lines per second should stay
+    roughly flat as the batch grows. Purity is the share of lines whose cluster's most
+    common payee is their own; completeness the share in their payee's largest cluster.
+    """
+    print(f"{'lines':>8}{'distinct':>10}{'clusters':>10}{'seconds':>9}{'lines/s':>10}{'purity':>8}"
+          f"{'complete':>10}")
+    for size in sizes:
+        rows = _generate_descriptions(size)
+        lines = [{'id': number, 'description': description} for number, (_, description) in enumerate(rows)]
+        start = time.perf_counter()
+        clusters = cluster_lines(lines, min_size=1)
+        seconds = time.perf_counter() - start
+
+        pure = 0
+        largest = {}
+        for cluster in clusters:
+            counts = {}
+            for line in cluster:
+                payee = rows[line['id']][0]
+                counts[payee] = counts.get(payee, 0) + 1
+            pure += max(counts.values())
+            for payee, count in counts.items():
+                largest[payee] = max(largest.get(payee, 0), count)
+        distinct = len({description for _, description in rows})
+        print(f"{size:>8}{distinct:>10}{len(clusters):>10}{seconds:>9.2f}{size / seconds:>10.0f}{pure / size:>8.3f}"
+              f"{sum(largest.values()) / size:>10.3f}")
+
+
+def bench_orphan_indexes(lines=100000, history_batches=200, history_lines=2000, processed=500, reopened=100):
+    """
+    Open and process a lines-sized orphan batch next to a history of earlier batches, with
+    the old and the current staging index sets: import (write cost), opening the batch list,
+    the batch and reopened earlier batches, the queue of new lines across all batches,
+    posting lines one at a time and applying a rule to the batch.
+    """
+    index_sets = {'legacy': LEGACY_ORPHAN_INDEXES, 'current': ORPHAN_INDEXES}
+    rng = random.Random(3)
+
+    def line(description):
+        amount = round(rng.uniform(1, 900), 2)
+        debit = amount if rng.random() < 0.7 else None
+        date = f"{rng.randint(2020, 2024)}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}"
+        return description, rng.randint(1, 60), debit, None if debit else amount, date
+
+    batch_lines = [dict(zip(('description', 'account_id', 'debit', 'credit', 'date'), line(description)))
+                   for _, description in _generate_descriptions(lines)]
+    history = [(batch + 1, *line(description), 'consumed' if rng.random() < 0.9 else 'ignored')
+               for batch in range(history_batches)
+               for _, description in _generate_descriptions(history_lines, seed=batch)]
+
+    directory = tempfile.mkdtemp(prefix="pfc_bench_")
+    try:
+        print(f"orphan staging indexes: {lines} line batch, {len(history)} lines in {history_batches} earlier batches")
+        steps = ['import', 'open list', 'open batch', f'reopen {reopened}', 'all new', f'post {processed}',
+                 'apply rule', 'size MB']
+        print(f"{'index set':<10}" + "".join(f"{step:>13}" for step in steps))
+        for label, indexes in index_sets.items():
+            database, path = _new_database(directory, f"orphans_{label}.db")
+            _seed_reference_data(database)
+            cursor = database.cursor
+            _apply_index_set(cursor, indexes, ('orphan_transaction_lines', 'orphan_transactions'))
+            cursor.executemany("INSERT INTO orphan_transactions (id, reference, import_date, status) "
+                               "VALUES (?, ?, ?, 'processed')",
+                               [(batch + 1, f"history_{batch}.csv", f"2023-01-01 00:{batch // 60:02d}:{batch % 60:02d}")
+                                for batch in range(history_batches)])
+            cursor.executemany("INSERT INTO orphan_transaction_lines "
+                               "(orphan_transaction_id, description, account_id, debit, credit, date, status) "
+                               "VALUES (?, ?, ?, ?, ?, ?, ?)", history)
+            database.insert_rule(name="Amazon", pattern="amazon", counterpart_account_id=2)
+            cursor.execute("ANALYZE")
+            database.conn.commit()
+
+            timings = []
+            start = time.perf_counter()
+            batch_id = database.insert_orphan_transaction("statement.csv", batch_lines)
+            timings.append(time.perf_counter() - start)
+            timings.append(_timed(database.get_orphan_batch_summaries))
+            timings.append(_timed(lambda: database.get_orphan_lines(batch_id)))
+            earlier = iter(rng.sample(range(1, history_batches + 1), reopened))
+            timings.append(_timed(lambda: database.get_orphan_lines(next(earlier)), reopened))
+            timings.append(_timed(lambda: database.get_orphan_lines(status='new')))
+            new_lines = database.get_orphan_lines(batch_id, 'new')
+
+            def post_lines():
+                for orphan in new_lines[:processed]:
+                    database.create_transaction_from_orphans(orphan['description'], 1, [orphan['id']], 3,
+                                                             orphan['date'])
+            timings.append(_timed(post_lines))
+            timings.append(_timed(lambda: apply_rules(database, batch_id, dry_run=False)))
+
+            database.close_connection()
+            print(f"{label:<10}" + "".join(f"{seconds:>12.3f}s" for seconds in timings)
+                  + f"{os.path.getsize(path) / (1024 * 1024):>13.1f}")
+    finally:
+        shutil.rmtree(directory, ignore_errors=True)
+
+
+BENCHMARKS = {
+    'transaction_line_indexes': bench_transaction_line_indexes,
+    'statement_import': bench_statement_import,
+    'similarity_clusters': bench_similarity_clusters,
+    'orphan_indexes': bench_orphan_indexes,
+}
+
+
+def run_benchmarks(names=None):
+    """Run the named benchmarks (all of them by default)"""
+    for name in names or BENCHMARKS:
+        if name not in BENCHMARKS:
+            raise ValueError(f"Unknown benchmark: {name}. Available: {', '.join(BENCHMARKS)}")
+        BENCHMARKS[name]()
+        print()
+
+
+if __name__ == "__main__":
+    run_benchmarks(sys.argv[1:])
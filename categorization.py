@@ -0,0 +1,218 @@
+"""
+Rule-based categorization of orphan lines.
+
+Rules live in the categorization_rules table: a description match (all words of a token
+pattern, or a regular expression), optional direction, amount range and source account,
+and the counterpart account (plus classification) a matching line is posted against.
+
+RuleMatcher compiles the rules once: token rules into a word index, so a line only looks at
+rules sharing one of its words, and regular expressions into one alternation tried in
+priority order, so each line costs one regex match however many rules there are.
+apply_rules() runs it over the new lines of a batch (or of all batches) in one pass and either
+reports what would be posted (dry run) or posts all matches in one database transaction.
+"""
+import re
+import time
+
+from database import normalize_description
+
+# Rule patterns match case-insensitively
+RULE_FLAGS = re.IGNORECASE
+
+
+def combined_alternative(pattern, index):
+    """A regex rule's alternative in RuleMatcher's combined expression; the empty group names the rule"""
+    return f"(?=.*?(?:{pattern}))(?P<r{index}>)"
+
+
+def validate_rule(rule):
+    """Error message for a rule whose pattern cannot be matched, or None if it is fine"""
+    pattern = rule.get('pattern') or ''
+    if rule.get('match_type') == 'regex':
+        try:
+            compiled = re.compile(pattern, RULE_FLAGS)
+        except re.error as e:
+            return f"Invalid regular expression: {e}"
+        # Compiled the way it is combined, which rejects what only works at the start of a
+        # whole expression, such as global inline flags like (?i)
+        try:
+            re.compile(combined_alternative(pattern, 0), RULE_FLAGS)
+        except re.error as e:
+            return f"The pattern cannot be combined with other rules: {e}"
+        # Every pattern becomes part of one combined expression, where these would clash
+        if compiled.groupindex:
+            return "Named groups are not supported in rule patterns"
+        if re.search(r"\\[1-9]|\(\?P=", pattern):
+            return "Backreferences are not supported in rule patterns"
+        if compiled.match(''):
+            return "The pattern matches every description"
+    elif not normalize_description(pattern):
+        return "The pattern has no words to match"
+    return None
+
+
+def rule_words(rule):
+    """The words a token rule requires, as found in normalised descriptions"""
+    return frozenset(normalize_description(rule['pattern']).split())
+
+
+class RuleMatcher:
+    """
+    Enabled rules compiled for matching, in priority order; rules with invalid patterns are
+    kept in invalid. Token rules are indexed by their longest word, so a line only checks the
+    rules sharing one of its words. Regular expressions are joined into one alternation of
+    lookaheads, whose first matching alternative is the highest-priority regex rule.
+    """
+
+    def __init__(self, rules):
+        self.rules = []
+        self.invalid = []
+        for rule in rules:
+            error = validate_rule(rule)
+            if error:
+                self.invalid.append((rule, error))
+            else:
+                self.rules.append(rule)
+
+        self._words = {}
+        self._word_index = {}
+        regex_indices = []
+        for index, rule in enumerate(self.rules):
+            if rule.get('match_type') == 'regex':
+                regex_indices.append(index)
+            else:
+                words = rule_words(rule)
+                self._words[index] = words
+                self._word_index.setdefault(max(words, key=len), []).append(index)
+
+        # The empty group after each alternative names the rule that matched
+        self._regex_indices = regex_indices
+        self._combined = None
+        if regex_indices:
+            self._combined = re.compile(
+                "|".join(combined_alternative(self.rules[index]['pattern'], index) for index in regex_indices),
+                RULE_FLAGS)
+        # Each regex rule on its own, for the rare line whose first match fails the amount or account checks
+        self._expressions = {index: re.compile(self.rules[index]['pattern'], RULE_FLAGS) for index in regex_indices}
+
+    @staticmethod
+    def _accepts(rule, debit, credit, account_id):
+        if rule['source_account_id'] is not None and rule['source_account_id'] != account_id:
+            return False
+        if rule['direction'] == 'debit' and not debit:
+            return False
+        if rule['direction'] == 'credit' and not credit:
+            return False
+        amount = debit or credit or 0
+        if rule['min_amount'] is not None and amount < rule['min_amount']:
+            return False
+        if rule['max_amount'] is not None and amount > rule['max_amount']:
+            return False
+        return True
+
+    def match(self, description, debit=None, credit=None, account_id=None):
+        """The first rule (by priority) matching the line, or None"""
+        if not self.rules:
+            return None
+        description = (description or '').replace('\n', ' ')
+
+        # Best token rule: candidates come from the word index, then need all their words
+        best = len(self.rules)
+        words = set(normalize_description(description).split())
+        candidates = sorted(index for word in words for index in self._word_index.get(word, ()))
+        for index in candidates:
+            if self._words[index] <= words and self._accepts(self.rules[index], debit, credit, account_id):
+                best = index
+                break
+
+        # A regex rule wins if it comes first in priority order
+        if self._combined is not None:
+            found = self._combined.match(description)
+            if found:
+                first = int(found.lastgroup[1:])
+                if first < best:
+                    if self._accepts(self.rules[first], debit, credit, account_id):
+                        return self.rules[first]
+                    for index in self._regex_indices:
+                        if first < index < best and self._accepts(self.rules[index], debit, credit, account_id) \
+                                and self._expressions[index].search(description):
+                            return self.rules[index]
+
+        return self.rules[best] if best < len(self.rules) else None
+
+
+def compile_rules(database):
+    """RuleMatcher over the enabled rules of database"""
+    return RuleMatcher(database.get_all_rules(enabled_only=True))
+
+
+def apply_rules(database, orphan_transaction_id=None, dry_run=True, matcher=None):
+    """
+    Match the new lines of one orphan batch (or of every batch) against the rules in one
+    pass. Lines without a resolved account are never posted, nor are matches whose
+    currency is unknown (neither the line's account nor the counterpart account has a
+    default currency). Unless dry_run, every other matched line is posted as a balanced
+    transaction against its rule's counterpart account.
+
+    Returns a report dict: matches [(line, rule)], unmatched [line], no_currency
+    [(line, rule)], per_rule {rule id: count}, invalid [(rule, error)], transaction_ids
+    (empty for a dry run) and seconds.
+    """
+    start = time.perf_counter()
+    matcher = matcher or compile_rules(database)
+
+    matches = []
+    unmatched = []
+    no_currency = []
+    per_rule = {}
+    for line in database.get_orphan_lines(orphan_transaction_id, status='new'):
+        rule = None
+        if line['account_id'] is not None:
+            rule = matcher.match(line['description'], line['debit'], line['credit'], line['account_id'])
+        if rule is None:
+            unmatched.append(line)
+            continue
+        if database.rule_match_currency_id(line, rule) is None:
+            no_currency.append((line, rule))
+            continue
+        matches.append((line, rule))
+        per_rule[rule['id']] = per_rule.get(rule['id'], 0) + 1
+
+    transaction_ids = []
+    if matches and not dry_run:
+        transaction_ids = database.post_rule_matches(matches)
+
+    return {
+        'matches': matches,
+        'unmatched': unmatched,
+        'no_currency': no_currency,
+        'per_rule': per_rule,
+        'invalid': matcher.invalid,
+        'transaction_ids': transaction_ids,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def format_rule_report(report, rules, max_lines=200):
+    """Text lines describing an apply_rules() report: totals, per-rule counts and the matched lines"""
+    posted = bool(report['transaction_ids'])
+    text = [f"{len(report['matches'])} lines {'posted' if posted else 'would be posted'}, "
+            f"{len(report['unmatched'])} left unmatched ({report['seconds']:.2f}s)"]
+    rule_names = {rule['id']: rule['name'] for rule in rules}
+    for rule_id, count in sorted(report['per_rule'].items(), key=lambda item: -item[1]):
+        text.append(f"  {rule_names.get(rule_id, rule_id)}: {count}")
+    for rule, error in report['invalid']:
+        text.append(f"  Skipped rule {rule['name']}: {error}")
+    for line, rule in report['no_currency']:
+        text.append(f"  Not posted, no currency: {line['description']} (neither its account nor "
+                    f"{rule['counterpart_account_name']} has a default currency)")
+
+    text.append("")
+    for line, rule in report['matches'][:max_lines]:
+        amount = line['debit'] or -(line['credit'] or 0)
+        text.append(f"{line['date'] or ''}  {amount:>12.2f}  {line['description']}  ->  "
+                    f"{rule['counterpart_account_name']}"
+                    + (f" ({rule['classification_name']})" if rule['classification_name'] else ""))
+    if len(report['matches']) > max_lines:
+        text.append(f"... and {len(report['matches']) - max_lines} more")
+    return text
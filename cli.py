@@ -0,0 +1,382 @@
+"""
+Command-line interface for batch jobs, without Qt. Run it from the project root:
+
+    python -m cli import statement.csv more_statements/ --account "Current Account"
+    python -m cli import march.ofx
+    python -m cli process-orphans --rules --dry-run
+    python -m cli export journal.xlsx --from 2024-01-01 --to 2024-12-31
+    python -m cli report balances --to 2024-12-31
+    python -m cli report batches --status new
+    python -m cli bench orphan_indexes
+    python -m cli serve --port 8765
+    python -m cli backup --keep 30
+    python -m cli archive 2021 2022
+    python -m cli maintain --budget 60
+
+Every command works on finance.db unless --db names another file, and reports how long it
+took on stderr, so cron jobs can be logged and timed. CSV imports use the column mapping in
+a JSON file (--mapping) or, by default, the last mapping saved by the import wizard.
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+
+import database
+from csv_import import import_csv_files, collect_csv_paths
+from statement_formats import import_statement_file, statement_kind
+from categorization import apply_rules, format_rule_report
+from similarity import cluster_orphan_lines, cluster_label
+from export_formats import export_query_sheets
+from backup import (create_snapshot, list_snapshots, verify_snapshot, format_backup_report, archived_files,
+                    BackupError, BACKUP_DIRECTORY, BACKUP_KEEP)
+from maintenance import run_maintenance, format_maintenance_report, MAINTENANCE_TASKS, MAINTENANCE_BUDGET
+from journal_queries import (lines_source, transaction_export_query, transaction_lines_export_query,
+                             account_balances_export_query, TRANSACTION_EXPORT_HEADERS,
+                             TRANSACTION_LINES_EXPORT_HEADERS, ACCOUNT_BALANCES_EXPORT_HEADERS)
+
+CONFIG_FILE = 'config.json'
+
+BATCH_SUMMARY_HEADERS = ["ID", "Reference", "Imported", "Status", "Lines", "New", "Debit", "Credit", "Dates"]
+
+
+class CommandError(Exception):
+    """A command that cannot run as asked; its message is printed without a traceback"""
+
+
+def load_config():
+    try:
+        with open(CONFIG_FILE, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def open_database(path):
+    """The application's database for finance.db, otherwise a Database on an existing file"""
+    if os.path.abspath(path) == os.path.abspath('finance.db'):
+        return database.default_database()
+    if not os.path.exists(path):
+        raise CommandError(f"No database at {path}")
+    return database.Database(path)
+
+
+def import_mapping(args):
+    """The import mapping from --mapping or the wizard's last mapping, with the command-line overrides"""
+    if args.mapping:
+        with open(args.mapping, 'r') as f:
+            mapping = json.load(f)
+    else:
+        mapping = load_config().get('last_import_mapping') or {}
+    if args.account:
+        mapping['account'] = args.account
+    if args.currency:
+        mapping['currency'] = args.currency
+    if args.skip_duplicates:
+        mapping['duplicates'] = 'skip'
+    mapping.setdefault('date_format', "Auto-detect")
+    return mapping
+
+
+def report_line(report):
+    """One line describing an import report, as the batch import dialog lists them"""
+    name = os.path.basename(report['file'])
+    if report['failed']:
+        return f"{name}: failed - {report['failed']}"
+    return (f"{name}: {report['rows']} rows in {report['seconds']:.2f}s "
+            f"({report.get('rows_per_second', 0.0):.0f} rows/s), {len(report['errors'])} errors, "
+            f"{report['duplicates']} duplicates"
+            + (f", batch #{report['orphan_id']}" if report['orphan_id'] else ", nothing imported")
+            + (f", resumed after row {report['resumed_from']}" if report.get('resumed_from') else ""))
+
+
+def command_import(db, args):
+    mapping = import_mapping(args)
+    statements = [path for path in args.paths if os.path.isfile(path) and statement_kind(path)]
+    csv_paths = [path for path in args.paths if path not in statements]
+    if csv_paths and not mapping.get('columns'):
+        raise CommandError("CSV imports need a column mapping: pass --mapping, or import one file "
+                           "with the Import CSV wizard first")
+
+    failed = 0
+    reports = [import_statement_file(db, path, mapping, resume=not args.restart) for path in statements]
+    if csv_paths:
+        if not collect_csv_paths(csv_paths):
+            raise CommandError("No CSV files found in " + ", ".join(csv_paths))
+        reports = reports + list(import_csv_files(db, csv_paths, mapping, args.workers))
+    for report in reports:
+        print(report_line(report))
+        for error in report['errors'][:args.max_errors]:
+            print(f"    {error}")
+        failed += bool(report['failed'])
+    return 1 if failed else 0
+
+
+def command_process_orphans(db, args):
+    if args.rules:
+        report = apply_rules(db, args.batch, dry_run=args.dry_run)
+        for line in format_rule_report(report, db.get_all_rules(), args.max_lines):
+            print(line)
+    else:
+        clusters = cluster_orphan_lines(db, args.batch, min_size=args.min_size)
+        for number, cluster in enumerate(clusters, start=1):
+            print(f"{number:>4}  {cluster_label(cluster)}")
+        print(f"{len(clusters)} clusters of {sum(len(cluster) for cluster in clusters)} lines")
+    return 0
+
+
+def filter_params(db, args):
+    """The transactions filter dict for the --from/--to/--account/--description options"""
+    params = {}
+    if args.date_from:
+        params['date_from'] = args.date_from
+    if args.date_to:
+        params['date_to'] = args.date_to
+    if getattr(args, 'account', None):
+        account_id = db.refs.account_id(args.account)
+        if account_id is None:
+            raise CommandError(f"Unknown account: {args.account}")
+        params['account_id'] = account_id
+    if getattr(args, 'description', None):
+        params['description'] = args.description
+    return params
+
+
+def command_export(db, args):
+    params = filter_params(db, args)
+    lines = lines_source(db, params)
+    query, query_params = transaction_export_query(params, lines)
+    if args.file.lower().endswith('.xlsx'):
+        lines_query, lines_params = transaction_lines_export_query(params, lines)
+        balances_query, balances_params = account_balances_export_query(params, lines)
+        sheets = [
+            ("Journal", TRANSACTION_EXPORT_HEADERS, query, query_params),
+            ("Lines", TRANSACTION_LINES_EXPORT_HEADERS, lines_query, lines_params),
+            ("Balances", ACCOUNT_BALANCES_EXPORT_HEADERS, balances_query, balances_params),
+        ]
+    else:
+        sheets = [("Transactions Journal", TRANSACTION_EXPORT_HEADERS, query, query_params)]
+    rows = export_query_sheets(db, sheets, args.file)
+    print(f"{rows} rows exported to {args.file}")
+    return 0
+
+
+def format_table(headers, rows):
+    """Rows as text columns under their headers, numbers right-aligned"""
+    rows = [["" if value is None else f"{value:.2f}" if isinstance(value, float) else str(value)
+             for value in row] for row in rows]
+    widths = [max([len(header)] + [len(row[column]) for row in rows]) for column, header in enumerate(headers)]
+    numeric = [all(row[column].replace('.', '', 1).lstrip('-').isdigit() for row in rows if row[column])
+               for column in range(len(headers))]
+
+    def line(values):
+        return "  ".join(value.rjust(width) if right else value.ljust(width)
+                         for value, width, right in zip(values, widths, numeric)).rstrip()
+    return [line(headers), line(["-" * width for width in widths])] + [line(row) for row in rows]
+
+
+def command_report(db, args):
+    if args.report == 'balances':
+        params = filter_params(db, args)
+        query, params = account_balances_export_query(params, lines_source(db, params))
+        headers = ACCOUNT_BALANCES_EXPORT_HEADERS
+        conn = db.open_reader()
+        try:
+            rows = conn.execute(query, params).fetchall()
+        finally:
+            conn.close()
+    else:
+        headers = BATCH_SUMMARY_HEADERS
+        rows = [(batch['id'], batch['reference'], batch['import_date'], batch['status'], batch['line_count'],
+                 batch['status_counts'].get('new', 0), batch['debit_total'], batch['credit_total'],
+                 f"{batch['first_date']} - {batch['last_date']}" if batch['first_date'] else "")
+                for batch in db.get_orphan_batch_summaries(args.status)]
+
+    if args.csv:
+        writer = csv.writer(sys.stdout)
+        writer.writerow(headers)
+        writer.writerows(rows)
+    else:
+        for line in format_table(headers, rows):
+            print(line)
+    return 0
+
+
+def command_bench(db, args):
+    # Benchmarks build their own databases; the import is here to keep it off every other command
+    from benchmarks import BENCHMARKS, run_benchmarks
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        raise CommandError(f"Unknown benchmark: {', '.join(unknown)}. Available: {', '.join(BENCHMARKS)}")
+    run_benchmarks(args.names)
+    return 0
+
+
+def command_serve(db, args):
+    # Imported here so the other commands do not load asyncio
+    from api_server import run_server
+    run_server(db.db_name, args.port, args.readers)
+    return 0
+
+
+def command_backup(db, args):
+    directory = args.dir or load_config().get('backup_directory') or BACKUP_DIRECTORY
+    if args.list or args.verify:
+        snapshots = list_snapshots(db.db_name, directory)
+        if args.verify:
+            snapshots = snapshots[:1] if args.verify == 'latest' else [args.verify]
+            if not snapshots:
+                raise CommandError(f"No snapshots in {directory}")
+        failed = 0
+        for path in snapshots:
+            if args.verify:
+                problems = verify_snapshot(path)
+                failed += bool(problems)
+                print(f"{path}: {'; '.join(problems[:5]) if problems else 'ok'}")
+            else:
+                print(f"{path}  {os.path.getsize(path) / 1048576:.1f} MB")
+        if args.list:
+            for file_name, archived_at in archived_files(db.conn):
+                for path in list_snapshots(file_name, directory):
+                    print(f"{path}  {os.path.getsize(path) / 1048576:.1f} MB (year archive)")
+        return 1 if failed else 0
+
+    keep = args.keep if args.keep is not None else load_config().get('backup_keep', BACKUP_KEEP)
+    try:
+        report = create_snapshot(db.db_name, directory, keep)
+    except BackupError as e:
+        raise CommandError(str(e))
+    print(format_backup_report(report))
+    return 0
+
+
+def command_archive(db, args):
+    if args.restore is not None:
+        try:
+            restored = db.restore_year(args.restore)
+        except ValueError as e:
+            raise CommandError(str(e))
+        print(f"{restored} lines of {args.restore} moved back into {db.db_name}")
+    for year in args.years:
+        try:
+            moved = db.archive_year(year)
+        except ValueError as e:
+            raise CommandError(str(e))
+        print(f"{moved} lines of {year} moved to {os.path.basename(db.archive_path(year))}")
+    if args.list or (args.restore is None and not args.years):
+        for archive in db.get_archived_years():
+            print(f"{archive['year']}  {archive['file_name']}  {archive['line_count']} lines  "
+                  f"archived {archive['archived_at']}")
+    return 0
+
+
+def command_maintain(db, args):
+    try:
+        results = run_maintenance(db.db_name, args.tasks or None, args.budget, args.force)
+    except ValueError as e:
+        raise CommandError(str(e))
+    print(format_maintenance_report(results))
+    return 0
+
+
+def add_filter_options(parser, transactions=True):
+    parser.add_argument('--from', dest='date_from', metavar='DATE', help="first date (YYYY-MM-DD)")
+    parser.add_argument('--to', dest='date_to', metavar='DATE', help="last date (YYYY-MM-DD)")
+    if transactions:
+        parser.add_argument('--account', help="only transactions with a line on this account")
+        parser.add_argument('--description', help="only transactions whose description contains this text")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='python -m cli', description="Batch jobs on the finance database.")
+    parser.add_argument('--db', default='finance.db', help="database file (default: %(default)s)")
+    commands = parser.add_subparsers(dest='command', metavar='command', required=True)
+
+    parser_import = commands.add_parser('import', help="import CSV, OFX/QFX or QIF files as orphan batches")
+    parser_import.add_argument('paths', nargs='+', help="statement files, or directories of CSV files")
+    parser_import.add_argument('--mapping', help="JSON file with the CSV column mapping "
+                                                 "(default: the import wizard's last mapping)")
+    parser_import.add_argument('--account', help="account of every line (default: from the mapping or the file)")
+    parser_import.add_argument('--currency', help="default currency of the lines")
+    parser_import.add_argument('--skip-duplicates', action='store_true',
+                               help="leave out lines already imported or posted instead of flagging them")
+    parser_import.add_argument('--restart', action='store_true',
+                               help="start interrupted statement imports over instead of resuming them")
+    parser_import.add_argument('--workers', type=int, help="CSV parsing processes (default: one per CPU)")
+    parser_import.add_argument('--max-errors', type=int, default=5, help="parse errors listed per file")
+    parser_import.set_defaults(handler=command_import)
+
+    parser_process = commands.add_parser('process-orphans', help="post or group the new lines of orphan batches")
+    mode = parser_process.add_mutually_exclusive_group(required=True)
+    mode.add_argument('--rules', action='store_true', help="post the lines matching the categorization rules")
+    mode.add_argument('--clusters', action='store_true', help="list groups of lines with similar descriptions")
+    parser_process.add_argument('--batch', type=int, help="orphan batch id (default: every batch)")
+    parser_process.add_argument('--dry-run', action='store_true', help="report the rule matches without posting")
+    parser_process.add_argument('--min-size', type=int, default=2, help="smallest cluster listed")
+    parser_process.add_argument('--max-lines', type=int, default=200, help="matched lines listed")
+    parser_process.set_defaults(handler=command_process_orphans)
+
+    parser_export = commands.add_parser('export', help="export the journal to CSV, Excel or PDF")
+    parser_export.add_argument('file', help="output file; the extension (.csv, .xlsx, .pdf) picks the format")
+    add_filter_options(parser_export)
+    parser_export.set_defaults(handler=command_export)
+
+    parser_report = commands.add_parser('report', help="print account balances or orphan batches")
+    parser_report.add_argument('report', choices=['balances', 'batches'])
+    add_filter_options(parser_report)
+    parser_report.add_argument('--status', choices=['new', 'processed', 'ignored'], help="batch status")
+    parser_report.add_argument('--csv', action='store_true', help="write CSV instead of a text table")
+    parser_report.set_defaults(handler=command_report)
+
+    parser_bench = commands.add_parser('bench', help="run the database benchmarks")
+    parser_bench.add_argument('names', nargs='*', help="benchmarks to run (default: all)")
+    parser_bench.set_defaults(handler=command_bench)
+
+    parser_serve = commands.add_parser('serve', help="serve the read-only JSON API on localhost")
+    parser_serve.add_argument('--port', type=int, default=8765, help="port on 127.0.0.1 (default: %(default)s)")
+    parser_serve.add_argument('--readers', type=int, default=4, help="read-only connections (default: %(default)s)")
+    parser_serve.set_defaults(handler=command_serve)
+
+    parser_backup = commands.add_parser('backup', help="write a compressed, verified snapshot of the database")
+    parser_backup.add_argument('--dir', help=f"snapshot directory (default: {BACKUP_DIRECTORY})")
+    parser_backup.add_argument('--keep', type=int, help=f"snapshots kept (default: {BACKUP_KEEP})")
+    parser_backup.add_argument('--list', action='store_true', help="list the snapshots instead, newest first")
+    parser_backup.add_argument('--verify', nargs='?', const='latest', metavar='SNAPSHOT',
+                               help="check a snapshot (default: the newest) with PRAGMA integrity_check")
+    parser_backup.set_defaults(handler=command_backup)
+
+    parser_archive = commands.add_parser('archive', help="move the lines of closed years to per-year files")
+    parser_archive.add_argument('years', nargs='*', type=int, help="years to archive")
+    parser_archive.add_argument('--restore', type=int, metavar='YEAR', help="move an archived year back first")
+    parser_archive.add_argument('--list', action='store_true', help="list the archived years (the default)")
+    parser_archive.set_defaults(handler=command_archive)
+
+    parser_maintain = commands.add_parser('maintain', help="run PRAGMA optimize, ANALYZE and VACUUM where needed")
+    parser_maintain.add_argument('tasks', nargs='*', metavar='task',
+                                 help=f"tasks to run: {', '.join(MAINTENANCE_TASKS)} (default: all)")
+    parser_maintain.add_argument('--budget', type=float, default=MAINTENANCE_BUDGET,
+                                 help="seconds the run may take (default: %(default)s)")
+    parser_maintain.add_argument('--force', action='store_true',
+                                 help="run the tasks even if nothing changed since they last ran")
+    parser_maintain.set_defaults(handler=command_maintain)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    start = time.perf_counter()
+    try:
+        db = open_database(args.db)
+        status = args.handler(db, args)
+    except (CommandError, OSError, ValueError) as e:
+        print(f"{args.command}: {e}", file=sys.stderr)
+        status = 1
+    print(f"{args.command} finished in {time.perf_counter() - start:.2f}s", file=sys.stderr)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
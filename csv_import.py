@@ -0,0 +1,643 @@
+"""
+CSV parsing for bank statement imports, kept free of Qt and of the database so it can
+run in worker processes. import_csv_file() streams one file into an orphan transaction
+batch a chunk at a time, committing a checkpoint with every chunk so an interrupted import
+resumes where it stopped; import_csv_files() parses many files in a process pool and writes
+each one as its own batch from the calling process.
+
+A mapping is a plain dict:
+    'has_header':  True if the first row holds column names
+    'columns':     {field: column} for date, description, amount, debit, credit,
+                   account and currency; column is a header name or "Column N"
+    'date_format': strptime format tried first, or "Auto-detect"
+    'decimal_separator': optional '.' or ','; detected per column when missing
+    'account':     default account name, or None to read accounts from the CSV
+    'currency':    default currency name
+    'duplicates':  'flag' (default) or 'skip' for lines already imported or posted
+    'delimiter':   optional field delimiter, ',' when missing
+"""
+import os
+import re
+import csv
+import json
+import time
+import hashlib
+import datetime
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+# Formats tried when the chosen date format does not match a value
+COMMON_DATE_FORMATS = ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d"]
+
+
+def column_indices(mapping, csv_headers):
+    """Map each field in mapping['columns'] to a column index in the file"""
+    indices = {}
+    for field, mapped_column in mapping['columns'].items():
+        if not mapped_column or mapped_column == "Not mapped":
+            continue
+        try:
+            if mapping.get('has_header') and mapped_column in csv_headers:
+                indices[field] = csv_headers.index(mapped_column)
+            else:
+                # For files without headers, extract column number
+                indices[field] = int(mapped_column.split()[-1]) - 1
+        except (ValueError, IndexError):
+            print(f"Could not map {field} to {mapped_column}")
+    return indices
+
+
+# Rows sampled to detect a column's date format or decimal separator
+DETECTION_SAMPLE_ROWS = 200
+
+# Candidate formats for date detection, most common first
+DATE_FORMAT_CANDIDATES = COMMON_DATE_FORMATS + ["%d-%m-%Y", "%m-%d-%Y", "%d.%m.%Y", "%Y.%m.%d",
+                                                "%d/%m/%y", "%m/%d/%y", "%d %b %Y", "%d-%b-%Y", "%b %d, %Y"]
+
+# One amount: optional sign or opening parenthesis, optional currency text, the digits with any
+# grouping, then an optional currency text, trailing minus (12.50-) and closing parenthesis
+AMOUNT_RE = re.compile(r"""
+    ^\s*(?P<open>\()?\s*(?P<sign>[-+])?\s*
+    [^\d\s().,+-]*\s*
+    (?P<number>\d[\d.,'\s\u00a0\u202f]*?)\s*
+    [^\d\s().,+-]*\s*
+    (?P<trail>-)?\s*(?P<close>\))?\s*$
+""", re.VERBOSE)
+PLAIN_NUMBER_RE = re.compile(r"\d+(\.\d+)?")
+
+# Thousands separators dropped for each decimal separator
+_GROUPING = {
+    '.': str.maketrans('', '', ",' \u00a0\u202f"),
+    ',': str.maketrans({'.': None, "'": None, ' ': None, '\u00a0': None, '\u202f': None, ',': '.'}),
+}
+
+
+def _sample(values):
+    """Up to DETECTION_SAMPLE_ROWS distinct non-empty values"""
+    sample = []
+    seen = set()
+    for value in values:
+        if value and value not in seen:
+            seen.add(value)
+            sample.append(value)
+            if len(sample) >= DETECTION_SAMPLE_ROWS:
+                break
+    return sample
+
+
+def detect_date_format(values, preferred=None):
+    """
+    Pick the strptime format that parses the most sampled values (preferred wins ties),
+    or None if no candidate parses any of them.
+    """
+    sample = _sample(v.strip() for v in values if v)
+    candidates = ([preferred] if preferred else []) + [fmt for fmt in DATE_FORMAT_CANDIDATES if fmt != preferred]
+    best_format, best_count = None, 0
+    for fmt in candidates:
+        count = 0
+        for value in sample:
+            try:
+                datetime.datetime.strptime(value, fmt)
+                count += 1
+            except ValueError:
+                pass
+        if count > best_count:
+            best_format, best_count = fmt, count
+            if count == len(sample):
+                break
+    return best_format
+
+
+def parse_date_column(values, date_format=None, today=None):
+    """
+    Normalise a column of date strings to YYYY-MM-DD. The format is detected once from a
+    sample (date_format is tried first); each distinct value is then parsed only once, since
+    statements repeat the same dates many times. Empty values become today; values no format
+    understands are kept as they are. Returns (dates, unparsed_row_numbers).
+    """
+    today = today or datetime.datetime.now().strftime("%Y-%m-%d")
+    if date_format == "Auto-detect":
+        date_format = None
+    detected = detect_date_format(values, date_format)
+    fallbacks = [fmt for fmt in [date_format] + DATE_FORMAT_CANDIDATES if fmt and fmt != detected]
+
+    parsed = {}
+
+    def parse(value):
+        for fmt in ([detected] if detected else []) + fallbacks:
+            try:
+                return datetime.datetime.strptime(value, fmt).strftime("%Y-%m-%d")
+            except ValueError:
+                continue
+        return None
+
+    dates = []
+    unparsed = []
+    for row, value in enumerate(values):
+        value = (value or '').strip()
+        if not value:
+            dates.append(today)
+            continue
+        if value not in parsed:
+            parsed[value] = parse(value)
+        date = parsed[value]
+        if date is None:
+            unparsed.append(row)
+            date = value
+        dates.append(date)
+    return dates, unparsed
+
+
+def detect_decimal_separator(values):
+    """
+    '.' or ',' depending on which separator the sampled amounts use before their decimals.
+    A separator followed by one or two digits at the end counts as decimal; ties and
+    ambiguous samples (only thousands groups) fall back to '.'.
+    """
+    votes = {'.': 0, ',': 0}
+    for value in _sample(values):
+        match = AMOUNT_RE.match(value)
+        if not match:
+            continue
+        number = match.group('number').rstrip()
+        position = max(number.rfind('.'), number.rfind(','))
+        if position < 0:
+            continue
+        separator = number[position]
+        decimals = len(number) - position - 1
+        if 1 <= decimals <= 2 or (decimals != 3 and number.count(separator) == 1):
+            votes[separator] += 1
+        elif decimals == 3 and ('.' in number[:position] or ',' in number[:position]):
+            # 1.234,567 / 1,234.567: the other separator is the decimal one
+            votes[',' if separator == '.' else '.'] += 1
+    return ',' if votes[','] > votes['.'] else '.'
+
+
+def parse_amount_column(values, decimal_separator=None):
+    """
+    Parse a column of amount strings with one decimal separator (detected from a sample if
+    not given): grouping characters are removed with a single translate, and currency text,
+    parentheses and trailing minus signs are understood. Empty or unreadable values become
+    None. Returns (amounts, unparsed_row_numbers) where unparsed lists non-empty failures.
+    """
+    grouping = _GROUPING[decimal_separator or detect_decimal_separator(values)]
+    match_amount = AMOUNT_RE.match
+    plain_number = PLAIN_NUMBER_RE.fullmatch
+
+    amounts = []
+    unparsed = []
+    for row, value in enumerate(values):
+        if not value or value.isspace():
+            amounts.append(None)
+            continue
+        match = match_amount(value)
+        number = match.group('number').translate(grouping) if match else None
+        if not number or not plain_number(number):
+            amounts.append(None)
+            unparsed.append(row)
+            continue
+        amount = float(number)
+        if match.group('sign') == '-' or match.group('trail') or (match.group('open') and match.group('close')):
+            amount = -amount
+        amounts.append(amount)
+    return amounts, unparsed
+
+
+def parse_csv_rows(data_rows, indices, mapping, today=None, row_offset=0):
+    """
+    Turn raw CSV rows into line dicts (description, date, debit, credit, account_name,
+    currency_code). Parsing is column by column: each column's date format and decimal
+    separator are detected once and applied to the whole column. Rows without any amount
+    are skipped. Returns (lines, errors), errors naming values that could not be read;
+    row_offset is added to the row numbers in errors when data_rows is a later chunk.
+    """
+    today = today or datetime.datetime.now().strftime("%Y-%m-%d")
+    accounts_in_csv = mapping.get('account') is None
+
+    def column(field):
+        index = indices.get(field)
+        if index is None:
+            return [None] * len(data_rows)
+        return [row[index] if index < len(row) else None for row in data_rows]
+
+    errors = []
+
+    def amounts(field):
+        values = column(field)
+        parsed, unparsed = parse_amount_column(values, mapping.get('decimal_separator'))
+        errors.extend(f"Row {row_offset + row + 1}: unreadable {field} '{values[row]}'" for row in unparsed)
+        return parsed
+
+    raw_dates = column('date')
+    dates, unparsed_dates = parse_date_column(raw_dates, mapping.get('date_format'), today)
+    errors.extend(f"Row {row_offset + row + 1}: unreadable date '{raw_dates[row]}'" for row in unparsed_dates)
+
+    descriptions = column('description')
+    debits = amounts('debit')
+    credits = amounts('credit')
+    signed_amounts = amounts('amount')
+    account_names = column('account') if accounts_in_csv else [None] * len(data_rows)
+    currency_codes = column('currency')
+
+    lines = []
+    for description, date, debit, credit, amount, account_name, currency_code in zip(
+            descriptions, dates, debits, credits, signed_amounts, account_names, currency_codes):
+        # Separate debit/credit columns win over a signed amount column
+        if debit is None and credit is None and amount is not None:
+            if amount > 0:
+                debit = amount
+            else:
+                credit = abs(amount)
+
+        # Only skip rows with no amount information at all
+        if debit is None and credit is None:
+            continue
+
+        lines.append({
+            'description': description or '',
+            'date': date,
+            'debit': debit,
+            'credit': credit,
+            'account_name': account_name,
+            'currency_code': (currency_code or '').strip() or None,
+            'error': None,
+        })
+    return lines, errors
+
+
+# Rows the import wizard keeps from the head of a file: enough for detection and previews
+PREVIEW_ROWS = DETECTION_SAMPLE_ROWS
+
+# Characters the dialect is sniffed from, and raw lines shown on the file page
+SNIFF_SAMPLE_CHARS = 1024
+PREVIEW_TEXT_LINES = 10
+
+
+class CsvPreviewSession:
+    """
+    The head of one CSV file for the import wizard. The file is opened once: the dialect is
+    sniffed and the first rows parsed, and every preview, header mapping and format guess is
+    rendered from this cache, so remapping columns costs the same for any file size.
+    """
+
+    def __init__(self, file_path, max_rows=PREVIEW_ROWS):
+        self.file_path = file_path
+        self.max_rows = max_rows
+        self._signature = self._stat(file_path)
+
+        with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+            # Raw lines for the sniffer and the text preview; parsing continues from the same file
+            head = []
+            length = 0
+            for line in csvfile:
+                head.append(line)
+                length += len(line)
+                if length >= SNIFF_SAMPLE_CHARS and len(head) >= PREVIEW_TEXT_LINES:
+                    break
+            sample = ''.join(head)[:SNIFF_SAMPLE_CHARS]
+
+            sniffer = csv.Sniffer()
+            try:
+                self.dialect = sniffer.sniff(sample)
+                # None when the sniffer could not tell
+                self.header_guess = sniffer.has_header(sample)
+            except Exception:
+                self.dialect = csv.excel
+                self.header_guess = None
+
+            self.text_lines = [line.strip() for line in head[:PREVIEW_TEXT_LINES]]
+            self.rows = list(itertools.islice(csv.reader(itertools.chain(head, csvfile), self.dialect),
+                                              max_rows + 1))
+
+    @staticmethod
+    def _stat(file_path):
+        stat = os.stat(file_path)
+        return stat.st_mtime_ns, stat.st_size
+
+    def is_current(self, file_path):
+        """True if this session still describes file_path as it is on disk"""
+        try:
+            return file_path == self.file_path and self._stat(file_path) == self._signature
+        except OSError:
+            return False
+
+    @property
+    def delimiter(self):
+        return self.dialect.delimiter
+
+    def headers(self, has_header):
+        """Column names: the first row, or "Column N" labels when the file has no header"""
+        if not self.rows:
+            return []
+        if has_header:
+            return self.rows[0]
+        return [f"Column {i + 1}" for i in range(len(self.rows[0]))]
+
+    def data_rows(self, has_header):
+        """The cached rows after the header, at most max_rows of them"""
+        return self.rows[1:] if has_header else self.rows[:self.max_rows]
+
+
+def parse_csv_file(file_path, mapping):
+    """
+    Parse one CSV file. Returns a report dict: file, rows, lines, errors and seconds
+    (parse time). Never touches the database, so it is safe to run in a worker process.
+    """
+    start = time.perf_counter()
+    with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
+        all_rows = list(csv.reader(csvfile, delimiter=mapping.get('delimiter') or ','))
+
+    # Split headers and data rows
+    if mapping.get('has_header') and all_rows:
+        csv_headers, data_rows = all_rows[0], all_rows[1:]
+    else:
+        csv_headers, data_rows = [], all_rows
+
+    lines, errors = parse_csv_rows(data_rows, column_indices(mapping, csv_headers), mapping)
+    return {
+        'file': file_path,
+        'rows': len(data_rows),
+        'lines': lines,
+        'errors': errors,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def resolve_lines(database, lines, mapping):
+    """
+    Resolve account and currency names of parsed lines to ids through the reference cache,
+    producing the line dicts insert_orphan_transaction() expects. Lines whose account or
+    currency is unknown are kept but marked invalid.
+    """
+    default_account_id = None
+    if mapping.get('account') is not None:
+        default_account_id = database.refs.account_id(mapping['account'])
+    default_currency_id = database.refs.currency_id(mapping.get('currency'))
+
+    resolved = []
+    for line in lines:
+        account_id = default_account_id
+        account_valid = True
+        if line['account_name'] is not None:
+            account_id = database.refs.account_id(line['account_name'])
+            # Instead of skipping, mark as invalid but keep the row
+            account_valid = account_id is not None
+
+        currency_id = default_currency_id
+        currency_valid = True
+        if line['currency_code']:
+            currency_id = database.refs.currency_id(line['currency_code'])
+            if currency_id is None:
+                # If not found by name, the default will be used
+                currency_id = default_currency_id
+                currency_valid = False
+
+        resolved.append({
+            'description': line['description'],
+            'account_id': account_id,
+            'account_name': line['account_name'],  # Store the original name for reference
+            'debit': line['debit'],
+            'credit': line['credit'],
+            'date': line['date'],
+            'currency_id': currency_id,
+            'valid': (line['error'] is None and account_valid and currency_valid
+                      and (line['debit'] is not None or line['credit'] is not None)),
+        })
+    return resolved
+
+
+def collect_csv_paths(paths):
+    """Expand directories in paths to the .csv files they contain (sorted), keeping files as given"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.lower().endswith('.csv')))
+        else:
+            files.append(path)
+    return files
+
+
+# Data rows parsed and committed together by import_csv_file()
+IMPORT_CHUNK_ROWS = 5000
+
+# import_csv_files() streams files at least this large through import_csv_file() instead of
+# parsing them whole in a worker, so they are written in checkpointed chunks
+CHECKPOINT_MIN_BYTES = 16 * 1024 * 1024
+
+
+def file_sha256(file_path, block_size=1024 * 1024):
+    """SHA-256 of a file's contents, read in blocks; identifies the file across renames"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _rows_from(csvfile, offset, delimiter=','):
+    """
+    Yield (row, end_offset) for the CSV rows of a binary file starting at byte offset, where
+    end_offset is the byte just past the row (quoted fields may span several lines).
+    """
+    csvfile.seek(offset)
+    position = [offset]
+
+    def lines():
+        for line in iter(csvfile.readline, b''):
+            position[0] = csvfile.tell()
+            yield line.decode('utf-8')
+
+    for row in csv.reader(lines(), delimiter=delimiter):
+        yield row, position[0]
+
+
+def fix_formats(mapping, data_rows, indices):
+    """
+    Copy of mapping with the date format and decimal separator detected from data_rows
+    written in, so that every chunk of a file (and a resumed run) parses the same way.
+    """
+    fixed = dict(mapping)
+
+    def values(field):
+        index = indices.get(field)
+        return [] if index is None else [row[index] for row in data_rows if index < len(row)]
+
+    preferred = mapping.get('date_format')
+    preferred = None if preferred == "Auto-detect" else preferred
+    fixed['date_format'] = detect_date_format(values('date'), preferred) or mapping.get('date_format')
+    if not mapping.get('decimal_separator'):
+        fixed['decimal_separator'] = detect_decimal_separator(values('amount') + values('debit') + values('credit'))
+    return fixed
+
+
+def begin_import(database, file_path, resume=True):
+    """
+    Look up the checkpoint of an unfinished import of file_path (by content hash). With
+    resume=False such an import is abandoned, its partial batch removed. Returns
+    (file_hash, checkpoint or None, report) where report is the dict write_import_rows() fills.
+    """
+    file_hash = file_sha256(file_path)
+    checkpoint = database.get_import_checkpoint(file_hash)
+    if checkpoint and not resume:
+        database.finish_import_checkpoint(checkpoint, abandon=True)
+        checkpoint = None
+    report = {'file': file_path, 'rows': 0, 'errors': [], 'duplicates': 0, 'orphan_id': None,
+              'failed': None, 'resumed_from': checkpoint['last_row'] if checkpoint else 0, 'complete': False}
+    return file_hash, checkpoint, report
+
+
+def write_import_rows(database, checkpoint, rows, indices, import_mapping, report, start,
+                      progress=None, total_bytes=0, chunk_rows=IMPORT_CHUNK_ROWS):
+    """
+    Parse (row, end_offset) pairs chunk_rows at a time with parse_csv_rows() and append each
+    chunk to the checkpoint's batch, advancing the checkpoint in the same commit. Stops early
+    if progress(end_offset, total_bytes) returns False. Fills in report and returns it.
+    """
+    # Continue the fingerprint numbering of the rows an earlier run already wrote
+    seen = database.import_fingerprint_counts(checkpoint['orphan_transaction_id']) if checkpoint['last_row'] else {}
+
+    def write(chunk, end_offset):
+        lines, errors = parse_csv_rows(chunk, indices, import_mapping, row_offset=checkpoint['last_row'])
+        report['errors'].extend(errors)
+        resolved = resolve_lines(database, lines, import_mapping)
+        report['duplicates'] += database.mark_duplicate_lines(resolved, seen)
+        if import_mapping.get('duplicates') == 'skip':
+            resolved = [line for line in resolved if not line['duplicate_of']]
+        database.append_orphan_lines(checkpoint, resolved, end_offset, checkpoint['last_row'] + len(chunk))
+        report['rows'] += len(chunk)
+        return progress is None or progress(end_offset, total_bytes) is not False
+
+    chunk = []
+    stopped = False
+    for row, end_offset in rows:
+        chunk.append(row)
+        if len(chunk) >= chunk_rows:
+            if not write(chunk, end_offset):
+                stopped = True
+                break
+            chunk = []
+    else:
+        if chunk:
+            write(chunk, end_offset)
+
+    if stopped:
+        report['orphan_id'] = checkpoint['orphan_transaction_id']
+    else:
+        report['orphan_id'] = database.finish_import_checkpoint(checkpoint)
+        report['complete'] = True
+    report['seconds'] = time.perf_counter() - start
+    report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else 0.0
+    return report
+
+
+def import_csv_file(database, file_path, mapping, reference=None, resume=True, progress=None,
+                    chunk_rows=IMPORT_CHUNK_ROWS):
+    """
+    Stream one CSV file into an orphan transaction batch, chunk_rows data rows at a time.
+    Each chunk's lines and the import checkpoint (file hash, byte offset, last row) are
+    committed together, so after a crash, an error or a cancel, importing the same file
+    again continues from the checkpoint in the same batch. With resume=False an unfinished
+    earlier import of the file is abandoned (its partial batch removed) and started over.
+
+    progress(bytes_done, bytes_total) is called after every chunk; returning False stops the
+    import, leaving it resumable. Returns a report like import_csv_files() yields, plus
+    resumed_from (the data rows already written by an earlier run) and complete.
+    """
+    start = time.perf_counter()
+    file_hash, checkpoint, report = begin_import(database, file_path, resume)
+
+    with open(file_path, 'rb') as csvfile:
+        import_mapping = json.loads(checkpoint['mapping']) if checkpoint else mapping
+        delimiter = import_mapping.get('delimiter') or ','
+        csv_headers, data_start = [], 0
+        if import_mapping.get('has_header'):
+            csv_headers, data_start = next(_rows_from(csvfile, 0, delimiter), ([], 0))
+        indices = column_indices(import_mapping, csv_headers)
+
+        if not checkpoint:
+            # Formats are detected once, from the start of the file, and stored with the checkpoint
+            sample = [row for row, _ in itertools.islice(_rows_from(csvfile, data_start, delimiter),
+                                                         DETECTION_SAMPLE_ROWS)]
+            import_mapping = fix_formats(mapping, sample, indices)
+            checkpoint = database.start_import_checkpoint(
+                file_hash, os.path.abspath(file_path), reference or os.path.basename(file_path),
+                json.dumps(import_mapping), data_start)
+
+        rows = _rows_from(csvfile, checkpoint['byte_offset'], delimiter)
+        return write_import_rows(database, checkpoint, rows, indices, import_mapping, report, start,
+                                 progress, os.path.getsize(file_path), chunk_rows)
+
+
+def import_csv_files(database, paths, mapping, max_workers=None):
+    """
+    Parse the CSV files in paths (files or directories) in a process pool and write each
+    as one orphan transaction batch, referenced by its file name. All writes happen here,
+    in the calling process, as files finish parsing. Files of CHECKPOINT_MIN_BYTES or more
+    are streamed through import_csv_file() instead while the pool works on the rest, so
+    they resume from their checkpoint if the batch is interrupted.
+
+    Yields one report per file as it completes: file, rows, errors, seconds,
+    rows_per_second, duplicates (lines already imported or posted), orphan_id (None if
+    nothing was imported) and failed (an error message if the whole file could not be
+    parsed or written).
+    """
+    files = collect_csv_paths(paths)
+    if not files:
+        return
+    max_workers = max_workers or min(len(files), os.cpu_count() or 1)
+
+    def write(report):
+        lines = report.pop('lines')
+        report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else 0.0
+        report['orphan_id'] = None
+        report['failed'] = None
+        report['duplicates'] = 0
+        if lines:
+            try:
+                resolved = resolve_lines(database, lines, mapping)
+                report['duplicates'] = database.mark_duplicate_lines(resolved)
+                report['orphan_id'] = database.insert_orphan_transaction(
+                    os.path.basename(report['file']), resolved, mapping.get('duplicates', 'flag'))
+            except Exception as e:
+                report['failed'] = f"Could not save: {e}"
+        return report
+
+    def failed(file_path, error):
+        return {'file': file_path, 'rows': 0, 'errors': [], 'seconds': 0.0, 'rows_per_second': 0.0,
+                'duplicates': 0, 'orphan_id': None, 'failed': str(error)}
+
+    def stream(file_path):
+        try:
+            return import_csv_file(database, file_path, mapping)
+        except Exception as e:
+            return failed(file_path, e)
+
+    large = [file_path for file_path in files
+             if os.path.isfile(file_path) and os.path.getsize(file_path) >= CHECKPOINT_MIN_BYTES]
+    files = [file_path for file_path in files if file_path not in large]
+
+    # A pool is only worth starting for more than one file
+    if max_workers == 1:
+        for file_path in large:
+            yield stream(file_path)
+        for file_path in files:
+            try:
+                report = parse_csv_file(file_path, mapping)
+            except Exception as e:
+                yield failed(file_path, e)
+                continue
+            yield write(report)
+        return
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(parse_csv_file, file_path, mapping): file_path for file_path in files}
+        for file_path in large:
+            yield stream(file_path)
+        for future in as_completed(futures):
+            try:
+                report = future.result()
+            except Exception as e:
+                yield failed(futures[future], e)
+                continue
+            yield write(report)
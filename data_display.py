@@ -4,6 +4,7 @@ from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon
 from PyQt5.QtCore import Qt
 from column_headers import column_headers
 from custom_queries import custom_queries
+from gui.column_sizing import fit_columns
 
 def display_data(table_name, content_frame, toolbar):
 
@@ -97,7 +98,7 @@ def display_data(table_name, content_frame, toolbar):
         header = data_table.horizontalHeader()
         for col in range(len(column_names)):
             header.setSectionResizeMode(col, QHeaderView.Interactive)  # Enable manual resizing
-            header.resizeSection(col, max(data_table.sizeHintForColumn(col), header.sectionSizeHint(col)))
+        fit_columns(data_table, f"table:{table_name}")
 
         # Adjust the last column to take up any extra space
         header.setSectionResizeMode(len(column_names) - 1, QHeaderView.Stretch)
@@ -1,11 +1,505 @@
+import os
+import re
+import sys
 import sqlite3
+import atexit
+import hashlib
 import datetime
+import functools
+import threading
+from urllib.request import pathname2url
+from filter_profiles import FilterProfiles, compile_criteria, encode_value, decode_value
+
+# Index set for transaction_lines, one entry per access pattern. Each index carries the
+# columns its queries read so lookups are answered from the index without touching the table.
+# Numbers behind this choice: python benchmarks.py transaction_line_indexes
+TRANSACTION_LINE_INDEXES = {
+    # Journal and transaction detail: lines of a transaction, summary CTE (date, debit, account)
+    'idx_transaction_lines_transaction_cover':
+        'ON transaction_lines (transaction_id, date, debit, credit, account_id, classification_id)',
+    # Statements, balances and account filters: account + date range
+    'idx_transaction_lines_account_date':
+        'ON transaction_lines (account_id, date, debit, credit, transaction_id)',
+    # Date range filters in the journal without an account
+    'idx_transaction_lines_date_cover':
+        'ON transaction_lines (date, transaction_id, debit)',
+    # Classification reports; most lines are unclassified so only index the ones that are
+    'idx_transaction_lines_classification':
+        'ON transaction_lines (classification_id, date, debit, credit) WHERE classification_id IS NOT NULL',
+    # Counterpart suggestions match imported amounts against posted credit lines
+    'idx_transaction_lines_credit_amount':
+        'ON transaction_lines (credit, transaction_id) WHERE credit > 0',
+}
+
+# Older indexes that are prefixes of (or replaced by) the set above
+REDUNDANT_TRANSACTION_LINE_INDEXES = (
+    'idx_transaction_lines_account_id',
+    'idx_transaction_lines_transaction_id',
+    'idx_transaction_lines_classification_id',
+    'idx_transaction_lines_date',
+    'idx_transaction_lines_transaction_date',
+)
+
+
+# Columns added to orphan_transaction_lines after its first release, created on startup when missing
+ORPHAN_LINE_COLUMNS = {
+    'notes': 'TEXT',
+    'date': 'TEXT',
+    # Normalised (date, amount, description, account) hash and occurrence, see line_fingerprint()
+    'fingerprint': 'TEXT',
+}
+
+# Indexes of the orphan staging tables, matched to the queries that read them
+ORPHAN_INDEXES = {
+    # Lines of a batch in id order (lines view, checkpoints); the per-status batch summary
+    'idx_orphan_lines_batch_status':
+        'ON orphan_transaction_lines (orphan_transaction_id, status)',
+    # Unprocessed lines of every batch in id order (rules and clustering without a batch); the
+    # index holds only new lines. Queries must say status = 'new' literally for SQLite to use it
+    'idx_orphan_lines_new':
+        "ON orphan_transaction_lines (id) WHERE status = 'new'",
+    # Duplicate detection on import
+    'idx_orphan_lines_fingerprint':
+        'ON orphan_transaction_lines (fingerprint)',
+    # Which lines a transaction consumed; most lines are never posted so only index the ones that are
+    'idx_orphan_lines_transaction':
+        'ON orphan_transaction_lines (transaction_id) WHERE transaction_id IS NOT NULL',
+    # Batch list, newest first
+    'idx_orphan_transactions_import_date':
+        'ON orphan_transactions (import_date)',
+}
+
+# Columns of transaction_lines, in the order the year archives store them
+TRANSACTION_LINE_COLUMNS = ('id', 'transaction_id', 'account_id', 'debit', 'credit', 'date', 'classification_id')
+
+# Closed years can be moved to <database name>_<year>.db files, attached as archive_<year> when a
+# query's date range reaches them. SQLite attaches at most 10 databases to one connection.
+ARCHIVE_SCHEMA = 'archive_{year}'
+MAX_ATTACHED_ARCHIVES = 10
+
+# Fingerprints are looked up in chunks to stay under SQLite's bound-parameter limit
+FINGERPRINT_CHUNK_SIZE = 500
+
+# In-memory working copy (Database.use_memory_copy): seconds between flushes of the written
+# rows to the file, the attached journal logging those rows, and how many rows are read per
+# query. Journals are kept on the local disk, outside the database's (possibly synced) folder
+WRITE_BEHIND_INTERVAL = 1.0
+WRITE_BEHIND_SCHEMA = 'write_behind'
+WRITE_BEHIND_TABLE = 'write_behind_rows'
+WRITE_BEHIND_DIRECTORY = os.path.join(os.environ.get('LOCALAPPDATA') or os.environ.get('XDG_STATE_HOME')
+                                      or os.path.join(os.path.expanduser('~'), '.local', 'state'), 'myPFC')
+WRITE_BEHIND_VFS = 'win32' if sys.platform == 'win32' else 'unix'
+WRITE_BEHIND_CHUNK_SIZE = 500
+
+
+# Editable columns of categorization_rules, in table order
+RULE_FIELDS = ('name', 'priority', 'match_type', 'pattern', 'direction', 'min_amount', 'max_amount',
+               'source_account_id', 'counterpart_account_id', 'classification_id', 'enabled')
+
+
+def normalize_description(description):
+    """Lower-case a description and reduce punctuation and runs of whitespace to single spaces"""
+    return re.sub(r'[^0-9a-z]+', ' ', (description or '').casefold()).strip()
+
+
+def line_fingerprint(date, debit, credit, description, account, occurrence=0):
+    """
+    Fingerprint of one statement line: date, signed amount in cents, normalised description
+    and account (id, or the raw name if unresolved), hashed, followed by ':occurrence'.
+    occurrence numbers identical lines within one set, so two equal purchases on the same
+    day keep distinct fingerprints; the hash part alone identifies the line's content.
+    """
+    amount_cents = round(((debit or 0) - (credit or 0)) * 100)
+    account_key = '' if account is None else str(account).casefold()
+    key = f"{date or ''}|{amount_cents}|{normalize_description(description)}|{account_key}"
+    return f"{hashlib.blake2b(key.encode('utf-8'), digest_size=12).hexdigest()}:{occurrence}"
+
+
+def assign_fingerprints(lines, seen=None):
+    """
+    Fingerprints for line dicts (date, debit, credit, description, account_id or account_name),
+    numbering repeats of the same line in order of appearance. seen ({content hash: next
+    occurrence}) carries the numbering across calls, for imports written in chunks.
+    """
+    seen = {} if seen is None else seen
+    fingerprints = []
+    for line in lines:
+        account = line.get('account_id')
+        if account is None:
+            account = line.get('account_name')
+        content = line_fingerprint(line.get('date'), line.get('debit'), line.get('credit'),
+                                   line.get('description'), account).rsplit(':', 1)[0]
+        occurrence = seen.get(content, 0)
+        seen[content] = occurrence + 1
+        fingerprints.append(f"{content}:{occurrence}")
+    return fingerprints
+
+
+def writes_tables(*tables):
+    """
+    Mark a Database method as writing to tables. When it returns their versions are bumped,
+    so caches keyed on them refresh, and then the changes it announced with notify_change()
+    go to the change listeners (at commit_transaction() inside begin_transaction()).
+    """
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            # Calls made from another decorated method leave the dispatch to the outermost one
+            outer = self._call_changes is None
+            if outer:
+                self._call_changes = []
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                self.bump_version(*tables)
+                if outer:
+                    changes, self._call_changes = self._call_changes, None
+                    if changes:
+                        self._dispatch_changes(changes)
+        return wrapper
+    return decorator
+
+
+def write_behind_journal_path(db_name):
+    """Journal of db_name's in-memory working copy, named after the file's full path"""
+    path = os.path.abspath(db_name)
+    key = hashlib.blake2b(path.encode('utf-8'), digest_size=8).hexdigest()
+    return os.path.join(WRITE_BEHIND_DIRECTORY, f"{os.path.splitext(os.path.basename(path))[0]}-{key}.journal.db")
+
+
+class WriteBehind:
+    """
+    Carries the writes made to an in-memory working copy over to its database file.
+
+    Temp triggers on the working copy's connection log the table and rowid of every row
+    inserted, updated or deleted (REPLACE deletes included, through recursive_triggers),
+    and keep a copy of each logged row as it now stands. Log and copies are tables of a
+    journal file on the local disk, attached to the working copy's connection, so the
+    working copy's own schema stays as loaded and every commit of the application reaches
+    the journal (synchronous = FULL) in the same transaction. A background thread takes
+    what has been logged every interval seconds and writes those rows (or deletes them) on
+    the file in one transaction.
+
+    Only committed writes are flushed, and flushing never waits for the application's
+    open transaction: the background thread tries again next interval, and rows already
+    written are remembered and cleared from the journal once it is free. A crash leaves
+    the journal behind; replay() writes it to the file before the next working copy is
+    loaded, so the file catches up to the last commit.
+    """
+
+    def __init__(self, db_name, journal_path, conn, interval=WRITE_BEHIND_INTERVAL):
+        self.interval = interval
+        self.journal_path = journal_path
+        self._conn = conn
+        self._columns = {}
+        for (table,) in conn.execute("SELECT name FROM main.sqlite_master WHERE type = 'table' "
+                                     "AND name NOT LIKE 'sqlite_%'"):
+            self._columns[table] = [row[1] for row in conn.execute(f'PRAGMA main.table_info("{table}")')]
+
+        os.makedirs(os.path.dirname(os.path.abspath(journal_path)), exist_ok=True)
+        # Without it the rows INSERT OR REPLACE deletes fire no delete trigger and stay on the file
+        conn.execute("PRAGMA recursive_triggers = ON")
+        # Named, as an attached database otherwise takes the working copy's memdb VFS
+        journal_uri = f"file:{pathname2url(os.path.abspath(journal_path))}?vfs={WRITE_BEHIND_VFS}"
+        conn.execute(f"ATTACH DATABASE ? AS {WRITE_BEHIND_SCHEMA}", (journal_uri,))
+        conn.execute(f"PRAGMA {WRITE_BEHIND_SCHEMA}.synchronous = FULL")
+        # AUTOINCREMENT keeps ids growing after the log is cleared, as flush() relies on
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {WRITE_BEHIND_SCHEMA}.{WRITE_BEHIND_TABLE} "
+                     f"(id INTEGER PRIMARY KEY AUTOINCREMENT, table_name TEXT NOT NULL, row_id INTEGER NOT NULL)")
+        # Trigger bodies cannot qualify table names; log and copies are found in the journal
+        for table, columns in self._columns.items():
+            copies = self._copies(table)
+            names = ", ".join(f'"{column}"' for column in columns)
+            conn.execute(f'CREATE TABLE IF NOT EXISTS {WRITE_BEHIND_SCHEMA}."{copies}" '
+                         f'(copy_rowid INTEGER PRIMARY KEY, {names})')
+            logged = f"INSERT INTO {WRITE_BEHIND_TABLE} (table_name, row_id) VALUES ('{table}', {{}}.rowid);"
+            dropped = f'DELETE FROM "{copies}" WHERE copy_rowid = {{}}.rowid;'
+            values = ", ".join(f'NEW."{column}"' for column in columns)
+            copied = f'INSERT INTO "{copies}" (copy_rowid, {names}) VALUES (NEW.rowid, {values});'
+            # The copy is dropped before it is written, so the outer statement's conflict policy
+            # (which overrides the trigger's) never meets an old copy
+            for event, body in (('insert', logged.format('NEW') + dropped.format('NEW') + copied),
+                                ('delete', logged.format('OLD') + dropped.format('OLD')),
+                                ('update', logged.format('OLD') + dropped.format('OLD')
+                                 + logged.format('NEW') + dropped.format('NEW') + copied)):
+                conn.execute(f"""
+                    CREATE TEMP TRIGGER IF NOT EXISTS "write_behind_{table}_{event}"
+                    AFTER {event.upper()} ON main."{table}"
+                    BEGIN
+                        {body}
+                    END
+                """)
+        conn.commit()
+
+        # Never waits: the journal cannot be read while the application commits to it
+        self._journal = sqlite3.connect(journal_path, timeout=0, isolation_level=None, check_same_thread=False)
+        self._disk = sqlite3.connect(db_name, isolation_level=None, check_same_thread=False)
+        self._disk.execute("PRAGMA synchronous = FULL")
+        self._flushed = 0
+        self._cleared = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='write-behind', daemon=True)
+        self._thread.start()
+
+    @staticmethod
+    def _copies(table):
+        """Journal table holding the logged rows of table"""
+        return f"{WRITE_BEHIND_TABLE}_{table}"
+
+    @classmethod
+    def replay(cls, db_name, journal_path):
+        """
+        Write the rows left in the journal at journal_path by a process that ended before
+        flushing them to db_name, then remove the journal. Returns how many rows were
+        written or deleted (0 without a journal).
+        """
+        if not os.path.exists(journal_path):
+            return 0
+        journal = sqlite3.connect(journal_path, isolation_level=None)
+        disk = sqlite3.connect(db_name, isolation_level=None)
+        try:
+            disk.execute("PRAGMA synchronous = FULL")
+            columns = {}
+            if journal.execute("SELECT 1 FROM sqlite_master WHERE name = ?", (WRITE_BEHIND_TABLE,)).fetchone():
+                for (table,) in journal.execute(f"SELECT DISTINCT table_name FROM {WRITE_BEHIND_TABLE}").fetchall():
+                    columns[table] = [row[1] for row in journal.execute(f'PRAGMA table_info("{cls._copies(table)}")')][1:]
+            written = cls._write(journal, disk, columns, 0)[1] if columns else 0
+        finally:
+            journal.close()
+            disk.close()
+        os.remove(journal_path)
+        return written
+
+    @classmethod
+    def _write(cls, journal, disk, columns, flushed):
+        """
+        Write the rows logged in journal after id flushed to disk in one transaction.
+        Returns the last id written and how many rows were written or deleted.
+        """
+        # One read transaction, so the rows are taken as of a single commit of the application
+        journal.execute("BEGIN")
+        try:
+            last = journal.execute(f"SELECT MAX(id) FROM {WRITE_BEHIND_TABLE}").fetchone()[0]
+            if last is None or last <= flushed:
+                return flushed, 0
+            changed = {}
+            for table, row_id in journal.execute(
+                    f"SELECT DISTINCT table_name, row_id FROM {WRITE_BEHIND_TABLE} WHERE id > ? AND id <= ?",
+                    (flushed, last)):
+                changed.setdefault(table, []).append(row_id)
+            rows = {}
+            for table, row_ids in changed.items():
+                names = ", ".join(f'"{column}"' for column in columns[table])
+                rows[table] = []
+                for start in range(0, len(row_ids), WRITE_BEHIND_CHUNK_SIZE):
+                    chunk = row_ids[start:start + WRITE_BEHIND_CHUNK_SIZE]
+                    rows[table] += journal.execute(
+                        f'SELECT copy_rowid, {names} FROM "{cls._copies(table)}" '
+                        f'WHERE copy_rowid IN ({", ".join("?" * len(chunk))})', chunk).fetchall()
+        finally:
+            journal.execute("COMMIT")
+
+        # Every logged row is deleted and its current version re-inserted, all deletes first,
+        # so rows swapping unique values never collide halfway
+        disk.execute("BEGIN IMMEDIATE")
+        try:
+            for table, row_ids in changed.items():
+                disk.executemany(f'DELETE FROM "{table}" WHERE rowid = ?', [(row_id,) for row_id in row_ids])
+            for table, table_rows in rows.items():
+                names = ", ".join(f'"{column}"' for column in columns[table])
+                marks = ", ".join("?" * (len(columns[table]) + 1))
+                disk.executemany(f'INSERT INTO "{table}" (rowid, {names}) VALUES ({marks})', table_rows)
+            disk.execute("COMMIT")
+        except Exception:
+            disk.execute("ROLLBACK")
+            raise
+        return last, sum(len(row_ids) for row_ids in changed.values())
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            except sqlite3.OperationalError as e:
+                # Locked: the application is committing to the journal, so try again next time.
+                # Otherwise nothing is marked written, and the next flush writes these rows again
+                if 'locked' not in str(e):
+                    print(f"Write-behind flush failed: {e}", file=sys.stderr)
+            except sqlite3.Error as e:
+                print(f"Write-behind flush failed: {e}", file=sys.stderr)
+
+    def flush(self):
+        """Write the rows logged so far to the file; returns how many were written or deleted"""
+        with self._lock:
+            self._flushed, written = self._write(self._journal, self._disk, self._columns, self._flushed)
+            if self._cleared < self._flushed:
+                self._clear_log()
+            return written
+
+    def _clear_log(self):
+        """Drop the written rows from the journal unless the application is committing to it"""
+        try:
+            self._journal.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            # Locked: they are skipped by id until a later flush clears them
+            return
+        try:
+            self._journal.execute(f"DELETE FROM {WRITE_BEHIND_TABLE} WHERE id <= ?", (self._flushed,))
+            for table in self._columns:
+                self._journal.execute(f'DELETE FROM "{self._copies(table)}" WHERE copy_rowid NOT IN '
+                                      f'(SELECT row_id FROM {WRITE_BEHIND_TABLE} WHERE table_name = ?)', (table,))
+            self._journal.execute("COMMIT")
+            self._cleared = self._flushed
+        except sqlite3.Error:
+            self._journal.execute("ROLLBACK")
+
+    def close(self):
+        """
+        Stop the background thread and flush whatever is still logged. The journal is
+        removed once everything is on the file, and otherwise kept for replay().
+        """
+        self._stop.set()
+        self._thread.join()
+        try:
+            self.flush()
+        finally:
+            self._conn.execute(f"DETACH DATABASE {WRITE_BEHIND_SCHEMA}")
+            self._journal.close()
+            self._disk.close()
+        os.remove(self.journal_path)
+
+
+class ReferenceCache:
+    """
+    Accounts, currencies, categories and classifications shared by every view and dialog.
+
+    Each list is built on first use and kept until one of the tables it reads is written
+    through a Database insert_/update_/delete_ method, which bumps that table's version.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._entries = {}
+
+    def _get(self, key, tables, loader):
+        """Return the cached value for key, rebuilding it if any of tables changed since"""
+        version = self.database.data_version(*tables)
+        entry = self._entries.get(key)
+        if entry is None or entry[0] != version:
+            entry = (version, loader())
+            self._entries[key] = entry
+        return entry[1]
+
+    def clear(self):
+        """Forget everything (e.g. after the database file was swapped underneath)"""
+        self._entries.clear()
+
+    # Accounts
+    def accounts(self):
+        """Rows of db.get_all_accounts(): (id, name, category, currency, nature, term)"""
+        return self._get('accounts', ('accounts', 'cat', 'currency'), self.database.get_all_accounts)
+
+    def account_names(self):
+        return self._get('account_names', ('accounts', 'cat', 'currency'),
+                         lambda: [account[1] for account in self.accounts()])
+
+    def accounts_by_nature(self, nature=None):
+        """Rows of db.get_accounts_by_nature(nature): (id, name)"""
+        return self._get(('accounts_by_nature', nature), ('accounts',),
+                         lambda: self.database.get_accounts_by_nature(nature))
+
+    def account_name(self, account_id, default="Unknown"):
+        names = self._get('account_name_map', ('accounts', 'cat', 'currency'),
+                          lambda: {account[0]: account[1] for account in self.accounts()})
+        return names.get(account_id, default)
+
+    def account_id(self, name):
+        ids = self._get('account_id_map', ('accounts', 'cat', 'currency'),
+                        lambda: {account[1]: account[0] for account in self.accounts()})
+        return ids.get(name)
+
+    def account_currency_id(self, account_id):
+        """Default currency id of an account, or None if it has none"""
+        currencies = self._get('account_currency_map', ('accounts',),
+                               lambda: dict(self.database.execute_query(
+                                   "SELECT id, default_currency_id FROM accounts")))
+        return currencies.get(account_id)
+
+    # Currencies
+    def currencies(self):
+        """Rows of db.get_all_currencies(): (id, name, exchange_rate)"""
+        return self._get('currencies', ('currency',), self.database.get_all_currencies)
+
+    def currency_names(self):
+        return self._get('currency_names', ('currency',), lambda: [currency[1] for currency in self.currencies()])
+
+    def currency_name(self, currency_id, default="Unknown"):
+        names = self._get('currency_name_map', ('currency',),
+                          lambda: {currency[0]: currency[1] for currency in self.currencies()})
+        return names.get(currency_id, default)
+
+    def currency_id(self, name):
+        ids = self._get('currency_id_map', ('currency',),
+                        lambda: {currency[1]: currency[0] for currency in self.currencies()})
+        return ids.get(name)
+
+    # Categories
+    def categories(self):
+        """Rows of db.get_all_categories(): (id, name)"""
+        return self._get('categories', ('cat',), self.database.get_all_categories)
+
+    def category_names(self):
+        return self._get('category_names', ('cat',), lambda: [category[1] for category in self.categories()])
+
+    # Classifications
+    def classifications(self):
+        """Rows of db.get_all_classifications(): (id, name)"""
+        return self._get('classifications', ('classifications',), self.database.get_all_classifications)
+
+    def classification_name(self, classification_id, default=""):
+        if classification_id is None:
+            return default
+        names = self._get('classification_name_map', ('classifications',),
+                          lambda: {item[0]: item[1] for item in self.classifications()})
+        return names.get(classification_id, default)
+
+    def classification_id(self, name):
+        ids = self._get('classification_id_map', ('classifications',),
+                        lambda: {item[1]: item[0] for item in self.classifications()})
+        return ids.get(name)
+
 
 class Database:
-    def __init__(self, db_name):
-        self.conn = sqlite3.connect(db_name, isolation_level="DEFERRED")
+    def __init__(self, db_name, read_only=False):
+        """
+        Open db_name and bring its schema up to date. With read_only the connection is
+        read-only, may be used from another thread and skips the schema setup, so the read
+        methods can run on a worker thread next to the application's own connection.
+        """
+        self.db_name = db_name
+        self.read_only = read_only
+        # Set by use_memory_copy()
+        self.memory_uri = None
+        self.write_behind = None
+        # {schema name: file} of the year archives attached to the main connection
+        self.archive_files = {}
+        if read_only:
+            self.conn = self.open_reader()
+        else:
+            self.conn = sqlite3.connect(db_name, isolation_level="DEFERRED")
         self.cursor = self.conn.cursor()
-        self.create_tables()
+        # Per-table write counters, bumped by methods decorated with @writes_tables
+        self._versions = {}
+        self.refs = ReferenceCache(self)
+        # Compiled saved filter profiles and their result counts
+        self.filter_profiles = FilterProfiles(self)
+        # Change notifications for views; held back while inside begin_transaction()
+        self._change_listeners = []
+        self._pending_changes = None
+        # Changes announced by the @writes_tables method running now, sent when it returns
+        self._call_changes = None
+        if not read_only:
+            self.create_tables()
 
     def create_tables(self):
         self.cursor.execute('''
@@ -137,18 +631,87 @@ class Database:
                             ''')
 
 
+        # One row per CSV import written in chunks, so an interrupted import resumes where it stopped
+        self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS import_checkpoints (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    file_hash TEXT NOT NULL,  -- SHA-256 of the file contents
+                    file_path TEXT,
+                    orphan_transaction_id INTEGER,
+                    mapping TEXT,  -- JSON mapping with the detected formats fixed for every chunk
+                    byte_offset INTEGER NOT NULL DEFAULT 0,  -- Where the next unwritten row starts
+                    last_row INTEGER NOT NULL DEFAULT 0,  -- Data rows written so far
+                    status TEXT CHECK (status IN ('running', 'done', 'abandoned')) DEFAULT 'running',
+                    updated_at TEXT,
+                    FOREIGN KEY (orphan_transaction_id) REFERENCES orphan_transactions(id) ON DELETE SET NULL
+                )
+            ''')
+
+        # Rules that post matching orphan lines against a counterpart account (see categorization.py)
+        self.cursor.execute('''
+                CREATE TABLE IF NOT EXISTS categorization_rules (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    priority INTEGER NOT NULL DEFAULT 100,  -- Lower runs first
+                    match_type TEXT CHECK (match_type IN ('tokens', 'regex')) DEFAULT 'tokens',
+                    pattern TEXT NOT NULL,
+                    direction TEXT CHECK (direction IN ('any', 'debit', 'credit')) DEFAULT 'any',
+                    min_amount REAL,
+                    max_amount REAL,
+                    source_account_id INTEGER,  -- NULL matches lines of any account
+                    counterpart_account_id INTEGER NOT NULL,
+                    classification_id INTEGER,  -- Set on the counterpart line
+                    enabled BOOLEAN DEFAULT 1,
+                    FOREIGN KEY (source_account_id) REFERENCES accounts(id) ON DELETE CASCADE,
+                    FOREIGN KEY (counterpart_account_id) REFERENCES accounts(id) ON DELETE CASCADE,
+                    FOREIGN KEY (classification_id) REFERENCES classifications(id) ON DELETE SET NULL
+                )
+            ''')
+
+        # Years moved to archive files, and the transactions whose lines went with them
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archived_years (
+                year INTEGER PRIMARY KEY,
+                file_name TEXT NOT NULL,
+                line_count INTEGER NOT NULL,
+                archived_at TEXT NOT NULL
+            )
+        ''')
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS archived_transactions (
+                transaction_id INTEGER PRIMARY KEY,
+                year INTEGER NOT NULL
+            )
+        ''')
+
+        # When each maintenance task (ANALYZE, VACUUM, ...) last ran, and the row counts it saw
+        self.cursor.execute('''
+            CREATE TABLE IF NOT EXISTS maintenance_runs (
+                task TEXT PRIMARY KEY,
+                last_run TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                change_mark TEXT NOT NULL
+            )
+        ''')
+
+        # Add orphan line columns introduced after the table was first created
+        existing_columns = {row[1] for row in self.cursor.execute("PRAGMA table_info(orphan_transaction_lines)")}
+        for column, column_type in ORPHAN_LINE_COLUMNS.items():
+            if column not in existing_columns:
+                self.cursor.execute(f"ALTER TABLE orphan_transaction_lines ADD COLUMN {column} {column_type}")
+
         # Create indexes
         self.cursor.execute('''CREATE INDEX IF NOT EXISTS idx_ccards_account_id ON ccards (account_id)''')
-        self.cursor.execute(
-            '''CREATE INDEX IF NOT EXISTS idx_transaction_lines_account_id ON transaction_lines (account_id)''')
-        self.cursor.execute(
-            '''CREATE INDEX IF NOT EXISTS idx_transaction_lines_transaction_id ON transaction_lines (transaction_id)''')
-        self.cursor.execute('''CREATE INDEX IF NOT EXISTS idx_transaction_lines_classification_id 
-                               ON transaction_lines (classification_id)''')
-        # Add these indexes
-        self.cursor.execute('''CREATE INDEX IF NOT EXISTS idx_transaction_lines_date ON transaction_lines (date)''')
-        self.cursor.execute('''CREATE INDEX IF NOT EXISTS idx_transaction_lines_transaction_date 
-                               ON transaction_lines (transaction_id, date)''')
+        self.cursor.execute('''CREATE INDEX IF NOT EXISTS idx_import_checkpoints_file
+                               ON import_checkpoints (file_hash, status)''')
+
+        # transaction_lines: drop the single-column indexes superseded by the covering set below
+        for index_name in REDUNDANT_TRANSACTION_LINE_INDEXES:
+            self.cursor.execute(f"DROP INDEX IF EXISTS {index_name}")
+        for index_name, definition in TRANSACTION_LINE_INDEXES.items():
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} {definition}")
+        for index_name, definition in ORPHAN_INDEXES.items():
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {index_name} {definition}")
 
         # Create triggers
         self.cursor.execute('''CREATE TRIGGER IF NOT EXISTS ensure_debit_credit_positive
@@ -173,36 +736,163 @@ class Database:
 
         self.conn.commit()
 
+    def open_reader(self):
+        """
+        Open a separate read-only connection to the same file, for long reads (exports)
+        running on another thread. It sees committed data only; the caller closes it.
+        """
+        if getattr(self, 'memory_uri', None):
+            conn = sqlite3.connect(self.memory_uri + "&mode=ro", uri=True, check_same_thread=False)
+        else:
+            path = os.path.abspath(self.db_name)
+            conn = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro", uri=True, check_same_thread=False)
+        # A reader sees the same year archives as the connection it was opened from. They are
+        # taken from attach_archives()'s record, as readers may be opened on other threads
+        for name, archive_path in self.archive_files.items():
+            conn.execute(f"ATTACH DATABASE ? AS {name}", (f"file:{pathname2url(archive_path)}?mode=ro",))
+        return conn
+
     def close_connection(self):
+        if self.write_behind is not None:
+            # Uncommitted changes are discarded, as closing a connection to the file does
+            if self.conn.in_transaction:
+                self.conn.rollback()
+            write_behind, self.write_behind = self.write_behind, None
+            try:
+                write_behind.close()
+            finally:
+                self.conn.close()
+            return
+        self.conn.close()
+
+    def use_memory_copy(self, interval=WRITE_BEHIND_INTERVAL, journal_path=None):
+        """
+        Load the file into an in-memory working copy with the backup API and switch this
+        Database to it, for disks where every read and commit is slow (network or synced
+        folders). Reads and writes then stay in memory, and open_reader() connections read
+        the working copy; a WriteBehind journals each commit to journal_path (by default
+        write_behind_journal_path(db_name)) and writes the changes to the file every
+        interval seconds. flush() writes them at once, and close_connection() or the end of
+        the process writes what is left. A journal left by a crash is written to the file first.
+        """
+        if self.read_only or self.write_behind is not None:
+            return
+        self.conn.commit()
+        journal_path = journal_path or write_behind_journal_path(self.db_name)
+        if WriteBehind.replay(self.db_name, journal_path):
+            self.refs.clear()
+            self.filter_profiles.clear()
+        self.memory_uri = f"file:/{pathname2url(os.path.basename(self.db_name))}-{id(self)}?vfs=memdb"
+        memory = sqlite3.connect(self.memory_uri, uri=True, isolation_level="DEFERRED", check_same_thread=False)
+        self.conn.backup(memory)
         self.conn.close()
+        self.conn = memory
+        self.cursor = self.conn.cursor()
+        self.write_behind = WriteBehind(self.db_name, journal_path, self.conn, interval)
+        atexit.register(self.close_connection)
+
+    def flush(self):
+        """
+        Write the working copy's committed changes to the file now (nothing to do without
+        one). Raises sqlite3.OperationalError while this connection has a write transaction
+        open, since its changes reach the journal only once they are committed.
+        """
+        if self.write_behind is None:
+            return
+        if self.conn.in_transaction:
+            raise sqlite3.OperationalError("The working copy has uncommitted changes; "
+                                           "commit or roll back before writing it to the file")
+        self.write_behind.flush()
+
+    def bump_version(self, *tables):
+        """Record a write to tables"""
+        for table in tables:
+            self._versions[table] = self._versions.get(table, 0) + 1
+
+    def data_version(self, *tables):
+        """Current write counters of tables; changes whenever any of them is written"""
+        return tuple(self._versions.get(table, 0) for table in tables)
+
+    def add_change_listener(self, listener):
+        """
+        Register listener(changes) to be called after writes.
 
+        changes is a list of (table, operation, row_id, parent_id) tuples, where operation is
+        'insert', 'update' or 'delete' and parent_id is the owning row (e.g. the transaction of a
+        transaction line). row_id is None when the write touched rows not known individually.
+        Writes inside begin_transaction() are delivered together at commit_transaction().
+        """
+        self._change_listeners.append(listener)
+
+    def remove_change_listener(self, listener):
+        """Unregister a listener added with add_change_listener"""
+        if listener in self._change_listeners:
+            self._change_listeners.remove(listener)
+
+    def notify_change(self, table, operation, row_id=None, parent_id=None):
+        """
+        Announce a write to the change listeners. Called from @writes_tables methods, which
+        send the changes once the tables' versions are bumped, so listeners reading db.refs
+        see the new data.
+        """
+        change = (table, operation, row_id, parent_id)
+        if self._pending_changes is not None:
+            self._pending_changes.append(change)
+        elif self._call_changes is not None:
+            self._call_changes.append(change)
+        else:
+            self._dispatch_changes([change])
+
+    def _dispatch_changes(self, changes):
+        for listener in list(self._change_listeners):
+            try:
+                listener(changes)
+            except Exception as e:
+                # A broken view must not turn a committed write into an error
+                print(f"Change listener failed: {e}")
+
+    @writes_tables('cat')
     def insert_category(self, name):
         self.cursor.execute("INSERT INTO cat (name) VALUES (?)", (name,))
         self.conn.commit()
-        return self.cursor.lastrowid
+        row_id = self.cursor.lastrowid
+        self.notify_change('cat', 'insert', row_id)
+        return row_id
 
+    @writes_tables('currency')
     def insert_currency(self, name, exchange_rate):
         self.cursor.execute("INSERT INTO currency (name, exchange_rate) VALUES (?, ?)", (name, exchange_rate))
         self.conn.commit()
-        return self.cursor.lastrowid
+        row_id = self.cursor.lastrowid
+        self.notify_change('currency', 'insert', row_id)
+        return row_id
 
+    @writes_tables('accounts')
     def insert_account(self, name, cat_id, default_currency_id=None, nature='both', term='undefined'):
         self.cursor.execute(
             "INSERT INTO accounts (name, cat_id, default_currency_id, nature, term) VALUES (?, ?, ?, ?, ?)",
             (name, cat_id, default_currency_id, nature, term))
         self.conn.commit()
-        return self.cursor.lastrowid
+        row_id = self.cursor.lastrowid
+        self.notify_change('accounts', 'insert', row_id)
+        return row_id
 
+    @writes_tables('ccards')
     def insert_credit_card(self, account_id, credit_limit, close_day, due_day):
         self.cursor.execute("INSERT INTO ccards (account_id, credit_limit, close_day, due_day) VALUES (?, ?, ?, ?)", (account_id, credit_limit, close_day, due_day))
         self.conn.commit()
-        return self.cursor.lastrowid
+        row_id = self.cursor.lastrowid
+        self.notify_change('ccards', 'insert', row_id, account_id)
+        return row_id
 
+    @writes_tables('transactions')
     def insert_transaction(self, description, currency_id):
         self.cursor.execute("INSERT INTO transactions (description, currency_id) VALUES (?, ?)",
                             (description, currency_id))
         #self.conn.commit()
-        return self.cursor.lastrowid
+        row_id = self.cursor.lastrowid
+        self.notify_change('transactions', 'insert', row_id)
+        return row_id
 
     def get_accounts_by_nature(self, nature=None):
         """
@@ -235,14 +925,42 @@ class Database:
         return self.cursor.fetchall()
 
     def get_transaction_lines(self, transaction_id):
-        self.cursor.execute('''
+        self.cursor.execute(f'''
             SELECT tl.id, tl.transaction_id, tl.account_id, tl.debit, tl.credit, tl.date, t.currency_id, tl.classification_id
-            FROM transaction_lines tl
+            FROM {self.transaction_lines_table(transaction_id)} tl
             JOIN transactions t ON tl.transaction_id = t.id
             WHERE tl.transaction_id = ?
         ''', (transaction_id,))
         return self.cursor.fetchall()
 
+    def get_transaction_details(self, transaction_id):
+        """Get all lines of a transaction with account and classification names in one query"""
+        self.cursor.execute(f"""
+            SELECT tl.id, tl.account_id, a.name as account_name,
+                   tl.debit, tl.credit, tl.date, tl.classification_id,
+                   c.name as classification_name
+            FROM {self.transaction_lines_table(transaction_id)} tl
+            LEFT JOIN accounts a ON tl.account_id = a.id
+            LEFT JOIN classifications c ON tl.classification_id = c.id
+            WHERE tl.transaction_id = ?
+            ORDER BY tl.id
+        """, (transaction_id,))
+
+        results = []
+        for row in self.cursor.fetchall():
+            results.append({
+                'id': row[0],
+                'account_id': row[1],
+                'account_name': row[2] if row[2] else "Unknown",
+                'debit': row[3] or 0,
+                'credit': row[4] or 0,
+                'date': row[5],
+                'classification_id': row[6],
+                'classification_name': row[7] if row[7] else ""
+            })
+
+        return results
+
     def get_categories(self):
         self.cursor.execute("SELECT name FROM cat")
         return [row[0] for row in self.cursor.fetchall()]
@@ -269,41 +987,57 @@ class Database:
 
     # Add these methods to the Database class
 
+    @writes_tables('cat')
     def update_category(self, id, name):
         self.cursor.execute("UPDATE cat SET name = ? WHERE id = ?", (name, id))
         self.conn.commit()
+        self.notify_change('cat', 'update', id)
 
+    @writes_tables('cat')
     def delete_category(self, id):
         self.cursor.execute("DELETE FROM cat WHERE id = ?", (id,))
         self.conn.commit()
+        self.notify_change('cat', 'delete', id)
 
+    @writes_tables('currency')
     def update_currency(self, id, name, exchange_rate):
         self.cursor.execute("UPDATE currency SET name = ?, exchange_rate = ? WHERE id = ?",
                             (name, exchange_rate, id))
         self.conn.commit()
+        self.notify_change('currency', 'update', id)
 
+    @writes_tables('currency')
     def delete_currency(self, id):
         self.cursor.execute("DELETE FROM currency WHERE id = ?", (id,))
         self.conn.commit()
+        self.notify_change('currency', 'delete', id)
 
+    @writes_tables('accounts')
     def update_account(self, id, name, cat_id, default_currency_id=None, nature='both', term='undefined'):
         self.cursor.execute(
             "UPDATE accounts SET name = ?, cat_id = ?, default_currency_id = ?, nature = ?, term = ? WHERE id = ?",
             (name, cat_id, default_currency_id, nature, term, id))
         self.conn.commit()
+        self.notify_change('accounts', 'update', id)
 
+    @writes_tables('accounts')
     def delete_account(self, id):
         self.cursor.execute("DELETE FROM accounts WHERE id = ?", (id,))
         self.conn.commit()
+        self.notify_change('accounts', 'delete', id)
 
+    @writes_tables('ccards')
     def update_credit_card(self, account_id, credit_limit, close_day, due_day):
         self.cursor.execute("UPDATE ccards SET credit_limit = ?, close_day = ?, due_day = ? WHERE account_id = ?",
                             (credit_limit, close_day, due_day, account_id))
         self.conn.commit()
+        self.notify_change('ccards', 'update', None, account_id)
 
+    @writes_tables('ccards')
     def delete_credit_card(self, account_id):
         self.cursor.execute("DELETE FROM ccards WHERE account_id = ?", (account_id,))
         self.conn.commit()
+        self.notify_change('ccards', 'delete', None, account_id)
 
     def get_credit_card_by_account_id(self, account_id):
         self.cursor.execute("SELECT * FROM ccards WHERE account_id = ?", (account_id,))
@@ -342,13 +1076,17 @@ class Database:
         self.cursor.execute("SELECT * FROM classifications WHERE name = ?", (name,))
         return self.cursor.fetchone()
 
+    @writes_tables('classifications')
     def update_classification(self, id, name):
         self.cursor.execute("UPDATE classifications SET name = ? WHERE id = ?", (name, id))
         self.conn.commit()
+        self.notify_change('classifications', 'update', id)
 
+    @writes_tables('classifications')
     def delete_classification(self, id):
         self.cursor.execute("DELETE FROM classifications WHERE id = ?", (id,))
         self.conn.commit()
+        self.notify_change('classifications', 'delete', id)
 
     def get_account_by_id(self, id):
         self.cursor.execute("SELECT * FROM accounts WHERE id = ?", (id,))
@@ -383,6 +1121,17 @@ class Database:
         """)
         return self.cursor.fetchall()
 
+    def get_account_row(self, account_id):
+        """One row in the get_all_accounts() shape, or None if the account is gone"""
+        self.cursor.execute("""
+            SELECT a.id, a.name, c.name as category, cu.name as currency, a.nature, a.term
+            FROM accounts a
+            JOIN cat c ON a.cat_id = c.id
+            LEFT JOIN currency cu ON a.default_currency_id = cu.id
+            WHERE a.id = ?
+        """, (account_id,))
+        return self.cursor.fetchone()
+
     def get_all_credit_cards(self):
         self.cursor.execute("""
             SELECT cc.id, a.name, cc.credit_limit, cc.close_day, cc.due_day, cu.name as currency
@@ -432,21 +1181,22 @@ class Database:
         return None
 
     def account_has_transactions(self, account_id):
-        self.cursor.execute("""
-            SELECT COUNT(*) FROM transaction_lines
-            WHERE account_id = ?
-        """, (account_id,))
-        count = self.cursor.fetchone()[0]
-        return count > 0
+        """Whether any transaction line, in the main file or an archived year, uses the account"""
+        for table in ("transaction_lines", *self.archived_lines_tables()):
+            self.cursor.execute(f"SELECT EXISTS (SELECT 1 FROM {table} WHERE account_id = ?)", (account_id,))
+            if self.cursor.fetchone()[0]:
+                return True
+        return False
 
     def get_credit_card_statement(self, account_id, month, year):
         # Format date ranges for the given month
         start_date = f"{year}-{month:02d}-01"
         end_date = f"{year}-{month:02d}-31" if month != 2 else f"{year}-{month:02d}-28"
 
-        self.cursor.execute("""
+        lines = self.transaction_lines_source(start_date, end_date)
+        self.cursor.execute(f"""
             SELECT tl.date, t.description, tl.debit - tl.credit as amount
-            FROM transaction_lines tl
+            FROM {lines} tl
             JOIN transactions t ON tl.transaction_id = t.id
             WHERE tl.account_id = ? AND tl.date BETWEEN ? AND ?
             ORDER BY tl.date
@@ -461,18 +1211,24 @@ class Database:
             })
         return results
 
+    @writes_tables('classifications')
     def insert_classification(self, name):
         self.cursor.execute("INSERT INTO classifications (name) VALUES (?)", (name,))
         self.conn.commit()
-        return self.cursor.lastrowid
+        row_id = self.cursor.lastrowid
+        self.notify_change('classifications', 'insert', row_id)
+        return row_id
 
+    @writes_tables('account_classifications')
     def link_account_classification(self, account_id, classification_id):
         self.cursor.execute(
             "INSERT INTO account_classifications (account_id, classification_id) VALUES (?, ?)",
             (account_id, classification_id)
         )
         self.conn.commit()
-        return self.cursor.lastrowid
+        row_id = self.cursor.lastrowid
+        self.notify_change('account_classifications', 'insert', row_id, account_id)
+        return row_id
 
     def get_classifications_for_account(self, account_id):
         self.cursor.execute("""
@@ -484,47 +1240,68 @@ class Database:
         """, (account_id,))
         return self.cursor.fetchall()
 
+    @writes_tables('transaction_lines')
     def update_transaction_line_classification(self, transaction_line_id, classification_id):
+        transaction_id = self._line_owner(transaction_line_id)
+        if transaction_id is not None:
+            self.check_not_archived(transaction_id)
         self.cursor.execute(
             "UPDATE transaction_lines SET classification_id = ? WHERE id = ?",
             (classification_id, transaction_line_id)
         )
         self.conn.commit()
+        self.notify_change('transaction_lines', 'update', transaction_line_id, transaction_id)
 
+    @writes_tables('account_classifications')
     def unlink_account_classification(self, account_id, classification_id):
         self.cursor.execute(
             "DELETE FROM account_classifications WHERE account_id = ? AND classification_id = ?",
             (account_id, classification_id)
         )
         self.conn.commit()
+        self.notify_change('account_classifications', 'delete', None, account_id)
 
+    @writes_tables('transactions')
     def update_transaction(self, id, description, currency_id):
+        self.check_not_archived(id)
         self.cursor.execute("UPDATE transactions SET description = ?, currency_id = ? WHERE id = ?",
                             (description, currency_id, id))
         #self.conn.commit()
+        self.notify_change('transactions', 'update', id)
 
+    @writes_tables('transactions', 'transaction_lines')
     def delete_transaction(self, id):
+        self.check_not_archived(id)
         # First delete all associated transaction lines (using foreign key constraints)
         self.cursor.execute("DELETE FROM transaction_lines WHERE transaction_id = ?", (id,))
         # Then delete the transaction itself
         self.cursor.execute("DELETE FROM transactions WHERE id = ?", (id,))
         self.conn.commit()
+        self.notify_change('transactions', 'delete', id)
 
+    @writes_tables('transaction_lines')
     def insert_transaction_line(self, transaction_id, account_id, debit=None, credit=None, date=None,
                                 classification_id=None):
         if debit is None and credit is None:
             raise ValueError("Either debit or credit must be specified")
+        self.check_not_archived(transaction_id)
         self.cursor.execute(
             "INSERT INTO transaction_lines (transaction_id, account_id, debit, credit, date, classification_id) VALUES (?, ?, ?, ?, ?, ?)",
             (transaction_id, account_id, debit, credit, date, classification_id))
         #self.conn.commit()
-        return self.cursor.lastrowid
+        row_id = self.cursor.lastrowid
+        self.notify_change('transaction_lines', 'insert', row_id, transaction_id)
+        return row_id
 
     def get_transaction_line(self, id):
-        self.cursor.execute("""
+        # Archived lines are found too, so editing one ends in check_not_archived's message
+        table = self._line_table(id)
+        if table is None:
+            return None
+        self.cursor.execute(f"""
             SELECT tl.id, tl.transaction_id, tl.account_id, tl.debit, tl.credit, tl.date, tl.classification_id,
                    a.name as account_name, t.currency_id
-            FROM transaction_lines tl
+            FROM {table} tl
             JOIN accounts a ON tl.account_id = a.id
             JOIN transactions t ON tl.transaction_id = t.id
             WHERE tl.id = ?
@@ -549,40 +1326,276 @@ class Database:
             }
         return None
 
+    def _line_table(self, line_id):
+        """The table holding a line: transaction_lines, an archived year's (attached), or None if there is none"""
+        for table in ("transaction_lines", *self.archived_lines_tables()):
+            if self.conn.execute(f"SELECT 1 FROM {table} WHERE id = ?", (line_id,)).fetchone():
+                return table
+        return None
+
+    def _line_owner(self, line_id):
+        """Transaction of a line in the main file or an archived year, or None if there is no such line"""
+        table = self._line_table(line_id)
+        if table is None:
+            return None
+        return self.conn.execute(f"SELECT transaction_id FROM {table} WHERE id = ?", (line_id,)).fetchone()[0]
+
+    @writes_tables('transaction_lines')
     def update_transaction_line(self, id, account_id, debit=None, credit=None, date=None, classification_id=None):
+        transaction_id = self._line_owner(id)
+        if transaction_id is not None:
+            self.check_not_archived(transaction_id)
         self.cursor.execute("""
             UPDATE transaction_lines 
             SET account_id = ?, debit = ?, credit = ?, date = ?, classification_id = ?
             WHERE id = ?
         """, (account_id, debit, credit, date, classification_id, id))
         #self.conn.commit()
+        self.notify_change('transaction_lines', 'update', id, transaction_id)
 
+    @writes_tables('transaction_lines')
     def delete_transaction_line(self, id):
+        transaction_id = self._line_owner(id)
+        if transaction_id is not None:
+            self.check_not_archived(transaction_id)
         self.cursor.execute("DELETE FROM transaction_lines WHERE id = ?", (id,))
         #self.conn.commit()
+        self.notify_change('transaction_lines', 'delete', id, transaction_id)
 
     def begin_transaction(self):
         """Begin a database transaction"""
         #conn = db.get_connection()
         self.conn.execute("BEGIN TRANSACTION")
+        self._pending_changes = []
 
     def commit_transaction(self):
         """Commit a database transaction"""
         #conn = db.get_connection()
         self.conn.execute("COMMIT")
+        changes, self._pending_changes = self._pending_changes, None
+        if not changes:
+            return
+        if self._call_changes is not None:
+            # Committed by a @writes_tables method: sent once it has bumped the versions
+            self._call_changes.extend(changes)
+        else:
+            self._dispatch_changes(changes)
 
     def rollback_transaction(self):
         """Rollback a database transaction"""
         #conn = db.get_connection()
+        self._pending_changes = None
         self.conn.execute("ROLLBACK")
 
+    # Year archives: the lines of closed years live in <database name>_<year>.db files
+
+    def archive_path(self, year):
+        """The archive file of year, next to the database file"""
+        stem, extension = os.path.splitext(os.path.abspath(self.db_name))
+        return f"{stem}_{year}{extension or '.db'}"
+
+    def archived_years(self, conn=None):
+        """Years whose lines were moved to archive files, oldest first"""
+        return [row[0] for row in (conn or self.conn).execute("SELECT year FROM archived_years ORDER BY year")]
+
+    def get_archived_years(self):
+        """Archived years as dicts: year, file_name, line_count and archived_at"""
+        self.cursor.execute("SELECT year, file_name, line_count, archived_at FROM archived_years ORDER BY year")
+        return [{'year': row[0], 'file_name': row[1], 'line_count': row[2], 'archived_at': row[3]}
+                for row in self.cursor.fetchall()]
+
+    @staticmethod
+    def _attached_archives(conn):
+        """{schema name: file} of the year archives attached to conn"""
+        return {name: path for _, name, path in conn.execute("PRAGMA database_list") if name.startswith('archive_')}
+
+    def attach_archives(self, years, conn=None, create=False):
+        """
+        Attach the archive files of years to conn (the main connection by default) unless
+        they already are, detaching archives not in years when the attach limit is reached.
+        Other connections (readers) attach them read-only. Raises ValueError when more
+        years are needed at once than SQLite can attach, or an archive file is missing.
+        """
+        conn = conn or self.conn
+        wanted = {ARCHIVE_SCHEMA.format(year=year): year for year in years}
+        # The write-behind log of an in-memory working copy takes one of the slots
+        limit = MAX_ATTACHED_ARCHIVES - sum(1 for _, name, _ in conn.execute("PRAGMA database_list")
+                                            if name == WRITE_BEHIND_SCHEMA)
+        if len(wanted) > limit:
+            raise ValueError(f"A query can reach at most {limit} archived years; "
+                             f"narrow the date range or restore some years")
+        attached = self._attached_archives(conn)
+        missing = [name for name in wanted if name not in attached]
+        spare = [name for name in attached if name not in wanted]
+        while missing and len(attached) + len(missing) > limit:
+            name = spare.pop()
+            conn.execute(f"DETACH DATABASE {name}")
+            del attached[name]
+
+        read_only = self.read_only or conn is not self.conn
+        for name in missing:
+            path = self.archive_path(wanted[name])
+            if not create and not os.path.exists(path):
+                raise ValueError(f"The archive of {wanted[name]} is missing: {path}")
+            target = f"file:{pathname2url(path)}?mode=ro" if read_only else path
+            conn.execute(f"ATTACH DATABASE ? AS {name}", (target,))
+        if conn is self.conn:
+            # Replaced, never changed in place, so readers opening on other threads see a whole record
+            self.archive_files = self._attached_archives(conn)
+
+    def transaction_lines_source(self, date_from=None, date_to=None, conn=None):
+        """
+        The transaction lines a query limited to date_from..date_to (YYYY-MM-DD, None for an
+        open end) can reach, as a table expression for FROM: transaction_lines alone while the
+        range stays clear of archived years, otherwise a UNION ALL of it with the archives of
+        the years in range, which are attached to conn (the main connection by default).
+        """
+        first = int(date_from[:4]) if date_from else None
+        last = int(date_to[:4]) if date_to else None
+        years = [year for year in self.archived_years(conn)
+                 if (first is None or year >= first) and (last is None or year <= last)]
+        if not years:
+            return "transaction_lines"
+        self.attach_archives(years, conn)
+        columns = ', '.join(TRANSACTION_LINE_COLUMNS)
+        parts = [f"SELECT {columns} FROM main.transaction_lines"]
+        parts += [f"SELECT {columns} FROM {ARCHIVE_SCHEMA.format(year=year)}.transaction_lines" for year in years]
+        return "(" + " UNION ALL ".join(parts) + ")"
+
+    def archived_lines_tables(self, conn=None):
+        """
+        Yield the transaction_lines table of each archived year, attaching the archives one
+        at a time, for lookups that must cover every year however many are archived.
+        """
+        for year in self.archived_years(conn):
+            self.attach_archives([year], conn)
+            yield f"{ARCHIVE_SCHEMA.format(year=year)}.transaction_lines"
+
+    def archived_year_of(self, transaction_id, conn=None):
+        """The year a transaction was archived with, or None if its lines are in the main file"""
+        row = (conn or self.conn).execute("SELECT year FROM archived_transactions WHERE transaction_id = ?",
+                                          (transaction_id,)).fetchone()
+        return row[0] if row else None
+
+    def transaction_lines_table(self, transaction_id, conn=None):
+        """The table holding one transaction's lines: transaction_lines or its year's archive (attached)"""
+        year = self.archived_year_of(transaction_id, conn)
+        if year is None:
+            return "transaction_lines"
+        self.attach_archives([year], conn)
+        return f"{ARCHIVE_SCHEMA.format(year=year)}.transaction_lines"
+
+    def check_not_archived(self, transaction_id):
+        """Raise ValueError for a transaction of an archived year, which is read-only until restored"""
+        year = self.archived_year_of(transaction_id)
+        if year is not None:
+            raise ValueError(f"Transaction {transaction_id} belongs to the archived year {year}; "
+                             f"restore the year to change it")
+
+    def _check_not_in_memory(self):
+        # Archiving writes the archive file directly, which would run ahead of the write-behind
+        if self.write_behind is not None:
+            raise ValueError("Years can only be archived or restored on the database file, "
+                             "not on an in-memory working copy")
+
+    @writes_tables('transaction_lines')
+    def archive_year(self, year):
+        """
+        Move the lines of every transaction lying entirely within year, which must be before
+        the current year, to the year's archive file (created if needed) in one transaction
+        across both files. Transactions with lines in other years stay in the main file.
+        Archiving a year again adds lines posted to it since. Returns the number of lines moved.
+        """
+        if year >= datetime.date.today().year:
+            raise ValueError(f"{year} is not closed; only years before the current one can be archived")
+        self._check_not_in_memory()
+        name = ARCHIVE_SCHEMA.format(year=year)
+        self.attach_archives([year], create=True)
+        self.cursor.execute(f"""
+            CREATE TABLE IF NOT EXISTS {name}.transaction_lines (
+                id INTEGER PRIMARY KEY,
+                transaction_id INTEGER NOT NULL,
+                account_id INTEGER NOT NULL,
+                debit REAL,
+                credit REAL,
+                date DATE NOT NULL,
+                classification_id INTEGER
+            )
+        """)
+        for index_name, definition in TRANSACTION_LINE_INDEXES.items():
+            self.cursor.execute(f"CREATE INDEX IF NOT EXISTS {name}.{index_name} {definition}")
+        self.conn.commit()
+
+        columns = ', '.join(TRANSACTION_LINE_COLUMNS)
+        self.begin_transaction()
+        try:
+            self.cursor.execute("CREATE TEMP TABLE archive_batch (transaction_id INTEGER PRIMARY KEY)")
+            self.cursor.execute("""
+                INSERT INTO archive_batch
+                SELECT transaction_id FROM transaction_lines
+                WHERE transaction_id IN (SELECT transaction_id FROM transaction_lines WHERE date >= ? AND date < ?)
+                GROUP BY transaction_id
+                HAVING MIN(date) >= ? AND MAX(date) < ?
+            """, (f"{year}-01-01", f"{year + 1}-01-01") * 2)
+            self.cursor.execute(f"""
+                INSERT INTO {name}.transaction_lines ({columns})
+                SELECT {columns} FROM transaction_lines
+                WHERE transaction_id IN (SELECT transaction_id FROM archive_batch)
+            """)
+            moved = self.cursor.rowcount
+            self.cursor.execute("INSERT OR REPLACE INTO archived_transactions (transaction_id, year) "
+                                "SELECT transaction_id, ? FROM archive_batch", (year,))
+            self.cursor.execute("DELETE FROM transaction_lines "
+                                "WHERE transaction_id IN (SELECT transaction_id FROM archive_batch)")
+            self.cursor.execute(f"""
+                INSERT OR REPLACE INTO archived_years (year, file_name, line_count, archived_at)
+                VALUES (?, ?, (SELECT COUNT(*) FROM {name}.transaction_lines), datetime('now', 'localtime'))
+            """, (year, os.path.basename(self.archive_path(year))))
+            self.cursor.execute("DROP TABLE archive_batch")
+            self.commit_transaction()
+        except Exception:
+            self.rollback_transaction()
+            raise
+        return moved
+
+    @writes_tables('transaction_lines')
+    def restore_year(self, year):
+        """Move an archived year's lines back into the main file and delete its archive file"""
+        if year not in self.archived_years():
+            raise ValueError(f"{year} is not archived")
+        self._check_not_in_memory()
+        name = ARCHIVE_SCHEMA.format(year=year)
+        self.attach_archives([year])
+        columns = ', '.join(TRANSACTION_LINE_COLUMNS)
+        self.begin_transaction()
+        try:
+            self.cursor.execute(f"INSERT INTO transaction_lines ({columns}) "
+                                f"SELECT {columns} FROM {name}.transaction_lines")
+            restored = self.cursor.rowcount
+            self.cursor.execute("DELETE FROM archived_transactions WHERE year = ?", (year,))
+            self.cursor.execute("DELETE FROM archived_years WHERE year = ?", (year,))
+            self.commit_transaction()
+        except Exception:
+            self.rollback_transaction()
+            raise
+        self.conn.execute(f"DETACH DATABASE {name}")
+        self.archive_files = self._attached_archives(self.conn)
+        os.remove(self.archive_path(year))
+        return restored
+
     def get_transaction_count(self, filter_params=None):
         """Get the total number of transactions matching the filter"""
+        filter_params = filter_params or {}
+        # A saved filter profile keeps its count until the data changes
+        if 'profile_id' in filter_params:
+            return self.filter_profiles.count(filter_params['profile_id'])
+        lines = self.transaction_lines_source(filter_params.get('date_from'), filter_params.get('date_to'))
+
         # Build the query dynamically based on filters
-        base_query = """
+        base_query = f"""
             SELECT COUNT(DISTINCT t.id)
             FROM transactions t
-            JOIN transaction_lines tl ON t.id = tl.transaction_id
+            JOIN {lines} tl ON t.id = tl.transaction_id
         """
 
         where_clauses = []
@@ -624,10 +1637,10 @@ class Database:
             # Get all transaction IDs that match the other filters
             if not where_clauses:
                 self.cursor.execute(
-                    "SELECT DISTINCT t.id FROM transactions t JOIN transaction_lines tl ON t.id = tl.transaction_id")
+                    f"SELECT DISTINCT t.id FROM transactions t JOIN {lines} tl ON t.id = tl.transaction_id")
             else:
                 self.cursor.execute(
-                    "SELECT DISTINCT t.id FROM transactions t JOIN transaction_lines tl ON t.id = tl.transaction_id WHERE " +
+                    f"SELECT DISTINCT t.id FROM transactions t JOIN {lines} tl ON t.id = tl.transaction_id WHERE " +
                     " AND ".join(where_clauses),
                     params
                 )
@@ -637,7 +1650,7 @@ class Database:
             # For each transaction, calculate the total and apply amount filters
             for transaction_id in transaction_ids:
                 self.cursor.execute(
-                    "SELECT SUM(IFNULL(tl.debit, 0)) FROM transaction_lines tl WHERE tl.transaction_id = ?",
+                    f"SELECT SUM(IFNULL(tl.debit, 0)) FROM {lines} tl WHERE tl.transaction_id = ?",
                     (transaction_id,)
                 )
                 total_amount = self.cursor.fetchone()[0] or 0
@@ -677,11 +1690,11 @@ class Database:
 
     def get_transaction_lines_by_type(self, transaction_id, is_debit=True):
         """Get transaction lines of a specific type (debit or credit)"""
-        query = """
+        query = f"""
             SELECT tl.id, tl.account_id, a.name as account_name, 
                    tl.debit, tl.credit, tl.date, tl.classification_id, 
                    c.name as classification_name
-            FROM transaction_lines tl
+            FROM {self.transaction_lines_table(transaction_id)} tl
             JOIN accounts a ON tl.account_id = a.id
             LEFT JOIN classifications c ON tl.classification_id = c.id
             WHERE tl.transaction_id = ? AND 
@@ -708,6 +1721,7 @@ class Database:
 
         return results
 
+    @writes_tables('orphan_transaction_lines')
     def consume_orphan_line(self, orphan_line_id, transaction_id):
         self.cursor.execute("""
             UPDATE orphan_transaction_lines 
@@ -729,12 +1743,70 @@ class Database:
         self.cursor.execute(query, params)
         return self.cursor.fetchall()
 
+    def get_orphan_batch_summaries(self, status=None):
+        """
+        Orphan transaction batches with their lines summarised, newest first, from one query
+        grouping the lines by batch and status. Each batch is a dict: id, reference,
+        import_date, status, line_count, status_counts ({line status: count}), debit_total,
+        credit_total, first_date and last_date (None for a batch without lines).
+        """
+        query = """
+            SELECT ot.id, ot.reference, ot.import_date, ot.status,
+                   s.status, s.line_count, s.debit_total, s.credit_total, s.first_date, s.last_date
+            FROM orphan_transactions ot
+            LEFT JOIN (
+                SELECT orphan_transaction_id, status, COUNT(*) AS line_count,
+                       SUM(debit) AS debit_total, SUM(credit) AS credit_total,
+                       MIN(date) AS first_date, MAX(date) AS last_date
+                FROM orphan_transaction_lines
+                GROUP BY orphan_transaction_id, status
+            ) s ON s.orphan_transaction_id = ot.id
+        """
+        params = []
+
+        if status:
+            query += " WHERE ot.status = ?"
+            params.append(status)
+
+        query += " ORDER BY ot.import_date DESC, ot.id"
+        self.cursor.execute(query, params)
+
+        batches = {}
+        for (batch_id, reference, import_date, batch_status,
+             line_status, line_count, debit_total, credit_total, first_date, last_date) in self.cursor.fetchall():
+            batch = batches.get(batch_id)
+            if batch is None:
+                batch = batches[batch_id] = {
+                    'id': batch_id,
+                    'reference': reference,
+                    'import_date': import_date,
+                    'status': batch_status,
+                    'line_count': 0,
+                    'status_counts': {},
+                    'debit_total': 0.0,
+                    'credit_total': 0.0,
+                    'first_date': None,
+                    'last_date': None,
+                }
+            if line_status is None:
+                continue
+            batch['line_count'] += line_count
+            batch['status_counts'][line_status] = line_count
+            batch['debit_total'] += debit_total or 0.0
+            batch['credit_total'] += credit_total or 0.0
+            if first_date and (batch['first_date'] is None or first_date < batch['first_date']):
+                batch['first_date'] = first_date
+            if last_date and (batch['last_date'] is None or last_date > batch['last_date']):
+                batch['last_date'] = last_date
+
+        return list(batches.values())
+
     def get_orphan_lines(self, orphan_transaction_id=None, status=None):
         """Get orphan transaction lines with optional filters"""
         query = """
             SELECT otl.id, otl.orphan_transaction_id, otl.description, 
                    otl.account_id, a.name as account_name, 
-                   otl.debit, otl.credit, otl.status, otl.transaction_id, otl.notes
+                   otl.debit, otl.credit, otl.status, otl.transaction_id, otl.notes, otl.date
             FROM orphan_transaction_lines otl
             LEFT JOIN accounts a ON otl.account_id = a.id
             WHERE 1=1
@@ -745,7 +1817,10 @@ class Database:
             query += " AND otl.orphan_transaction_id = ?"
             params.append(orphan_transaction_id)
 
-        if status:
+        if status == 'new':
+            # Literal rather than bound, so the partial idx_orphan_lines_new applies
+            query += " AND otl.status = 'new'"
+        elif status:
             query += " AND otl.status = ?"
             params.append(status)
 
@@ -764,22 +1839,83 @@ class Database:
                 'credit': row[6],
                 'status': row[7],
                 'transaction_id': row[8],
-                'notes': row[9] if len(row) > 9 else None
+                'notes': row[9],
+                'date': row[10]
             })
 
         return results
 
-    def insert_orphan_transaction(self, reference, lines_data):
+    def mark_duplicate_lines(self, lines_data, seen=None):
+        """
+        Set 'fingerprint' and 'duplicate_of' on each line dict about to be imported.
+        duplicate_of is 'orphan' when the same line was imported before, 'posted' when a
+        transaction line with the same fingerprint exists, else None. Orphan lines are
+        matched through the fingerprint index; posted lines are fingerprinted in bulk over
+        the import's date range only. seen continues the occurrence numbering of earlier
+        chunks of the same import (see assign_fingerprints). Returns the number of duplicates.
+        """
+        fingerprints = assign_fingerprints(lines_data, seen)
+
+        # Earlier imports: indexed IN lookups in chunks
+        imported = set()
+        unique = list(set(fingerprints))
+        for start in range(0, len(unique), FINGERPRINT_CHUNK_SIZE):
+            chunk = unique[start:start + FINGERPRINT_CHUNK_SIZE]
+            self.cursor.execute(
+                f"SELECT fingerprint FROM orphan_transaction_lines WHERE fingerprint IN ({','.join('?' * len(chunk))})",
+                chunk)
+            imported.update(row[0] for row in self.cursor.fetchall())
+
+        # Posted lines carry no fingerprint; compute them for the dates the import covers
+        posted = set()
+        dates = [line.get('date') for line in lines_data if line.get('date')]
+        if dates:
+            # Lines of archived years count too, so re-importing an old statement is caught
+            lines = self.transaction_lines_source(min(dates), max(dates))
+            self.cursor.execute(f"""
+                SELECT tl.date, tl.debit, tl.credit, t.description, tl.account_id
+                FROM {lines} tl
+                JOIN transactions t ON tl.transaction_id = t.id
+                WHERE tl.date BETWEEN ? AND ?
+                ORDER BY tl.id
+            """, (min(dates), max(dates)))
+            posted.update(assign_fingerprints(
+                {'date': row[0], 'debit': row[1], 'credit': row[2], 'description': row[3], 'account_id': row[4]}
+                for row in self.cursor.fetchall()))
+
+        duplicates = 0
+        for line, fingerprint in zip(lines_data, fingerprints):
+            line['fingerprint'] = fingerprint
+            if fingerprint in imported:
+                line['duplicate_of'] = 'orphan'
+            elif fingerprint in posted:
+                line['duplicate_of'] = 'posted'
+            else:
+                line['duplicate_of'] = None
+            duplicates += line['duplicate_of'] is not None
+        return duplicates
+
+    @writes_tables('orphan_transactions', 'orphan_transaction_lines')
+    def insert_orphan_transaction(self, reference, lines_data, duplicates='flag'):
         """
         Insert a new orphan transaction with its lines
 
         Args:
             reference: Reference for this batch import (e.g., filename)
-            lines_data: List of dicts with line data (description, account_id, debit, credit)
+            lines_data: List of dicts with line data (description, account_id, debit, credit, date)
+            duplicates: 'flag' to keep lines already imported or posted as ignored, with a note,
+                or 'skip' to leave them out (see mark_duplicate_lines)
 
         Returns:
-            Orphan transaction ID
+            Orphan transaction ID, or None if every line was a skipped duplicate
         """
+        if any('fingerprint' not in line for line in lines_data):
+            self.mark_duplicate_lines(lines_data)
+        if duplicates == 'skip':
+            lines_data = [line for line in lines_data if not line['duplicate_of']]
+            if not lines_data:
+                return None
+
         try:
             # Start a transaction
             self.begin_transaction()
@@ -791,41 +1927,7 @@ class Database:
                 (reference, import_date)
             )
             orphan_transaction_id = self.cursor.lastrowid
-
-            # Insert each line
-            for line in lines_data:
-                # Set status based on validity - use 'ignored' for invalid lines
-                status = 'new' if line.get('valid', True) else 'ignored'
-
-                description = line.get('description', '')
-                account_id = line.get('account_id')
-                debit = line.get('debit')
-                credit = line.get('credit')
-
-                # Store original account name if it couldn't be resolved
-                notes = None
-                if not account_id and line.get('account_name'):
-                    notes = f"Original account name: {line.get('account_name')}"
-
-                # Add a notes column to orphan_transaction_lines if it doesn't exist
-                try:
-                    self.cursor.execute("SELECT notes FROM orphan_transaction_lines LIMIT 1")
-                except sqlite3.OperationalError:
-                    self.cursor.execute("ALTER TABLE orphan_transaction_lines ADD COLUMN notes TEXT")
-
-                self.cursor.execute("""
-                    INSERT INTO orphan_transaction_lines 
-                    (orphan_transaction_id, description, account_id, debit, credit, status, notes)
-                    VALUES (?, ?, ?, ?, ?, ?, ?)
-                """, (
-                    orphan_transaction_id,
-                    description,
-                    account_id,
-                    debit,
-                    credit,
-                    status,
-                    notes
-                ))
+            self._insert_orphan_lines(orphan_transaction_id, lines_data)
 
             # Commit transaction
             self.commit_transaction()
@@ -836,6 +1938,151 @@ class Database:
             self.rollback_transaction()
             raise e
 
+    def _insert_orphan_lines(self, orphan_transaction_id, lines_data):
+        """Insert lines checked by mark_duplicate_lines into a batch, in one statement; no commit"""
+        rows = []
+        for line in lines_data:
+            # Set status based on validity - use 'ignored' for invalid lines and duplicates
+            status = 'new' if line.get('valid', True) and not line['duplicate_of'] else 'ignored'
+
+            # Store original account name if it couldn't be resolved
+            notes = None
+            if line['duplicate_of'] == 'orphan':
+                notes = "Duplicate of a previously imported line"
+            elif line['duplicate_of'] == 'posted':
+                notes = "Duplicate of a posted transaction line"
+            elif not line.get('account_id') and line.get('account_name'):
+                notes = f"Original account name: {line.get('account_name')}"
+
+            rows.append((
+                orphan_transaction_id,
+                line.get('description', ''),
+                line.get('account_id'),
+                line.get('debit'),
+                line.get('credit'),
+                line.get('date'),
+                status,
+                notes,
+                line['fingerprint']
+            ))
+
+        self.cursor.executemany("""
+            INSERT INTO orphan_transaction_lines 
+            (orphan_transaction_id, description, account_id, debit, credit, date, status, notes, fingerprint)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """, rows)
+
+    def get_import_checkpoint(self, file_hash):
+        """The unfinished import of a file with this content hash as a dict, or None"""
+        self.cursor.execute("""
+            SELECT id, file_hash, file_path, orphan_transaction_id, mapping, byte_offset, last_row, updated_at
+            FROM import_checkpoints
+            WHERE file_hash = ? AND status = 'running'
+            ORDER BY id DESC LIMIT 1
+        """, (file_hash,))
+        row = self.cursor.fetchone()
+        if not row:
+            return None
+        return {
+            'id': row[0],
+            'file_hash': row[1],
+            'file_path': row[2],
+            'orphan_transaction_id': row[3],
+            'mapping': row[4],
+            'byte_offset': row[5],
+            'last_row': row[6],
+            'updated_at': row[7]
+        }
+
+    @writes_tables('orphan_transactions')
+    def start_import_checkpoint(self, file_hash, file_path, reference, mapping, byte_offset=0):
+        """
+        Create the (empty) orphan batch of a chunked import and its checkpoint, committed
+        together. mapping is the JSON text chunks are parsed with; byte_offset is where the
+        first data row starts. Returns the checkpoint dict (see get_import_checkpoint).
+        """
+        now = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        try:
+            self.begin_transaction()
+            self.cursor.execute(
+                "INSERT INTO orphan_transactions (reference, import_date, status) VALUES (?, ?, 'new')",
+                (reference, now)
+            )
+            orphan_transaction_id = self.cursor.lastrowid
+            self.cursor.execute("""
+                INSERT INTO import_checkpoints
+                (file_hash, file_path, orphan_transaction_id, mapping, byte_offset, last_row, status, updated_at)
+                VALUES (?, ?, ?, ?, ?, 0, 'running', ?)
+            """, (file_hash, file_path, orphan_transaction_id, mapping, byte_offset, now))
+            self.commit_transaction()
+        except Exception as e:
+            self.rollback_transaction()
+            raise e
+        return self.get_import_checkpoint(file_hash)
+
+    @writes_tables('orphan_transaction_lines')
+    def append_orphan_lines(self, checkpoint, lines_data, byte_offset, last_row):
+        """
+        Write one chunk of a checkpointed import: the lines (checked by mark_duplicate_lines)
+        go into the checkpoint's batch and the checkpoint advances to byte_offset/last_row
+        in the same transaction, so a crash leaves either both or neither.
+        """
+        try:
+            self.begin_transaction()
+            if lines_data:
+                self._insert_orphan_lines(checkpoint['orphan_transaction_id'], lines_data)
+            self.cursor.execute("""
+                UPDATE import_checkpoints SET byte_offset = ?, last_row = ?, updated_at = ?
+                WHERE id = ?
+            """, (byte_offset, last_row, datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), checkpoint['id']))
+            self.commit_transaction()
+        except Exception as e:
+            self.rollback_transaction()
+            raise e
+        checkpoint['byte_offset'] = byte_offset
+        checkpoint['last_row'] = last_row
+
+    def import_fingerprint_counts(self, orphan_transaction_id):
+        """{content hash: next occurrence} of a batch's lines, to continue numbering on resume"""
+        self.cursor.execute(
+            "SELECT fingerprint FROM orphan_transaction_lines WHERE orphan_transaction_id = ? AND fingerprint IS NOT NULL",
+            (orphan_transaction_id,))
+        seen = {}
+        for (fingerprint,) in self.cursor.fetchall():
+            content, _, occurrence = fingerprint.rpartition(':')
+            if occurrence.isdigit():
+                seen[content] = max(seen.get(content, 0), int(occurrence) + 1)
+        return seen
+
+    @writes_tables('orphan_transactions', 'orphan_transaction_lines')
+    def finish_import_checkpoint(self, checkpoint, abandon=False):
+        """
+        Close a checkpointed import. A batch left without lines is removed; with abandon=True
+        the partial batch is removed as well, for imports the user chose to start over.
+        Returns the orphan transaction id, or None if the batch was removed.
+        """
+        orphan_transaction_id = checkpoint['orphan_transaction_id']
+        try:
+            self.begin_transaction()
+            self.cursor.execute("SELECT COUNT(*) FROM orphan_transaction_lines WHERE orphan_transaction_id = ?",
+                                (orphan_transaction_id,))
+            if abandon or self.cursor.fetchone()[0] == 0:
+                self.cursor.execute("DELETE FROM orphan_transaction_lines WHERE orphan_transaction_id = ?",
+                                    (orphan_transaction_id,))
+                self.cursor.execute("DELETE FROM orphan_transactions WHERE id = ?", (orphan_transaction_id,))
+                orphan_transaction_id = None
+            self.cursor.execute("""
+                UPDATE import_checkpoints SET status = ?, orphan_transaction_id = ?, updated_at = ?
+                WHERE id = ?
+            """, ('abandoned' if abandon else 'done', orphan_transaction_id,
+                  datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S"), checkpoint['id']))
+            self.commit_transaction()
+        except Exception as e:
+            self.rollback_transaction()
+            raise e
+        return orphan_transaction_id
+
+    @writes_tables('orphan_transaction_lines')
     def update_orphan_line(self, line_id, description=None, account_id=None, debit=None, credit=None, date=None,
                            status=None):
         """Update an orphan transaction line"""
@@ -870,6 +2117,7 @@ class Database:
         self.cursor.execute(query, params)
         self.conn.commit()
 
+    @writes_tables('transactions', 'transaction_lines', 'orphan_transaction_lines')
     def create_transaction_from_orphans(self, description, currency_id, orphan_line_ids,
                                         balancing_account_id, balancing_date):
         """
@@ -931,8 +2179,7 @@ class Database:
                     line['account_id'],
                     line['debit'] or None,
                     line['credit'] or None,
-                    balancing_date,  # Use the balancing date for consistency
-                    None
+                    balancing_date  # Use the balancing date for consistency
                 ))
 
                 # Mark the orphan line as consumed
@@ -959,6 +2206,8 @@ class Database:
                         VALUES (?, ?, ?, NULL, ?, NULL)
                     """, (transaction_id, balancing_account_id, abs(imbalance), balancing_date))
 
+            self.notify_change('transactions', 'insert', transaction_id)
+
             # Commit the transaction
             self.commit_transaction()
             return transaction_id
@@ -968,6 +2217,195 @@ class Database:
             self.rollback_transaction()
             raise e
 
+    def get_all_rules(self, enabled_only=False):
+        """Categorization rules in the order they are tried, as dicts with account and classification names"""
+        query = """
+            SELECT r.id, r.name, r.priority, r.match_type, r.pattern, r.direction, r.min_amount, r.max_amount,
+                   r.source_account_id, r.counterpart_account_id, r.classification_id, r.enabled,
+                   sa.name, ca.name, cl.name
+            FROM categorization_rules r
+            LEFT JOIN accounts sa ON r.source_account_id = sa.id
+            LEFT JOIN accounts ca ON r.counterpart_account_id = ca.id
+            LEFT JOIN classifications cl ON r.classification_id = cl.id
+        """
+        if enabled_only:
+            query += " WHERE r.enabled = 1"
+        query += " ORDER BY r.priority, r.id"
+        self.cursor.execute(query)
+
+        results = []
+        for row in self.cursor.fetchall():
+            rule = dict(zip(('id',) + RULE_FIELDS, row[:12]))
+            rule['enabled'] = bool(rule['enabled'])
+            rule['source_account_name'] = row[12]
+            rule['counterpart_account_name'] = row[13]
+            rule['classification_name'] = row[14]
+            results.append(rule)
+        return results
+
+    def get_rule_by_id(self, rule_id):
+        return next((rule for rule in self.get_all_rules() if rule['id'] == rule_id), None)
+
+    @writes_tables('categorization_rules')
+    def insert_rule(self, **fields):
+        """Insert a rule from keyword arguments named as in RULE_FIELDS; returns its id"""
+        columns = [field for field in RULE_FIELDS if field in fields]
+        self.cursor.execute(
+            f"INSERT INTO categorization_rules ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [fields[column] for column in columns])
+        self.conn.commit()
+        row_id = self.cursor.lastrowid
+        self.notify_change('categorization_rules', 'insert', row_id)
+        return row_id
+
+    @writes_tables('categorization_rules')
+    def update_rule(self, rule_id, **fields):
+        """Update the given RULE_FIELDS of a rule"""
+        columns = [field for field in RULE_FIELDS if field in fields]
+        if not columns:
+            return
+        self.cursor.execute(
+            f"UPDATE categorization_rules SET {', '.join(f'{column} = ?' for column in columns)} WHERE id = ?",
+            [fields[column] for column in columns] + [rule_id])
+        self.conn.commit()
+        self.notify_change('categorization_rules', 'update', rule_id)
+
+    @writes_tables('categorization_rules')
+    def delete_rule(self, rule_id):
+        self.cursor.execute("DELETE FROM categorization_rules WHERE id = ?", (rule_id,))
+        self.conn.commit()
+        self.notify_change('categorization_rules', 'delete', rule_id)
+
+    def get_filter_profiles(self, target_entity=None):
+        """Saved filter profiles, optionally only those for target_entity, as dicts ordered by name"""
+        query = "SELECT id, name, target_entity, is_default FROM filter_profiles"
+        params = ()
+        if target_entity:
+            query += " WHERE target_entity = ?"
+            params = (target_entity,)
+        self.cursor.execute(query + " ORDER BY name COLLATE NOCASE", params)
+        return [{'id': row[0], 'name': row[1], 'target_entity': row[2], 'is_default': bool(row[3])}
+                for row in self.cursor.fetchall()]
+
+    def get_filter_profile(self, profile_id):
+        """A filter profile with its criteria (field_name, operator, value dicts), or None"""
+        self.cursor.execute("SELECT id, name, target_entity, is_default FROM filter_profiles WHERE id = ?",
+                            (profile_id,))
+        row = self.cursor.fetchone()
+        if row is None:
+            return None
+        self.cursor.execute("SELECT field_name, operator, value FROM filter_criteria WHERE profile_id = ? ORDER BY id",
+                            (profile_id,))
+        criteria = [{'field_name': field_name, 'operator': operator, 'value': decode_value(value)}
+                    for field_name, operator, value in self.cursor.fetchall()]
+        return {'id': row[0], 'name': row[1], 'target_entity': row[2], 'is_default': bool(row[3]),
+                'criteria': criteria}
+
+    @writes_tables('filter_profiles', 'filter_criteria')
+    def save_filter_profile(self, name, target_entity, criteria, profile_id=None, is_default=False):
+        """
+        Insert a filter profile, or replace the name and criteria of profile_id, in one
+        commit; returns its id. The criteria are compiled first, so a profile that
+        would not compile (see filter_profiles.compile_criteria) raises ValueError unsaved.
+        """
+        compile_criteria(target_entity, criteria)
+        try:
+            if is_default:
+                self.cursor.execute("UPDATE filter_profiles SET is_default = 0 WHERE target_entity = ?",
+                                    (target_entity,))
+            if profile_id is None:
+                self.cursor.execute("INSERT INTO filter_profiles (name, target_entity, is_default) VALUES (?, ?, ?)",
+                                    (name, target_entity, int(is_default)))
+                profile_id = self.cursor.lastrowid
+                operation = 'insert'
+            else:
+                self.cursor.execute("UPDATE filter_profiles SET name = ?, target_entity = ?, is_default = ? "
+                                    "WHERE id = ?", (name, target_entity, int(is_default), profile_id))
+                self.cursor.execute("DELETE FROM filter_criteria WHERE profile_id = ?", (profile_id,))
+                operation = 'update'
+            self.cursor.executemany(
+                "INSERT INTO filter_criteria (profile_id, field_name, operator, value) VALUES (?, ?, ?, ?)",
+                [(profile_id, criterion['field_name'], criterion['operator'], encode_value(criterion.get('value')))
+                 for criterion in criteria])
+            self.conn.commit()
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.notify_change('filter_profiles', operation, profile_id)
+        return profile_id
+
+    @writes_tables('filter_profiles', 'filter_criteria')
+    def delete_filter_profile(self, profile_id):
+        # Foreign keys are not enforced, so the criteria are deleted here rather than by the cascade
+        self.cursor.execute("DELETE FROM filter_criteria WHERE profile_id = ?", (profile_id,))
+        self.cursor.execute("DELETE FROM filter_profiles WHERE id = ?", (profile_id,))
+        self.conn.commit()
+        self.notify_change('filter_profiles', 'delete', profile_id)
+
+    @writes_tables('transactions', 'transaction_lines', 'orphan_transaction_lines')
+    def post_rule_matches(self, matches, default_date=None):
+        """
+        Create one balanced transaction per (orphan line, rule) pair: the orphan line on its
+        own account and the opposite amount on the rule's counterpart account, classified
+        with the rule's classification. The orphan lines are marked consumed. Everything is
+        written in one database transaction. Returns the new transaction ids.
+
+        Orphan lines carry no currency, so a transaction takes the default currency of the
+        line's account, or else of the counterpart account (see rule_match_currency_id).
+        Raises ValueError, posting nothing, if a match has neither.
+        """
+        default_date = default_date or datetime.datetime.now().strftime("%Y-%m-%d")
+        currency_ids = [self.rule_match_currency_id(line, rule) for line, rule in matches]
+        missing = [line['id'] for (line, rule), currency_id in zip(matches, currency_ids) if currency_id is None]
+        if missing:
+            raise ValueError(f"No currency for orphan lines {', '.join(map(str, missing))}: "
+                             "neither their account nor the rule's counterpart account has a default currency")
+
+        try:
+            self.begin_transaction()
+            transaction_ids = []
+            line_rows = []
+            consumed_rows = []
+            for (line, rule), currency_id in zip(matches, currency_ids):
+                self.cursor.execute("INSERT INTO transactions (description, currency_id) VALUES (?, ?)",
+                                    (line['description'], currency_id))
+                transaction_id = self.cursor.lastrowid
+                transaction_ids.append(transaction_id)
+
+                date = line.get('date') or default_date
+                debit = line['debit'] or None
+                credit = line['credit'] or None
+                line_rows.append((transaction_id, line['account_id'], debit, credit, date, None))
+                line_rows.append((transaction_id, rule['counterpart_account_id'], credit, debit, date,
+                                  rule['classification_id']))
+                consumed_rows.append((transaction_id, line['id']))
+
+            self.cursor.executemany("""
+                INSERT INTO transaction_lines (transaction_id, account_id, debit, credit, date, classification_id)
+                VALUES (?, ?, ?, ?, ?, ?)
+            """, line_rows)
+            self.cursor.executemany("""
+                UPDATE orphan_transaction_lines SET status = 'consumed', transaction_id = ?
+                WHERE id = ? AND status = 'new'
+            """, consumed_rows)
+            if self.cursor.rowcount != len(consumed_rows):
+                raise ValueError("Some orphan lines were processed in the meantime")
+
+            for transaction_id in transaction_ids:
+                self.notify_change('transactions', 'insert', transaction_id)
+            self.commit_transaction()
+            return transaction_ids
+
+        except Exception as e:
+            self.rollback_transaction()
+            raise e
+
+    def rule_match_currency_id(self, line, rule):
+        """Currency of the transaction posted for an orphan line matched by rule, or None if unknown"""
+        return (self.refs.account_currency_id(line['account_id'])
+                or self.refs.account_currency_id(rule['counterpart_account_id']))
+
+    @writes_tables('orphan_transactions')
     def update_orphan_transaction_status(self, orphan_transaction_id, status):
         """Update the status of an orphan transaction"""
         if status not in ('new', 'processed', 'ignored'):
@@ -979,6 +2417,7 @@ class Database:
         )
         self.conn.commit()
 
+    @writes_tables('orphan_transaction_lines')
     def update_orphan_line_status(self, orphan_line_id, status):
         """Update the status of an orphan transaction line"""
         if status not in ('new', 'consumed', 'ignored'):
@@ -990,37 +2429,37 @@ class Database:
         )
         self.conn.commit()
 
-        def filter_accounts(self, category_filter=None, name_filter=None, nature_filter=None, term_filter=None):
-            """Filter accounts by category, name, nature, and/or term"""
-            query = """
-                SELECT a.id, a.name, c.name as category, cu.name as currency, a.nature, a.term
-                FROM accounts a
-                JOIN cat c ON a.cat_id = c.id
-                LEFT JOIN currency cu ON a.default_currency_id = cu.id
-                WHERE 1=1
-            """
-            params = []
+    def filter_accounts(self, category_filter=None, name_filter=None, nature_filter=None, term_filter=None):
+        """Filter accounts by category, name, nature, and/or term"""
+        query = """
+            SELECT a.id, a.name, c.name as category, cu.name as currency, a.nature, a.term
+            FROM accounts a
+            JOIN cat c ON a.cat_id = c.id
+            LEFT JOIN currency cu ON a.default_currency_id = cu.id
+            WHERE 1=1
+        """
+        params = []
 
-            if category_filter:
-                query += " AND c.name = ?"
-                params.append(category_filter)
+        if category_filter:
+            query += " AND c.name = ?"
+            params.append(category_filter)
 
-            if name_filter:
-                query += " AND a.name LIKE ?"
-                params.append(f"%{name_filter}%")
+        if name_filter:
+            query += " AND a.name LIKE ?"
+            params.append(f"%{name_filter}%")
 
-            if nature_filter:
-                query += " AND a.nature = ?"
-                params.append(nature_filter)
+        if nature_filter:
+            query += " AND a.nature = ?"
+            params.append(nature_filter)
 
-            if term_filter:
-                query += " AND a.term = ?"
-                params.append(term_filter)
+        if term_filter:
+            query += " AND a.term = ?"
+            params.append(term_filter)
 
-            query += " ORDER BY a.name"
+        query += " ORDER BY a.name"
 
-            self.cursor.execute(query, params)
-            return self.cursor.fetchall()
+        self.cursor.execute(query, params)
+        return self.cursor.fetchall()
 
     def execute_query(self, query, params=()):
         """Execute a custom SQL query with parameters"""
@@ -1049,12 +2488,24 @@ class Database:
             }
         return None
 
-# Initialize the database
-db = Database('finance.db')
+def default_database():
+    """The application's Database on finance.db, opened on first use"""
+    if 'db' not in globals():
+        globals()['db'] = Database('finance.db')
+    return globals()['db']
+
+
+def __getattr__(name):
+    # db is created when first imported or used rather than when the module is, so the
+    # command line and other Qt-free modules can import this one without opening finance.db
+    if name == 'db':
+        return default_database()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 
 def get_counterpart_suggestions(description, amount, is_credit):
     """Get more intelligent counterpart account suggestions"""
+    db = default_database()
     suggestions = []
 
     # 1. Exact match by description (case insensitive)
@@ -1108,13 +2559,16 @@ def get_counterpart_suggestions(description, amount, is_credit):
                 })
 
     # 3. Match by amount range (similar transaction amounts)
+    # The IN subquery lets SQLite range-scan idx_transaction_lines_credit_amount instead of
+    # walking every debit line and probing its transaction
     amount_matches = db.execute_query("""
         SELECT a.id, a.name, COUNT(*) as count
-        FROM transactions t
-        JOIN transaction_lines tl1 ON t.id = tl1.transaction_id
-        JOIN transaction_lines tl2 ON t.id = tl2.transaction_id
+        FROM transaction_lines tl2
         JOIN accounts a ON tl2.account_id = a.id
-        WHERE tl1.credit BETWEEN ? AND ?
+        WHERE tl2.transaction_id IN (
+            SELECT transaction_id FROM transaction_lines
+            WHERE credit > 0 AND credit BETWEEN ? AND ?
+        )
         AND tl2.debit IS NOT NULL AND tl2.debit > 0
         GROUP BY a.id
         ORDER BY count DESC
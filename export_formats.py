@@ -0,0 +1,331 @@
+"""
+File writers for exports, kept free of Qt so the command-line tools can use them.
+
+Every writer takes sheets as a list of (title, headers, rows) where rows is any iterator,
+and consumes the rows as it writes them. export_query_sheets() streams query results into
+one of them through a separate read-only connection.
+"""
+import os
+import csv
+import datetime
+import itertools
+
+def write_csv_sheets(file_path, sheets, buffer_size=1024 * 1024):
+    """Write the first (title, headers, rows) sheet to a CSV file through a large write buffer"""
+    title, headers, rows = sheets[0]
+    with open(file_path, 'w', newline='', encoding='utf-8', buffering=buffer_size) as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(headers)
+        writer.writerows(["" if value is None else value for value in row] for row in rows)
+
+
+# Excel column widths are estimated from this many leading rows of each sheet
+EXCEL_WIDTH_SAMPLE_ROWS = 200
+EXCEL_MAX_COLUMN_WIDTH = 60
+
+
+def write_excel_sheets(file_path, sheets):
+    """
+    Write (title, headers, rows) sheets to an .xlsx file with openpyxl's write-only
+    workbook. Rows are consumed from their iterators and written out as they come;
+    only the first EXCEL_WIDTH_SAMPLE_ROWS of each sheet are held to size its columns.
+    """
+    from openpyxl import Workbook
+    from openpyxl.cell import WriteOnlyCell
+    from openpyxl.styles import Font
+    from openpyxl.utils import get_column_letter
+
+    wb = Workbook(write_only=True)
+    bold = Font(bold=True)
+
+    for title, headers, rows in sheets:
+        ws = wb.create_sheet(title=title[:31])  # Excel limits sheet names to 31 characters
+        rows = iter(rows)
+        sample = list(itertools.islice(rows, EXCEL_WIDTH_SAMPLE_ROWS))
+
+        # Column widths have to be set before the first row is written in write-only mode
+        for column, header in enumerate(headers):
+            lengths = [len(str(header))]
+            for row in sample:
+                value = row[column]
+                if value is not None:
+                    # Multi-line cells (account summaries) are as wide as their longest line
+                    lengths.append(max(len(line) for line in str(value).split('\n')))
+            ws.column_dimensions[get_column_letter(column + 1)].width = min(max(lengths) + 2,
+                                                                           EXCEL_MAX_COLUMN_WIDTH)
+        ws.freeze_panes = 'A2'
+
+        header_cells = []
+        for header in headers:
+            cell = WriteOnlyCell(ws, value=header)
+            cell.font = bold
+            header_cells.append(cell)
+        ws.append(header_cells)
+
+        for row in itertools.chain(sample, rows):
+            ws.append(["" if value is None else value for value in row])
+
+    wb.save(file_path)
+
+# PDF tables are laid out in chunks of this many rows, each a separate table with the header repeated
+PDF_CHUNK_ROWS = 50
+# Column widths and orientation are estimated from this many leading rows
+PDF_WIDTH_SAMPLE_ROWS = 200
+# Columns whose text is wrapped into paragraphs
+PDF_WRAP_COLUMNS = ('Credit Accounts', 'Debit Accounts', 'Description', 'Classifications')
+
+
+def write_pdf_sheets(file_path, sheets):
+    """Write the first (title, headers, rows) sheet as a PDF document titled after the sheet"""
+    title, headers, rows = sheets[0]
+    write_pdf_document(file_path, title, headers, rows)
+
+
+def write_pdf_document(file_path, title, headers, rows, chunk_rows=PDF_CHUNK_ROWS):
+    """
+    Render rows (any iterator) as a paged PDF table. Widths, alignment and orientation
+    come from the first PDF_WIDTH_SAMPLE_ROWS rows; the rest is laid out chunk_rows at a
+    time, so memory and layout cost stay proportional to one chunk.
+    """
+    from xml.sax.saxutils import escape
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.pdfbase.pdfmetrics import stringWidth
+    from reportlab.platypus import Table, TableStyle, Paragraph, Spacer
+    from reportlab.platypus.doctemplate import PageTemplate, BaseDocTemplate
+    from reportlab.platypus.frames import Frame
+
+    # Get current date and time for the report
+    current_time = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+    rows = iter(rows)
+    sample = list(itertools.islice(rows, PDF_WIDTH_SAMPLE_ROWS))
+    columns = len(headers)
+
+    styles = getSampleStyleSheet()
+
+    # Create a paragraph style for cells that allows wrapping
+    cell_style = ParagraphStyle(
+        'CellStyle',
+        parent=styles['Normal'],
+        wordWrap='CJK',  # Use CJK wrapping for better results
+        leading=12  # Space between lines
+    )
+
+    # Create header style that prevents wrapping
+    header_style = ParagraphStyle(
+        'HeaderStyle',
+        parent=styles['Normal'],
+        fontName='Helvetica-Bold',
+        wordWrap='LO',  # 'LO' ensures it doesn't wrap
+        alignment=1,  # Center alignment
+        leading=14
+    )
+
+    header_row = [Paragraph(f"<b>{escape(str(header))}</b>", header_style) for header in headers]
+    wrap_columns = [header in PDF_WRAP_COLUMNS for header in headers]
+
+    # Initialize column widths with minimum widths needed for headers
+    col_max_widths = []
+    for header in headers:
+        # Shorter headers need proportionally more padding to keep from wrapping
+        header_len = len(str(header))
+        if header_len <= 10:
+            min_width = header_len * 0.15 * inch + 0.5 * inch
+        else:
+            min_width = header_len * 0.12 * inch + 0.3 * inch
+        col_max_widths.append(min_width)
+
+    # Let the sampled content widen columns, and find the numeric ones for right alignment
+    numeric_columns = [True] * columns
+    for row in sample:
+        for column in range(columns):
+            text = "" if row[column] is None else str(row[column])
+            if text and not is_numeric(text):
+                numeric_columns[column] = False
+            if wrap_columns[column]:
+                max_line_length = max(len(line) for line in text.split('\n'))
+                content_width = max_line_length * 0.1 * inch
+            else:
+                content_width = len(text) * 0.12 * inch + 0.1 * inch
+            col_max_widths[column] = max(col_max_widths[column], content_width)
+
+    # Use landscape if content is too wide for portrait A4 (8.27 inches wide, less margins)
+    total_estimated_width = sum(col_max_widths) + (0.2 * inch * columns)
+    use_landscape = total_estimated_width > 8.27 * 0.8 * inch
+    page_size = landscape(A4) if use_landscape else A4
+
+    # Create a custom document template with header and footer
+    class PagedDocTemplate(BaseDocTemplate):
+        def __init__(self, filename, **kw):
+            BaseDocTemplate.__init__(self, filename, **kw)
+            template = PageTemplate('normal', [Frame(
+                self.leftMargin, self.bottomMargin, self.width, self.height, id='normal'
+            )])
+            self.addPageTemplates([template])
+
+        def afterPage(self):
+            self.canv.saveState()
+            # Add footer with page numbers and timestamp
+            self.canv.setFont('Helvetica', 8)
+            footer_text = f"Page {self.canv.getPageNumber()} - Generated: {current_time}"
+            self.canv.drawRightString(self.width + self.leftMargin, 0.5 * inch, footer_text)
+            self.canv.restoreState()
+
+        def build_streamed(self, flowables):
+            """
+            Like build(), but takes flowables from an iterator one at a time. Each goes
+            through handle_flowable() in its own list, which also holds the parts a table
+            is split into at page breaks, so finished chunks can be freed as it goes.
+            """
+            # Mirrors the body of BaseDocTemplate.build() and relies on its internals
+            # (_startBuild, clean_hanging, handle_flowable, _endBuild, canv._doctemplate), as
+            # of reportlab 5.0.1; check it against build() when upgrading reportlab
+            self._startBuild()
+            self.canv._doctemplate = self
+            try:
+                for flowable in flowables:
+                    pending = [flowable]
+                    while pending:
+                        self.clean_hanging()
+                        self.handle_flowable(pending)
+            finally:
+                del self.canv._doctemplate
+            self._endBuild()
+
+    doc = PagedDocTemplate(
+        file_path,
+        pagesize=page_size,
+        rightMargin=0.5 * inch,
+        leftMargin=0.5 * inch,
+        topMargin=0.75 * inch,
+        bottomMargin=0.75 * inch
+    )
+
+    # Fit the estimated widths to the page
+    col_widths = [max(width, 0.4 * inch) for width in col_max_widths]
+    total_width = sum(col_widths)
+    if total_width > doc.width:
+        scale = doc.width / total_width
+        col_widths = [w * scale for w in col_widths]
+
+    style_commands = [
+        # Header formatting
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.black),
+        ('ALIGN', (0, 0), (-1, 0), 'CENTER'),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 8),
+        ('TOPPADDING', (0, 0), (-1, 0), 8),
+
+        # Body formatting
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 9),
+        ('BOTTOMPADDING', (0, 1), (-1, -1), 6),
+        ('TOPPADDING', (0, 1), (-1, -1), 6),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),  # Align text to top for better wrapping
+
+        # Table grid
+        ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+
+        # Zebra stripes for rows
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.whitesmoke, colors.white]),
+    ]
+    # Right align numeric columns
+    for column in range(columns):
+        if numeric_columns[column]:
+            style_commands.append(('ALIGN', (column, 1), (column, -1), 'RIGHT'))
+    table_style = TableStyle(style_commands)
+
+    # Paragraph wrapping is by far the slowest part of the layout, so cells whose lines
+    # already fit their column stay plain strings (Table draws their line breaks itself)
+    text_widths = [width - 12 for width in col_widths]  # less left/right cell padding
+
+    def make_cell(column, value):
+        text = "" if value is None else str(value)
+        if all(stringWidth(line, 'Helvetica', 9) <= text_widths[column] for line in text.split('\n')):
+            return text
+        if wrap_columns[column]:
+            return Paragraph(escape(text).replace('\n', '<br/>'), cell_style)
+        return Paragraph(escape(text), cell_style)
+
+    def flowables():
+        yield Paragraph(escape(title), styles['Title'])
+        yield Spacer(1, 0.25 * inch)
+        all_rows = itertools.chain(sample, rows)
+        while True:
+            chunk = list(itertools.islice(all_rows, chunk_rows))
+            if not chunk:
+                break
+            table_data = [header_row]
+            table_data.extend([make_cell(column, value) for column, value in enumerate(row)] for row in chunk)
+            table = Table(table_data, colWidths=col_widths, repeatRows=1)
+            table.setStyle(table_style)
+            yield table
+
+    doc.build_streamed(flowables())
+
+
+def is_numeric(text):
+    """Check if a string represents a numeric value"""
+    try:
+        float(text)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+
+# Rows fetched from an export query at a time
+EXPORT_BATCH_SIZE = 1000
+
+
+def sheet_writer(file_path):
+    """The write_*_sheets function for a file path's extension (CSV unless .xlsx or .pdf)"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension == '.xlsx':
+        return write_excel_sheets
+    if extension == '.pdf':
+        return write_pdf_sheets
+    return write_csv_sheets
+
+
+def query_rows(conn, query, params, batch_size=EXPORT_BATCH_SIZE, on_batch=None):
+    """Yield the rows of a query fetchmany() batch by batch, calling on_batch(count) after each batch"""
+    cursor = conn.execute(query, params)
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            break
+        yield from rows
+        if on_batch:
+            on_batch(len(rows))
+
+
+def export_query_sheets(database, sheets, file_path, progress=None):
+    """
+    Write the results of (title, headers, query, params) sheets to file_path in the format
+    its extension names, reading through a read-only connection of database. progress, if
+    given, is called with the running row count. Returns the number of rows written; a
+    partly written file is removed if the export fails.
+    """
+    written = [0]
+
+    def on_batch(count):
+        written[0] += count
+        if progress:
+            progress(written[0])
+
+    conn = database.open_reader()
+    try:
+        sheet_writer(file_path)(file_path, [(title, headers, query_rows(conn, query, params, on_batch=on_batch))
+                                            for title, headers, query, params in sheets])
+    except BaseException:
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+        raise
+    finally:
+        conn.close()
+    return written[0]
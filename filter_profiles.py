@@ -0,0 +1,224 @@
+"""
+Saved filter profiles: named views over the transactions or accounts lists, stored as
+field_name / operator / value rows in filter_criteria.
+
+compile_criteria() turns a profile's criteria into one parameterized SQL predicate. For
+transactions the predicate is over the transaction lines (alias tl) and goes into the
+filter_params dict the transactions page and journal queries already take, so a saved view
+runs as the same single query as a filter from the dialog. FilterProfiles keeps each
+profile's compiled predicate and its result count, both rebuilt only after a write to the
+tables they depend on (see Database.data_version).
+"""
+import json
+
+from journal_queries import lines_source, transaction_count_query
+
+FILTER_ENTITIES = ('transactions', 'accounts')
+
+# field name: (SQL with a {condition} placeholder, value type). Transaction fields are
+# tested per line; description and currency belong to the line's transaction.
+TRANSACTION_FILTER_FIELDS = {
+    'date': ("tl.date {condition}", str),
+    'account_id': ("tl.account_id {condition}", int),
+    'classification_id': ("tl.classification_id {condition}", int),
+    'debit': ("tl.debit {condition}", float),
+    'credit': ("tl.credit {condition}", float),
+    'description': ("tl.transaction_id IN (SELECT id FROM transactions WHERE description {condition})", str),
+    'currency_id': ("tl.transaction_id IN (SELECT id FROM transactions WHERE currency_id {condition})", int),
+}
+
+# Over the accounts query of ACCOUNT_PROFILE_QUERY (accounts a, cat c, currency cu)
+ACCOUNT_FILTER_FIELDS = {
+    'name': ("a.name {condition}", str),
+    'category': ("c.name {condition}", str),
+    'category_id': ("a.cat_id {condition}", int),
+    'currency': ("cu.name {condition}", str),
+    'nature': ("a.nature {condition}", str),
+    'term': ("a.term {condition}", str),
+}
+
+FILTER_FIELDS = {'transactions': TRANSACTION_FILTER_FIELDS, 'accounts': ACCOUNT_FILTER_FIELDS}
+
+# The amount of a transaction is the sum of its matching debit lines, so amount criteria
+# become the min_amount / max_amount filters the journal queries apply after grouping
+AMOUNT_OPERATORS = {'>=': ('min_amount',), '<=': ('max_amount',), 'between': ('min_amount', 'max_amount')}
+
+# operator: (condition, number of values: 1, 2 or None for a list, 0 for none)
+FILTER_OPERATORS = {
+    '=': ("= ?", 1),
+    '!=': ("!= ?", 1),
+    '<': ("< ?", 1),
+    '<=': ("<= ?", 1),
+    '>': ("> ?", 1),
+    '>=': (">= ?", 1),
+    'contains': ("LIKE ?", 1),
+    'starts_with': ("LIKE ?", 1),
+    'between': ("BETWEEN ? AND ?", 2),
+    'in': ("IN ({marks})", None),
+    'is_empty': ("IS NULL", 0),
+}
+
+ACCOUNT_PROFILE_QUERY = """
+    SELECT a.id, a.name, c.name as category, cu.name as currency, a.nature, a.term
+    FROM accounts a
+    JOIN cat c ON a.cat_id = c.id
+    LEFT JOIN currency cu ON a.default_currency_id = cu.id
+"""
+
+# Tables whose writes change a profile's results
+ENTITY_TABLES = {
+    'transactions': ('transactions', 'transaction_lines'),
+    'accounts': ('accounts', 'cat', 'currency'),
+}
+PROFILE_TABLES = ('filter_profiles', 'filter_criteria')
+
+
+def _values(field_name, operator, value, value_type):
+    """The bound values of one criterion, checked against the operator and converted to the field's type"""
+    arity = FILTER_OPERATORS[operator][1]
+    if arity == 0:
+        return []
+    values = value if isinstance(value, (list, tuple)) else [value]
+    if (arity is None and not values) or (arity is not None and len(values) != arity):
+        raise ValueError(f"{field_name} {operator} needs {arity or 'a list of'} value(s), got {value!r}")
+    try:
+        values = [value_type(item) for item in values]
+    except (TypeError, ValueError):
+        raise ValueError(f"{field_name} {operator}: {value!r} is not a {value_type.__name__}")
+    if operator == 'contains':
+        return [f"%{values[0]}%"]
+    if operator == 'starts_with':
+        return [f"{values[0]}%"]
+    return values
+
+
+def compile_criteria(target_entity, criteria):
+    """
+    Compile criteria (dicts with field_name, operator and value) into a dict with the
+    predicate (SQL, all criteria ANDed) and its params. For transactions the dict also
+    carries the date range the criteria imply (date_from / date_to, used to pick the year
+    archives) and the amount bounds (min_amount / max_amount), so it can be used as
+    filter_params. Raises ValueError for an unknown entity, field or operator, or a value
+    that does not fit.
+    """
+    if target_entity not in FILTER_FIELDS:
+        raise ValueError(f"Unknown filter target: {target_entity}")
+    fields = FILTER_FIELDS[target_entity]
+    clauses, params, compiled = [], [], {}
+    for criterion in criteria:
+        field_name, operator, value = criterion['field_name'], criterion['operator'], criterion.get('value')
+        if operator not in FILTER_OPERATORS:
+            raise ValueError(f"Unknown filter operator: {operator}")
+
+        if target_entity == 'transactions' and field_name == 'amount':
+            if operator not in AMOUNT_OPERATORS:
+                raise ValueError(f"amount supports {', '.join(AMOUNT_OPERATORS)}, not {operator}")
+            for key, amount in zip(AMOUNT_OPERATORS[operator], _values(field_name, operator, value, float)):
+                compiled[key] = amount
+            continue
+        if field_name not in fields:
+            raise ValueError(f"Unknown {target_entity} filter field: {field_name}")
+
+        template, value_type = fields[field_name]
+        values = _values(field_name, operator, value, value_type)
+        condition = FILTER_OPERATORS[operator][0].format(marks=", ".join("?" * len(values)))
+        clauses.append(template.format(condition=condition))
+        params.extend(values)
+
+        if field_name == 'date':
+            if operator in ('>=', '=', 'between'):
+                compiled['date_from'] = values[0]
+            if operator in ('<=', '=', 'between'):
+                compiled['date_to'] = values[-1]
+
+    compiled['predicate'] = " AND ".join(clauses) if clauses else "1"
+    compiled['predicate_params'] = params
+    return compiled
+
+
+def criteria_from_filter_params(filter_params):
+    """The criteria of a profile saving a transactions filter from the filter dialog"""
+    criteria = []
+    for key, field_name, operator in (('date_from', 'date', '>='), ('date_to', 'date', '<='),
+                                      ('account_id', 'account_id', '='), ('description', 'description', 'contains'),
+                                      ('min_amount', 'amount', '>='), ('max_amount', 'amount', '<=')):
+        if (filter_params or {}).get(key) is not None:
+            criteria.append({'field_name': field_name, 'operator': operator, 'value': filter_params[key]})
+    return criteria
+
+
+def account_matches(database, compiled, account_id):
+    """Whether account_id is among the accounts selected by compile_criteria('accounts', ...) output"""
+    query = f"SELECT 1 FROM ({ACCOUNT_PROFILE_QUERY} WHERE a.id = ? AND ({compiled['predicate']}))"
+    return bool(database.execute_query(query, [account_id, *compiled['predicate_params']]))
+
+
+def encode_value(value):
+    """A criterion value as stored in filter_criteria.value"""
+    return json.dumps(value)
+
+
+def decode_value(text):
+    """A stored criterion value back as a string, number, list or None"""
+    return json.loads(text) if text is not None else None
+
+
+class FilterProfiles:
+    """
+    Compiled profiles and their result counts for one Database. A compiled profile is kept
+    until a profile is saved or deleted; a count until then or a write to the tables its
+    results come from.
+    """
+
+    def __init__(self, database):
+        self.database = database
+        self._compiled = {}
+        self._counts = {}
+
+    def compiled(self, profile_id):
+        """(target_entity, compile_criteria() result) of a saved profile"""
+        version = self.database.data_version(*PROFILE_TABLES)
+        entry = self._compiled.get(profile_id)
+        if entry is None or entry[0] != version:
+            profile = self.database.get_filter_profile(profile_id)
+            if profile is None:
+                raise ValueError(f"No filter profile {profile_id}")
+            entry = (version, profile['target_entity'],
+                     compile_criteria(profile['target_entity'], profile['criteria']))
+            self._compiled[profile_id] = entry
+        return entry[1], entry[2]
+
+    def filter_params(self, profile_id):
+        """The transactions filter_params of a transactions profile"""
+        target_entity, compiled = self.compiled(profile_id)
+        if target_entity != 'transactions':
+            raise ValueError(f"Filter profile {profile_id} is for {target_entity}, not transactions")
+        return dict(compiled, profile_id=profile_id)
+
+    def accounts(self, profile_id):
+        """The rows of an accounts profile, as Database.filter_accounts() returns them"""
+        target_entity, compiled = self.compiled(profile_id)
+        if target_entity != 'accounts':
+            raise ValueError(f"Filter profile {profile_id} is for {target_entity}, not accounts")
+        return self.database.execute_query(f"{ACCOUNT_PROFILE_QUERY} WHERE {compiled['predicate']} ORDER BY a.name",
+                                           compiled['predicate_params'])
+
+    def count(self, profile_id):
+        """How many transactions or accounts a profile selects"""
+        target_entity, compiled = self.compiled(profile_id)
+        version = self.database.data_version(*PROFILE_TABLES, *ENTITY_TABLES[target_entity])
+        entry = self._counts.get(profile_id)
+        if entry is not None and entry[0] == version:
+            return entry[1]
+        if target_entity == 'transactions':
+            query, params = transaction_count_query(compiled, lines_source(self.database, compiled))
+        else:
+            query = f"SELECT COUNT(*) FROM ({ACCOUNT_PROFILE_QUERY} WHERE {compiled['predicate']})"
+            params = compiled['predicate_params']
+        count = self.database.execute_query(query, params)[0][0]
+        self._counts[profile_id] = (version, count)
+        return count
+
+    def clear(self):
+        self._compiled.clear()
+        self._counts.clear()
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+from PyQt5.QtWidgets import QMessageBox
+from PyQt5.QtCore import QThread, pyqtSignal
+from backup import create_snapshot, format_backup_report, BACKUP_DIRECTORY, BACKUP_KEEP
+
+
+class BackupWorker(QThread):
+    """Write one snapshot of the database with create_snapshot() off the UI thread"""
+    progress = pyqtSignal(int, int)
+    failed = pyqtSignal(str)
+    done = pyqtSignal(dict)
+
+    def __init__(self, db_name, directory=BACKUP_DIRECTORY, keep=BACKUP_KEEP):
+        super().__init__()
+        self.db_name = db_name
+        self.directory = directory
+        self.keep = keep
+
+    def run(self):
+        try:
+            report = create_snapshot(self.db_name, self.directory, self.keep,
+                                     progress=lambda done, total: self.progress.emit(done, total))
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.done.emit(report)
+
+
+def back_up_now(window, config):
+    """
+    Start a backup of window.database in the background, reporting progress in the status
+    bar and the result in a message box. Only one backup runs at a time.
+    """
+    worker = getattr(window, 'backup_worker', None)
+    if worker is not None and worker.isRunning():
+        QMessageBox.information(window, "Backup", "A backup is already running.")
+        return
+
+    # The snapshot is taken from the file, so it must have the working copy's latest writes
+    try:
+        window.database.flush()
+    except sqlite3.OperationalError as e:
+        QMessageBox.critical(window, "Backup Error", f"The backup cannot start: {e}")
+        return
+    directory = config.get('backup_directory') or BACKUP_DIRECTORY
+    worker = BackupWorker(window.database.db_name, directory, config.get('backup_keep', BACKUP_KEEP))
+    window.backup_worker = worker
+    status_bar = window.statusBar()
+
+    def on_progress(done, total):
+        status_bar.showMessage(f"Backing up... {done * 100 // total if total else 100}%")
+
+    def on_done(report):
+        status_bar.showMessage("Backup complete", 5000)
+        QMessageBox.information(window, "Backup",
+                                f"The database was backed up to {os.path.abspath(report['path'])}\n\n"
+                                + format_backup_report(report))
+
+    def on_failed(error):
+        status_bar.clearMessage()
+        QMessageBox.critical(window, "Backup Error", f"The backup failed: {error}")
+
+    worker.progress.connect(on_progress)
+    worker.done.connect(on_done)
+    worker.failed.connect(on_failed)
+    status_bar.showMessage("Backing up...")
+    worker.start()
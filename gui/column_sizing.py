@@ -0,0 +1,106 @@
+import json
+from PyQt5.QtCore import Qt
+
+CONFIG_FILE = 'config.json'
+CONFIG_KEY = 'column_widths'
+
+# How many rows are measured per column, however large the model is
+SAMPLE_ROWS = 60
+
+# Extra pixels around the text (cell margins and sort indicator slack)
+CELL_PADDING = 18
+CHECKBOX_WIDTH = 20
+MAX_COLUMN_WIDTH = 420
+
+# Widths per view key, loaded from config on first use: {view_key: {'shape': [...], 'widths': [...]}}
+_saved_widths = None
+
+
+def _load_saved_widths():
+    global _saved_widths
+    if _saved_widths is None:
+        try:
+            with open(CONFIG_FILE, 'r') as f:
+                _saved_widths = json.load(f).get(CONFIG_KEY, {})
+        except:
+            _saved_widths = {}
+    return _saved_widths
+
+
+def _store_widths(view_key, shape, widths):
+    """Remember widths for view_key and write just that config key back"""
+    saved = _load_saved_widths()
+    saved[view_key] = {'shape': shape, 'widths': widths}
+    try:
+        try:
+            with open(CONFIG_FILE, 'r') as f:
+                config = json.load(f)
+        except:
+            config = {}
+        config[CONFIG_KEY] = saved
+        with open(CONFIG_FILE, 'w') as f:
+            json.dump(config, f, indent=4)
+    except Exception as e:
+        print(f"Error saving column widths: {e}")
+
+
+def sample_rows(row_count, sample_size=SAMPLE_ROWS):
+    """Row numbers to measure: every row for small models, otherwise an even spread incl. first and last"""
+    if row_count <= sample_size:
+        return range(row_count)
+    step = (row_count - 1) / (sample_size - 1)
+    return sorted({round(i * step) for i in range(sample_size)})
+
+
+def _length_bucket(length):
+    """Coarse text length class, so widths are only re-measured when the data really changes shape"""
+    bucket = 4
+    while bucket < length and bucket < 256:
+        bucket *= 2
+    return bucket
+
+
+def fit_columns(table_view, view_key, sample_size=SAMPLE_ROWS):
+    """
+    Size the columns of table_view from a bounded sample of rows plus the header text.
+    Widths are cached per view_key in the config and reused while the column headers and
+    the sampled text lengths stay in the same shape, so most reloads do no text measuring.
+    """
+    model = table_view.model()
+    if model is None:
+        return
+    header = table_view.horizontalHeader()
+    column_count = model.columnCount()
+    rows = sample_rows(model.rowCount(), sample_size)
+
+    # Collect the sampled text once; lengths decide the shape, the text is measured only on a miss
+    texts = [[] for _ in range(column_count)]
+    checkable = [False] * column_count
+    for row in rows:
+        for col in range(column_count):
+            index = model.index(row, col)
+            value = model.data(index)
+            texts[col].append('' if value is None else str(value))
+            if model.flags(index) & Qt.ItemIsUserCheckable:
+                checkable[col] = True
+
+    labels = [str(model.headerData(col, Qt.Horizontal) or '') for col in range(column_count)]
+    shape = [labels, [_length_bucket(max(map(len, column), default=0)) for column in texts]]
+
+    cached = _load_saved_widths().get(view_key)
+    if cached and cached.get('shape') == shape:
+        widths = cached['widths']
+    else:
+        metrics = table_view.fontMetrics()
+        widths = []
+        for col in range(column_count):
+            # Only the longest few strings can decide the width
+            longest = sorted(set(texts[col]), key=len, reverse=True)[:5]
+            text_width = max((metrics.horizontalAdvance(text) for text in longest), default=0)
+            if checkable[col]:
+                text_width += CHECKBOX_WIDTH
+            widths.append(min(max(text_width + CELL_PADDING, header.sectionSizeHint(col)), MAX_COLUMN_WIDTH))
+        _store_widths(view_key, shape, widths)
+
+    for col, width in enumerate(widths):
+        header.resizeSection(col, width)
@@ -5,6 +5,10 @@ from PyQt5.QtCore import Qt, QSortFilterProxyModel, QSize
 from gui.dialog_utils import show_entity_dialog
 from database import db
 from gui.export_utils import export_table_data
+from gui.model_sync import source_model, track_rows, upsert_row, remove_row, select_row_by_id, watch_tables
+from gui.column_sizing import fit_columns
+from gui.filter_profile_utils import add_saved_views
+from filter_profiles import compile_criteria, account_matches
 
 def get_selected_row_data(table_view):
     """Helper function to get data from selected row"""
@@ -120,9 +124,20 @@ def display_accounts(content_frame, toolbar):
     export_action.triggered.connect(
         lambda: export_accounts_data(content_frame, table_view))
 
-    # Load data
+    # Saved filter profiles, each shown with its cached account count
+    def apply_saved_view(profile_id):
+        accounts = db.filter_profiles.accounts(profile_id) if profile_id is not None else None
+        table_view.filter_criteria = db.get_filter_profile(profile_id)['criteria'] if profile_id is not None else []
+        load_accounts(table_view, accounts)
+        table_view.selectionModel().selectionChanged.connect(on_selection_changed)
+
+    table_view.saved_views = add_saved_views(content_frame, toolbar, actions_to_keep[0], table_view, 'accounts',
+                                             apply_saved_view, lambda: getattr(table_view, 'filter_criteria', []))
+
+    # Load data and keep it in step with later edits row by row
     load_accounts(table_view)
-    table_view.resizeColumnsToContents()
+    fit_columns(table_view, 'accounts')
+    watch_tables(table_view, ('accounts', 'cat', 'currency'), apply_account_changes)
 
     # Create a proper function to handle selection changes
     def on_selection_changed():
@@ -137,34 +152,44 @@ def display_accounts(content_frame, toolbar):
     remove_class_action.triggered.connect(
         lambda: unassign_classification(content_frame, table_view, class_table))
 
-def load_accounts(table_view):
+def make_account_row(account):
+    """Build the table row items for a get_all_accounts() row"""
+    account_id, name, category_name, currency_name, nature, term = account
+    currency_name = currency_name or ""
+    id_item = QStandardItem(str(account_id))
+    name_item = QStandardItem(name)
+    category_item = QStandardItem(category_name)
+    currency_item = QStandardItem(currency_name)
+    nature_item = QStandardItem(nature)
+    term_item = QStandardItem(term)
+
+    # Set alignment for the ID column
+    id_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+
+    # Set UserRole data for proper sorting
+    id_item.setData(int(account_id), Qt.UserRole)  # Sort ID as number
+    name_item.setData(name.lower(), Qt.UserRole)  # Sort name case-insensitive
+    category_item.setData(category_name.lower(), Qt.UserRole)  # Sort category case-insensitive
+    currency_item.setData(currency_name.lower(), Qt.UserRole)  # Sort currency case-insensitive
+    nature_item.setData(nature.lower(), Qt.UserRole)  # Sort nature case-insensitive
+    term_item.setData(term.lower(), Qt.UserRole)  # Sort term case-insensitive
+
+    return [id_item, name_item, category_item, currency_item, nature_item, term_item]
+
+
+def load_accounts(table_view, accounts=None):
+    """Show accounts (rows as get_all_accounts returns them), all accounts by default"""
     model = QStandardItemModel()
     model.setHorizontalHeaderLabels(["ID", "Name", "Category", "Currency", "Nature", "Term"])
 
     # Get accounts from database
-    accounts = db.get_all_accounts()
+    if accounts is None:
+        accounts = db.get_all_accounts()
 
     for account in accounts:
-        account_id, name, category_name, currency_name, nature, term = account
-        id_item = QStandardItem(str(account_id))
-        name_item = QStandardItem(name)
-        category_item = QStandardItem(category_name)
-        currency_item = QStandardItem(currency_name)
-        nature_item = QStandardItem(nature)
-        term_item = QStandardItem(term)
+        model.appendRow(make_account_row(account))
 
-        # Set alignment for the ID column
-        id_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-
-        # Set UserRole data for proper sorting
-        id_item.setData(int(account_id), Qt.UserRole)  # Sort ID as number
-        name_item.setData(name.lower(), Qt.UserRole)  # Sort name case-insensitive
-        category_item.setData(category_name.lower(), Qt.UserRole)  # Sort category case-insensitive
-        currency_item.setData(currency_name.lower(), Qt.UserRole)  # Sort currency case-insensitive
-        nature_item.setData(nature.lower(), Qt.UserRole)  # Sort nature case-insensitive
-        term_item.setData(term.lower(), Qt.UserRole)  # Sort term case-insensitive
-
-        model.appendRow([id_item, name_item, category_item, currency_item, nature_item, term_item])
+    track_rows(model)
 
     # Create proxy model for sorting
     proxy_model = QSortFilterProxyModel()
@@ -174,10 +199,36 @@ def load_accounts(table_view):
     # Set the proxy model to the table view
     table_view.setModel(proxy_model)
 
+
+def apply_account_changes(table_view, changes):
+    """Apply database change notifications to the accounts table one row at a time"""
+    model = source_model(table_view)
+    # Rows are only added or kept while they pass the filter or saved view shown
+    criteria = getattr(table_view, 'filter_criteria', None)
+    compiled = compile_criteria('accounts', criteria) if criteria else None
+    for table, operation, row_id, parent_id in changes:
+        if table == 'accounts':
+            account_ids = [row_id]
+        elif operation != 'insert':
+            # A renamed or removed category/currency changes the rows of the accounts using it
+            column = 'cat_id' if table == 'cat' else 'default_currency_id'
+            account_ids = [row[0] for row in db.execute_query(
+                f"SELECT id FROM accounts WHERE {column} = ?", (row_id,))]
+        else:
+            continue
+
+        for account_id in account_ids:
+            deleted = table == 'accounts' and operation == 'delete'
+            account = None if deleted else db.get_account_row(account_id)
+            if account and (compiled is None or account_matches(db, compiled, account_id)):
+                upsert_row(model, account_id, make_account_row(account))
+            else:
+                remove_row(model, account_id)
+
 def add_account(parent, table_view):
     # Get categories and currencies for dropdown
-    categories = [cat[1] for cat in db.get_all_categories()]
-    currencies = [curr[1] for curr in db.get_all_currencies()]
+    categories = list(db.refs.category_names())
+    currencies = db.refs.currency_names()
     nature_options = ["both", "debit", "credit"]
     term_options = ["undefined", "short term", "medium term", "long term"]
 
@@ -215,7 +266,7 @@ def add_account(parent, table_view):
                 due_day = data.get('due_day', 15)
                 db.insert_credit_card(account_id, credit_limit, close_day, due_day)
 
-            load_accounts(table_view)
+            select_row_by_id(table_view, account_id)
             QMessageBox.information(parent, "Success", "Account added successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to add account: {e}")
@@ -230,8 +281,8 @@ def edit_account(parent, table_view):
     is_credit_card = db.is_credit_card(account_id)
 
     # Get categories and currencies for dropdown
-    categories = [cat[1] for cat in db.get_all_categories()]
-    currencies = [curr[1] for curr in db.get_all_currencies()]
+    categories = list(db.refs.category_names())
+    currencies = db.refs.currency_names()
     nature_options = ["both", "debit", "credit"]
     term_options = ["undefined", "short term", "medium term", "long term"]
 
@@ -326,7 +377,6 @@ def edit_account(parent, table_view):
                 # Remove credit card properties if it's no longer a credit card
                 db.delete_credit_card(account_id)
 
-            load_accounts(table_view)
             QMessageBox.information(parent, "Success", "Account updated successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to update account: {e}")
@@ -363,7 +413,6 @@ def delete_account(parent, table_view):
             # Delete account (this should cascade to transaction_lines)
             db.delete_account(account_id)
 
-            load_accounts(table_view)
             QMessageBox.information(parent, "Success", "Account deleted successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to delete account: {e}")
@@ -383,7 +432,7 @@ def update_classifications_display(accounts_table, classifications_panel, class_
 
     # Load classifications for the selected account
     load_account_classifications(class_table, account_id)
-    class_table.resizeColumnsToContents()
+    fit_columns(class_table, 'account_classifications')
 
 def load_account_classifications(class_table, account_id):
     """Load classifications for the selected account into the table"""
@@ -420,7 +469,7 @@ def load_account_classifications(class_table, account_id):
 
 def filter_accounts(parent, table_view):
     # Get categories for filtering
-    categories = [cat[1] for cat in db.get_all_categories()]
+    categories = list(db.refs.category_names())
     categories.insert(0, "All Categories")
 
     # Add nature options for filtering
@@ -442,47 +491,23 @@ def filter_accounts(parent, table_view):
     data = show_entity_dialog(parent, "Filter Accounts", fields)
 
     if data:
-        model = QStandardItemModel()
-        model.setHorizontalHeaderLabels(["ID", "Name", "Category", "Currency", "Nature", "Term"])
-
         # Get accounts from database with potential filters
         category_filter = None if data.get('category_filter') == "All Categories" else data.get('category_filter')
         nature_filter = None if data.get('nature_filter') == "All" else data.get('nature_filter')
         term_filter = None if data.get('term_filter') == "All" else data.get('term_filter')
         name_filter = data.get('name_filter', '')
 
-        # You'll need to implement this method in your database class
-        accounts = db.filter_accounts(category_filter, name_filter, nature_filter, term_filter)
-
-        for account in accounts:
-            account_id, name, category_name, currency_name, nature, term = account
-            id_item = QStandardItem(str(account_id))
-            name_item = QStandardItem(name)
-            category_item = QStandardItem(category_name)
-            currency_item = QStandardItem(currency_name)
-            nature_item = QStandardItem(nature)
-            term_item = QStandardItem(term)
-
-            # Set alignment for the ID column
-            id_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-
-            # Set UserRole data for proper sorting
-            id_item.setData(int(account_id), Qt.UserRole)
-            name_item.setData(name.lower(), Qt.UserRole)
-            category_item.setData(category_name.lower(), Qt.UserRole)
-            currency_item.setData(currency_name.lower(), Qt.UserRole)
-            nature_item.setData(nature.lower(), Qt.UserRole)
-            term_item.setData(term.lower(), Qt.UserRole)
-
-            model.appendRow([id_item, name_item, category_item, currency_item, nature_item, term_item])
-
-        # Create proxy model for sorting
-        proxy_model = QSortFilterProxyModel()
-        proxy_model.setSourceModel(model)
-        proxy_model.setSortRole(Qt.UserRole)
+        # Kept as saved-view criteria for Save View
+        table_view.filter_criteria = [
+            {'field_name': field_name, 'operator': operator, 'value': value}
+            for field_name, operator, value in (('category', '=', category_filter), ('nature', '=', nature_filter),
+                                                ('term', '=', term_filter), ('name', 'contains', name_filter))
+            if value
+        ]
+        if hasattr(table_view, 'saved_views'):
+            table_view.saved_views.show_no_view()
 
-        # Set the proxy model to the table view
-        table_view.setModel(proxy_model)
+        load_accounts(table_view, db.filter_accounts(category_filter, name_filter, nature_filter, term_filter))
 
 def export_accounts_data(parent, table_view):
     """
@@ -552,7 +577,7 @@ def assign_classification(parent, accounts_table, class_table):
     account_id = int(row_data["ID"])
 
     # Get all classifications
-    all_classifications = db.get_all_classifications()
+    all_classifications = db.refs.classifications()
 
     # Get current classifications for this account
     current_classifications = db.get_classifications_for_account(account_id)
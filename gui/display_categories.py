@@ -3,6 +3,8 @@ from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon
 from PyQt5.QtCore import Qt, QSortFilterProxyModel
 from gui.dialog_utils import show_entity_dialog
 from database import db
+from gui.model_sync import source_model, track_rows, upsert_row, remove_row, select_row_by_id, watch_tables
+from gui.column_sizing import fit_columns
 
 
 def get_selected_row_data(table_view):
@@ -75,8 +77,9 @@ def display_categories(content_frame, toolbar):
     filter_action.triggered.connect(lambda: filter_categories(content_frame, table_view))
     export_action.triggered.connect(lambda: export_categories_data(content_frame, table_view))
 
-    # Load data
+    # Load data and keep it in step with later edits row by row
     load_categories(table_view)
+    watch_tables(table_view, ('cat',), apply_category_changes)
 
 
 def filter_categories(parent, table_view):
@@ -100,6 +103,14 @@ def export_categories_data(parent, table_view):
     # Export the data directly - categories table is simple enough to export as-is
     export_table_data(parent, table_view, "categories_export", "Categories List")
 
+def make_category_row(category):
+    """Build the table row items for a (id, name) category"""
+    cat_id, name = category
+    id_item = QStandardItem(str(cat_id))
+    name_item = QStandardItem(name)
+    return [id_item, name_item]
+
+
 def load_categories(table_view):
     model = QStandardItemModel()
     model.setHorizontalHeaderLabels(["ID", "Name"])
@@ -108,14 +119,24 @@ def load_categories(table_view):
     categories = db.get_all_categories()
 
     for category in categories:
-        cat_id, name = category
-        id_item = QStandardItem(str(cat_id))
-        name_item = QStandardItem(name)
-        model.appendRow([id_item, name_item])
+        model.appendRow(make_category_row(category))
 
     table_view.setModel(model)
+    track_rows(model)
+
+    fit_columns(table_view, 'categories')
+
 
-    table_view.resizeColumnsToContents()
+def apply_category_changes(table_view, changes):
+    """Apply database change notifications to the categories table one row at a time"""
+    model = source_model(table_view)
+    for table, operation, row_id, parent_id in changes:
+        if operation == 'delete':
+            remove_row(model, row_id)
+        else:
+            category = db.get_category_by_id(row_id)
+            if category:
+                upsert_row(model, row_id, make_category_row(category))
 
 
 def add_category(parent, table_view):
@@ -126,8 +147,8 @@ def add_category(parent, table_view):
     data = show_entity_dialog(parent, "Add Category", fields)
     if data:
         try:
-            db.insert_category(data['name'])
-            load_categories(table_view)
+            category_id = db.insert_category(data['name'])
+            select_row_by_id(table_view, category_id)
             QMessageBox.information(parent, "Success", "Category added successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to add category: {e}")
@@ -151,7 +172,6 @@ def edit_category(parent, table_view):
     if data:
         try:
             db.update_category(category_id, data['name'])
-            load_categories(table_view)
             QMessageBox.information(parent, "Success", "Category updated successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to update category: {e}")
@@ -176,7 +196,6 @@ def delete_category(parent, table_view):
     if reply == QMessageBox.Yes:
         try:
             db.delete_category(category_id)
-            load_categories(table_view)
             QMessageBox.information(parent, "Success", "Category deleted successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to delete category: {e}")
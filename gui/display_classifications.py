@@ -3,6 +3,8 @@ from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon
 from PyQt5.QtCore import Qt, QSortFilterProxyModel
 from gui.dialog_utils import show_entity_dialog
 from database import db
+from gui.model_sync import source_model, track_rows, upsert_row, remove_row, select_row_by_id, watch_tables
+from gui.column_sizing import fit_columns
 
 
 def get_selected_row_data(table_view):
@@ -78,6 +80,7 @@ def display_classifications(content_frame, toolbar):
 
     # Load data
     load_classifications(table_view)
+    watch_tables(table_view, ('classifications',), apply_classification_changes)
 
 def export_classifications_data(parent, table_view):
     """
@@ -95,6 +98,14 @@ def export_classifications_data(parent, table_view):
     export_table_data(parent, table_view, "classifications_export", "Classifications List")
 
 
+def make_classification_row(classification):
+    """Build the table row items for an (id, name) classification"""
+    class_id, name = classification
+    id_item = QStandardItem(str(class_id))
+    name_item = QStandardItem(name)
+    return [id_item, name_item]
+
+
 def load_classifications(table_view):
     model = QStandardItemModel()
     model.setHorizontalHeaderLabels(["ID", "Name"])
@@ -103,13 +114,23 @@ def load_classifications(table_view):
     classifications = db.get_all_classifications()
 
     for classification in classifications:
-        class_id, name = classification
-        id_item = QStandardItem(str(class_id))
-        name_item = QStandardItem(name)
-        model.appendRow([id_item, name_item])
+        model.appendRow(make_classification_row(classification))
 
     table_view.setModel(model)
-    table_view.resizeColumnsToContents()
+    track_rows(model)
+    fit_columns(table_view, 'classifications')
+
+
+def apply_classification_changes(table_view, changes):
+    """Apply database change notifications to the classifications table one row at a time"""
+    model = source_model(table_view)
+    for table, operation, row_id, parent_id in changes:
+        if operation == 'delete':
+            remove_row(model, row_id)
+        else:
+            classification = db.get_classification_by_id(row_id)
+            if classification:
+                upsert_row(model, row_id, make_classification_row(classification))
 
 
 def add_classification(parent, table_view):
@@ -120,8 +141,8 @@ def add_classification(parent, table_view):
     data = show_entity_dialog(parent, "Add Classification", fields)
     if data:
         try:
-            db.insert_classification(data['name'])
-            load_classifications(table_view)
+            classification_id = db.insert_classification(data['name'])
+            select_row_by_id(table_view, classification_id)
             QMessageBox.information(parent, "Success", "Classification added successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to add classification: {e}")
@@ -145,7 +166,6 @@ def edit_classification(parent, table_view):
     if data:
         try:
             db.update_classification(classification_id, data['name'])
-            load_classifications(table_view)
             QMessageBox.information(parent, "Success", "Classification updated successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to update classification: {e}")
@@ -170,7 +190,6 @@ def delete_classification(parent, table_view):
     if reply == QMessageBox.Yes:
         try:
             db.delete_classification(classification_id)
-            load_classifications(table_view)
             QMessageBox.information(parent, "Success", "Classification deleted successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to delete classification: {e}")
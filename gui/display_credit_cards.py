@@ -3,6 +3,7 @@ from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon
 from PyQt5.QtCore import Qt, QSortFilterProxyModel
 from gui.dialog_utils import show_entity_dialog
 from database import db
+from gui.column_sizing import fit_columns
 
 
 def get_selected_row_data(table_view):
@@ -134,11 +135,11 @@ def load_credit_cards(table_view):
 
     # Set the proxy model to the table view
     table_view.setModel(proxy_model)
-    table_view.resizeColumnsToContents()
+    fit_columns(table_view, 'credit_cards')
 
 def add_credit_card(parent, table_view):
     # Get currencies for dropdown
-    currencies = [curr[1] for curr in db.get_all_currencies()]
+    currencies = db.refs.currency_names()
 
     fields = [
         {'id': 'name', 'label': 'Credit Card Name', 'type': 'text', 'required': True},
@@ -193,7 +194,7 @@ def edit_credit_card(parent, table_view):
     account_details = db.get_account_details(account_id)
 
     # Get currencies for dropdown
-    currencies = [curr[1] for curr in db.get_all_currencies()]
+    currencies = db.refs.currency_names()
 
     fields = [
         {'id': 'name', 'label': 'Credit Card Name', 'type': 'text', 'required': True},
@@ -3,6 +3,8 @@ from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon
 from PyQt5.QtCore import Qt, QSortFilterProxyModel
 from gui.dialog_utils import show_entity_dialog
 from database import db
+from gui.model_sync import source_model, track_rows, upsert_row, remove_row, select_row_by_id, watch_tables
+from gui.column_sizing import fit_columns
 
 
 def get_selected_row_data(table_view):
@@ -78,6 +80,7 @@ def display_currencies(content_frame, toolbar):
 
     # Load data
     load_currencies(table_view)
+    watch_tables(table_view, ('currency',), apply_currency_changes)
 
 
 def export_currencies_data(parent, table_view):
@@ -95,6 +98,15 @@ def export_currencies_data(parent, table_view):
     # Export the data directly
     export_table_data(parent, table_view, "currencies_export", "Currencies List")
 
+def make_currency_row(currency):
+    """Build the table row items for an (id, name, exchange_rate) currency"""
+    currency_id, name, exchange_rate = currency
+    id_item = QStandardItem(str(currency_id))
+    name_item = QStandardItem(name)
+    rate_item = QStandardItem(str(exchange_rate))
+    return [id_item, name_item, rate_item]
+
+
 def load_currencies(table_view):
     model = QStandardItemModel()
     model.setHorizontalHeaderLabels(["ID", "Name", "Exchange Rate"])
@@ -103,14 +115,23 @@ def load_currencies(table_view):
     currencies = db.get_all_currencies()
 
     for currency in currencies:
-        currency_id, name, exchange_rate = currency
-        id_item = QStandardItem(str(currency_id))
-        name_item = QStandardItem(name)
-        rate_item = QStandardItem(str(exchange_rate))
-        model.appendRow([id_item, name_item, rate_item])
+        model.appendRow(make_currency_row(currency))
 
     table_view.setModel(model)
-    table_view.resizeColumnsToContents()
+    track_rows(model)
+    fit_columns(table_view, 'currencies')
+
+
+def apply_currency_changes(table_view, changes):
+    """Apply database change notifications to the currencies table one row at a time"""
+    model = source_model(table_view)
+    for table, operation, row_id, parent_id in changes:
+        if operation == 'delete':
+            remove_row(model, row_id)
+        else:
+            currency = db.get_currency_by_id(row_id)
+            if currency:
+                upsert_row(model, row_id, make_currency_row(currency))
 
 
 def add_currency(parent, table_view):
@@ -122,8 +143,8 @@ def add_currency(parent, table_view):
     data = show_entity_dialog(parent, "Add Currency", fields)
     if data:
         try:
-            db.insert_currency(data['name'], data['exchange_rate'])
-            load_currencies(table_view)
+            currency_id = db.insert_currency(data['name'], data['exchange_rate'])
+            select_row_by_id(table_view, currency_id)
             QMessageBox.information(parent, "Success", "Currency added successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to add currency: {e}")
@@ -152,7 +173,6 @@ def edit_currency(parent, table_view):
     if data:
         try:
             db.update_currency(currency_id, data['name'], data['exchange_rate'])
-            load_currencies(table_view)
             QMessageBox.information(parent, "Success", "Currency updated successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to update currency: {e}")
@@ -177,7 +197,6 @@ def delete_currency(parent, table_view):
     if reply == QMessageBox.Yes:
         try:
             db.delete_currency(currency_id)
-            load_currencies(table_view)
             QMessageBox.information(parent, "Success", "Currency deleted successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to delete currency: {e}")
@@ -1,12 +1,19 @@
 from PyQt5.QtWidgets import (
     QVBoxLayout, QHBoxLayout, QTableView, QAction, QMessageBox,
     QHeaderView, QWidget, QToolBar, QLabel, QPushButton, QDialog,
-    QSplitter, QFormLayout, QComboBox, QDateEdit, QFrame, QLineEdit, QGroupBox
+    QSplitter, QFormLayout, QComboBox, QDateEdit, QFrame, QLineEdit, QGroupBox,
+    QFileDialog, QProgressDialog, QApplication, QDialogButtonBox
 )
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon
 from PyQt5.QtCore import Qt, QDate
-from gui.import_utils import import_csv_wizard
+from gui.import_utils import import_csv_wizard, load_config, update_import_path
+from csv_import import import_csv_files, file_sha256
+from statement_formats import import_statement_file, STATEMENT_EXTENSIONS
+from categorization import apply_rules, compile_rules, format_rule_report
+from similarity import cluster_orphan_lines, cluster_label
 from database import db, get_counterpart_suggestions
+from gui.column_sizing import fit_columns
+import os
 import datetime
 
 
@@ -31,12 +38,18 @@ def display_orphan_transactions(content_frame, toolbar):
 
     # Add toolbar actions
     import_action = QAction(QIcon('icons/import.png'), "Import CSV", toolbar)
+    batch_import_action = QAction(QIcon('icons/import.png'), "Batch Import", toolbar)
+    statement_import_action = QAction(QIcon('icons/import.png'), "Import OFX/QIF", toolbar)
     process_action = QAction(QIcon('icons/process.png'), "Process Selected", toolbar)
+    rules_action = QAction(QIcon('icons/process.png'), "Apply Rules", toolbar)
     ignore_action = QAction(QIcon('icons/ignore.png'), "Ignore Selected", toolbar)
 
     # Add actions to toolbar
     toolbar.insertAction(actions_to_keep[0], import_action)
+    toolbar.insertAction(actions_to_keep[0], batch_import_action)
+    toolbar.insertAction(actions_to_keep[0], statement_import_action)
     toolbar.insertAction(actions_to_keep[0], process_action)
+    toolbar.insertAction(actions_to_keep[0], rules_action)
     toolbar.insertAction(actions_to_keep[0], ignore_action)
 
     # Create a splitter to divide the main transactions and details panels
@@ -83,7 +96,10 @@ def display_orphan_transactions(content_frame, toolbar):
 
     # Connect actions
     import_action.triggered.connect(lambda: on_import_csv(content_frame, orphan_table))
+    batch_import_action.triggered.connect(lambda: on_batch_import_csv(content_frame, orphan_table))
+    statement_import_action.triggered.connect(lambda: on_import_statement(content_frame, orphan_table))
     process_action.triggered.connect(lambda: on_process_selected(orphan_table, lines_table, content_frame))
+    rules_action.triggered.connect(lambda: on_apply_rules(orphan_table, lines_table, content_frame))
     ignore_action.triggered.connect(lambda: on_ignore_selected(orphan_table, lines_table))
 
     # Connect selection signal
@@ -121,19 +137,20 @@ def load_orphan_lines(table_view, orphan_transaction_id):
         return
 
     model = QStandardItemModel()
-    model.setHorizontalHeaderLabels(["ID", "Description", "Account", "Debit", "Credit", "Status", "Notes"])
+    model.setHorizontalHeaderLabels(["ID", "Date", "Description", "Account", "Debit", "Credit", "Status", "Notes"])
 
     lines = db.get_orphan_lines(orphan_transaction_id)
 
     for line in lines:
         row = [
             QStandardItem(str(line['id'])),
+            QStandardItem(line['date'] or ""),
             QStandardItem(line['description']),
             QStandardItem(line['account_name']),
             QStandardItem(f"${line['debit']:.2f}" if line['debit'] else ""),
             QStandardItem(f"${line['credit']:.2f}" if line['credit'] else ""),
             QStandardItem(line['status']),
-            QStandardItem(line.get('notes', ""))
+            QStandardItem(line['notes'] or "")
         ]
 
         # Apply styling based on status
@@ -150,7 +167,7 @@ def load_orphan_lines(table_view, orphan_transaction_id):
         model.appendRow(row)
 
     table_view.setModel(model)
-    table_view.resizeColumnsToContents()
+    fit_columns(table_view, 'orphan_lines')
 
 
 def edit_orphan_line(line_id, parent):
@@ -175,7 +192,7 @@ def edit_orphan_line(line_id, parent):
     account_combo = QComboBox()
     account_combo.addItem("(Not Selected)", None)
 
-    accounts = db.get_all_accounts()
+    accounts = db.refs.accounts()
     for account in accounts:
         account_combo.addItem(account[1], account[0])
 
@@ -328,24 +345,159 @@ def on_import_csv(parent, table_view):
                 table_view.selectRow(row)
                 break
 
+def on_batch_import_csv(parent, table_view):
+    """Import several CSV files at once, one orphan batch per file, with the last wizard mapping"""
+    config = load_config()
+    mapping = config.get('last_import_mapping')
+    if not mapping:
+        QMessageBox.information(parent, "Batch Import",
+                                "Import one file with the Import CSV wizard first; batch imports reuse "
+                                "its column mapping for files with the same layout.")
+        return
+
+    file_paths, _ = QFileDialog.getOpenFileNames(
+        parent, "Select CSV Files", config.get('last_import_path', ''), "CSV Files (*.csv);;All Files (*)")
+    if not file_paths:
+        return
+    update_import_path(os.path.dirname(file_paths[0]))
+
+    progress_dialog = QProgressDialog("Importing...", None, 0, len(file_paths), parent)
+    progress_dialog.setWindowTitle("Batch Import")
+    progress_dialog.setWindowModality(Qt.WindowModal)
+    progress_dialog.setMinimumDuration(0)
+
+    # Files are parsed in worker processes; each finished file is saved here as its own batch
+    report_lines = []
+    imported = 0
+    for done, report in enumerate(import_csv_files(db, file_paths, mapping), start=1):
+        name = os.path.basename(report['file'])
+        if report['failed']:
+            report_lines.append(f"{name}: failed - {report['failed']}")
+        else:
+            imported += report['orphan_id'] is not None
+            report_lines.append(f"{name}: {report['rows']} rows in {report['seconds']:.2f}s "
+                                f"({report['rows_per_second']:.0f} rows/s), {len(report['errors'])} errors, "
+                                f"{report['duplicates']} duplicates"
+                                + (f", batch #{report['orphan_id']}" if report['orphan_id'] else ", nothing imported")
+                                + (f", resumed after row {report['resumed_from']}" if report.get('resumed_from') else ""))
+            report_lines.extend(f"    {error}" for error in report['errors'][:5])
+        progress_dialog.setValue(done)
+        progress_dialog.setLabelText(f"Imported {name}")
+        QApplication.processEvents()
+    progress_dialog.close()
+
+    load_orphan_transactions(table_view)
+
+    message = QMessageBox(QMessageBox.Information, "Batch Import",
+                          f"Imported {imported} of {len(file_paths)} files as orphan transaction batches.",
+                          QMessageBox.Ok, parent)
+    message.setDetailedText("\n".join(report_lines))
+    message.exec_()
+
+
+def on_import_statement(parent, table_view):
+    """Import an OFX/QFX or QIF bank statement as one orphan batch"""
+    config = load_config()
+    extensions = ' '.join(f"*{extension}" for extension in STATEMENT_EXTENSIONS)
+    file_path, _ = QFileDialog.getOpenFileName(
+        parent, "Open Statement", config.get('last_import_path', ''),
+        f"Bank Statements ({extensions});;All Files (*)")
+    if not file_path:
+        return
+    update_import_path(os.path.dirname(file_path))
+
+    # Account and default currency for the statement's lines
+    dialog = QDialog(parent)
+    dialog.setWindowTitle("Import Statement")
+    form = QFormLayout(dialog)
+    account_combo = QComboBox()
+    account_combo.addItem("Account in file")
+    account_combo.addItems(db.refs.account_names())
+    currency_combo = QComboBox()
+    currency_combo.addItems(db.refs.currency_names())
+    last_mapping = config.get('last_import_mapping') or {}
+    if last_mapping.get('account'):
+        account_combo.setCurrentText(last_mapping['account'])
+    if last_mapping.get('currency'):
+        currency_combo.setCurrentText(last_mapping['currency'])
+    form.addRow("Account:", account_combo)
+    form.addRow("Default currency:", currency_combo)
+    buttons = QDialogButtonBox(QDialogButtonBox.Ok | QDialogButtonBox.Cancel)
+    buttons.accepted.connect(dialog.accept)
+    buttons.rejected.connect(dialog.reject)
+    form.addRow(buttons)
+    if dialog.exec_() != QDialog.Accepted:
+        return
+
+    mapping = {
+        'account': None if account_combo.currentIndex() == 0 else account_combo.currentText(),
+        'currency': currency_combo.currentText(),
+        'date_format': "Auto-detect",
+    }
+
+    try:
+        # An earlier import of this statement that stopped part way can continue from its checkpoint
+        resume = True
+        checkpoint = db.get_import_checkpoint(file_sha256(file_path))
+        if checkpoint:
+            answer = QMessageBox.question(
+                parent, "Resume Import",
+                f"An import of this statement stopped after {checkpoint['last_row']} transactions.\n\n"
+                f"Resume it? Choose No to discard the partial batch and start over.",
+                QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes)
+            if answer == QMessageBox.Cancel:
+                return
+            resume = answer == QMessageBox.Yes
+
+        progress_dialog = QProgressDialog("Importing...", "Cancel", 0, 1000, parent)
+        progress_dialog.setWindowTitle("Import Statement")
+        progress_dialog.setWindowModality(Qt.WindowModal)
+        progress_dialog.setMinimumDuration(500)
+
+        def progress(bytes_done, bytes_total):
+            progress_dialog.setValue(int(bytes_done * 1000 / bytes_total) if bytes_total else 1000)
+            QApplication.processEvents()
+            return not progress_dialog.wasCanceled()
+
+        report = import_statement_file(db, file_path, mapping, resume=resume, progress=progress)
+        progress_dialog.close()
+    except Exception as e:
+        QMessageBox.critical(parent, "Import Error", f"Failed to import statement: {str(e)}")
+        return
+
+    load_orphan_transactions(table_view)
+    if report['orphan_id']:
+        model = table_view.model()
+        for row in range(model.rowCount()):
+            if model.item(row, 0).text() == str(report['orphan_id']):
+                table_view.selectRow(row)
+                break
+
+    if not report['complete']:
+        message = (f"The import stopped after {report['resumed_from'] + report['rows']} transactions. "
+                   f"Import the same file again to resume.")
+    elif report['orphan_id']:
+        message = (f"Imported {report['rows']} transactions as orphan transaction batch #{report['orphan_id']}"
+                   f" ({len(report['errors'])} errors, {report['duplicates']} duplicates).")
+    else:
+        message = "No transactions found in the statement."
+    result = QMessageBox(QMessageBox.Information, "Import Statement", message, QMessageBox.Ok, parent)
+    if report['errors']:
+        result.setDetailedText("\n".join(report['errors']))
+    result.exec_()
+
+
 def load_orphan_transactions(table_view):
     """Load orphan transaction batches into the table view"""
     model = QStandardItemModel()
-    model.setHorizontalHeaderLabels(["ID", "Reference", "Import Date", "Status", "Lines"])
-
-    orphan_transactions = db.get_orphan_transactions()
-
-    for transaction in orphan_transactions:
-        transaction_id = transaction[0]
-        reference = transaction[1]
-        import_date = transaction[2]
-        status = transaction[3]
+    model.setHorizontalHeaderLabels(["ID", "Reference", "Import Date", "Status", "Lines", "Dates"])
 
-        # Count lines
-        lines = db.get_orphan_lines(transaction_id)
-        line_count = len(lines)
-        new_count = sum(1 for line in lines if line['status'] == 'new')
-        error_count = sum(1 for line in lines if line['status'] == 'error')
+    # Line counts come from one grouped query rather than loading every batch's lines
+    for batch in db.get_orphan_batch_summaries():
+        status = batch['status']
+        line_count = batch['line_count']
+        new_count = batch['status_counts'].get('new', 0)
+        error_count = batch['status_counts'].get('error', 0)
 
         # Include error count in the summary if any
         if error_count > 0:
@@ -353,12 +505,18 @@ def load_orphan_transactions(table_view):
         else:
             status_text = f"{new_count} of {line_count} unprocessed"
 
+        if batch['first_date'] and batch['first_date'] != batch['last_date']:
+            date_text = f"{batch['first_date']} to {batch['last_date']}"
+        else:
+            date_text = batch['first_date'] or ""
+
         row = [
-            QStandardItem(str(transaction_id)),
-            QStandardItem(reference),
-            QStandardItem(import_date),
+            QStandardItem(str(batch['id'])),
+            QStandardItem(batch['reference']),
+            QStandardItem(batch['import_date']),
             QStandardItem(status),
-            QStandardItem(status_text)
+            QStandardItem(status_text),
+            QStandardItem(date_text)
         ]
 
         # Apply styling to indicate status
@@ -372,7 +530,8 @@ def load_orphan_transactions(table_view):
         model.appendRow(row)
 
     table_view.setModel(model)
-    table_view.resizeColumnsToContents()
+    fit_columns(table_view, 'orphan_transactions')
+
 
 def on_process_selected(orphan_table, lines_table, parent):
     """Process selected orphan transaction batch"""
@@ -392,6 +551,56 @@ def on_process_selected(orphan_table, lines_table, parent):
     load_orphan_lines(lines_table, transaction_id)
 
 
+def on_apply_rules(orphan_table, lines_table, parent):
+    """Categorize the new lines of the selected batch (or of every batch) with the categorization rules"""
+    indexes = orphan_table.selectionModel().selectedRows()
+    transaction_id = int(orphan_table.model().item(indexes[0].row(), 0).text()) if indexes else None
+    scope = f"batch {transaction_id}" if transaction_id is not None else "all batches"
+
+    # Dry run first, so nothing is posted before the user has seen what the rules would do
+    try:
+        matcher = compile_rules(db)
+        if not matcher.rules:
+            QMessageBox.information(parent, "Apply Rules",
+                                    "There are no enabled categorization rules. Add them under Settings.")
+            return
+        report = apply_rules(db, transaction_id, dry_run=True, matcher=matcher)
+    except Exception as e:
+        QMessageBox.critical(parent, "Error", f"Failed to apply rules: {e}")
+        return
+    details = "\n".join(format_rule_report(report, matcher.rules))
+    no_currency = (f"\n\n{len(report['no_currency'])} matched lines have no currency and are not posted "
+                   "(see the details)." if report['no_currency'] else "")
+    if not report['matches']:
+        box = QMessageBox(QMessageBox.Information, "Apply Rules",
+                          f"No new lines in {scope} can be posted by a rule.{no_currency}", QMessageBox.Ok, parent)
+        box.setDetailedText(details)
+        box.exec_()
+        return
+
+    box = QMessageBox(QMessageBox.Question, "Apply Rules",
+                      f"{len(report['matches'])} new lines in {scope} match a rule and "
+                      f"{len(report['unmatched'])} do not.{no_currency}\n\n"
+                      "Post a transaction for every matched line?",
+                      QMessageBox.Yes | QMessageBox.No, parent)
+    box.setDetailedText(details)
+    if box.exec_() != QMessageBox.Yes:
+        return
+
+    try:
+        report = apply_rules(db, transaction_id, dry_run=False, matcher=matcher)
+    except Exception as e:
+        QMessageBox.critical(parent, "Error", f"Failed to apply rules: {e}")
+        return
+    QMessageBox.information(parent, "Apply Rules",
+                            f"Created {len(report['transaction_ids'])} transactions "
+                            f"({report['seconds']:.2f}s).")
+
+    # Refresh the views
+    load_orphan_transactions(orphan_table)
+    load_orphan_lines(lines_table, transaction_id)
+
+
 def on_ignore_selected(orphan_table, lines_table):
     """Ignore selected orphan transaction batch"""
     indexes = orphan_table.selectionModel().selectedRows()
@@ -481,14 +690,13 @@ def on_process_line(lines_table, parent):
     form_layout.addRow("Amount:", amount_label)
 
     # Display source account
-    account = db.get_account_by_id(line['account_id'])
-    account_name = account[1] if account else "Unknown"
+    account_name = db.refs.account_name(line['account_id'])
     account_label = QLabel(account_name)
     form_layout.addRow("From Account:", account_label)
 
     # Select counterpart account
     counterpart_combo = QComboBox()
-    accounts = db.get_accounts_by_nature("debit" if not is_debit else "credit")
+    accounts = db.refs.accounts_by_nature("debit" if not is_debit else "credit")
     for account in accounts:
         counterpart_combo.addItem(account[1])
     form_layout.addRow("To Account:", counterpart_combo)
@@ -814,7 +1022,7 @@ def process_orphan_lines(orphan_id, parent):
 
         # Update counterpart account combo
         counterpart_account_combo.clear()
-        accounts = db.get_accounts_by_nature("credit" if is_credit else "debit")
+        accounts = db.refs.accounts_by_nature("credit" if is_credit else "debit")
         for account in accounts:
             counterpart_account_combo.addItem(account[1])
 
@@ -947,32 +1155,17 @@ def process_similar_orphans(reference_line_id, parent):
     if not reference_line:
         return
 
-    # Find similar lines based on description pattern
-    description_pattern = reference_line['description']
-
-    # Extract key part of description (e.g., merchant name)
-    # This is a simplified approach - could be more sophisticated
-    words = description_pattern.split()
-    if len(words) > 2:
-        # Use first 2 words if available
-        key_part = ' '.join(words[:2])
-    else:
-        key_part = description_pattern
-
-    # Find similar lines
-    similar_lines = db.execute_query("""
-        SELECT id, description, debit, credit, account_id
-        FROM orphan_transaction_lines
-        WHERE status = 'new' 
-        AND description LIKE ?
-        AND id != ?
-    """, (f'%{key_part}%', reference_line_id))
-
-    if not similar_lines:
+    # Cluster the new lines of the whole batch by description similarity in one pass
+    clusters = cluster_orphan_lines(db, reference_line['orphan_transaction_id'])
+    if not clusters:
         QMessageBox.information(parent, "No Similar Items",
                                 "No similar items found for bulk processing.")
         return
 
+    # Start with the reference line's cluster if it has one
+    current_cluster = next((number for number, cluster in enumerate(clusters)
+                            if any(line['id'] == reference_line_id for line in cluster)), 0)
+
     # Create dialog
     dialog = QDialog(parent)
     dialog.setWindowTitle("Bulk Process Similar Transactions")
@@ -999,37 +1192,49 @@ def process_similar_orphans(reference_line_id, parent):
     counterpart_layout = QFormLayout(counterpart_group)
 
     account_combo = QComboBox()
-    for account in db.get_all_accounts():
-        account_combo.addItem(account[1])
+    account_combo.addItems(db.refs.account_names())
     counterpart_layout.addRow("Account:", account_combo)
 
     layout.addWidget(counterpart_group)
 
+    # Each cluster of similar lines can be processed in one action
+    cluster_group = QGroupBox("Similar Lines")
+    cluster_layout = QFormLayout(cluster_group)
+
+    cluster_combo = QComboBox()
+    cluster_combo.addItems([cluster_label(cluster) for cluster in clusters])
+    cluster_layout.addRow("Cluster:", cluster_combo)
+
+    layout.addWidget(cluster_group)
+
     # Show table of similar transactions
     table = QTableView()
     model = QStandardItemModel()
 
-    model.setHorizontalHeaderLabels(["ID", "Description", "Amount", "Include"])
+    def show_cluster(number):
+        model.clear()
+        model.setHorizontalHeaderLabels(["ID", "Description", "Amount", "Include"])
 
-    for line in similar_lines:
-        line_id = line[0]
-        description = line[1]
-        amount = line[2] if line[2] else line[3]
+        for line in clusters[number]:
+            amount = line['debit'] if line['debit'] else line['credit']
 
-        id_item = QStandardItem(str(line_id))
-        desc_item = QStandardItem(description)
-        amount_item = QStandardItem(f"${amount}")
+            id_item = QStandardItem(str(line['id']))
+            desc_item = QStandardItem(line['description'])
+            amount_item = QStandardItem(f"${amount}")
 
-        # Checkbox for selection
-        include_item = QStandardItem()
-        include_item.setCheckable(True)
-        include_item.setCheckState(Qt.Checked)  # Default to checked
+            # Checkbox for selection
+            include_item = QStandardItem()
+            include_item.setCheckable(True)
+            include_item.setCheckState(Qt.Checked)  # Default to checked
 
-        model.appendRow([id_item, desc_item, amount_item, include_item])
+            model.appendRow([id_item, desc_item, amount_item, include_item])
+        fit_columns(table, 'orphan_line_selection')
 
     table.setModel(model)
     table.setSelectionBehavior(QTableView.SelectRows)
-    table.resizeColumnsToContents()
+    cluster_combo.setCurrentIndex(current_cluster)
+    show_cluster(current_cluster)
+    cluster_combo.currentIndexChanged.connect(show_cluster)
 
     layout.addWidget(table)
 
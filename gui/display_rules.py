@@ -0,0 +1,216 @@
+from PyQt5.QtWidgets import QVBoxLayout, QTableView, QAction, QMessageBox, QLabel
+from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon
+from gui.dialog_utils import show_entity_dialog
+from database import db
+from categorization import validate_rule
+from gui.model_sync import source_model, track_rows, upsert_row, remove_row, select_row_by_id, watch_tables
+from gui.column_sizing import fit_columns
+
+RULE_HEADERS = ["ID", "Name", "Priority", "Match", "Pattern", "Direction", "Min", "Max",
+                "Source Account", "Counterpart", "Classification", "Enabled"]
+
+ANY_ACCOUNT = "Any account"
+
+
+def get_selected_rule_id(table_view):
+    """Id of the selected rule, or None"""
+    if not table_view.selectionModel() or not table_view.selectionModel().hasSelection():
+        return None
+    model = table_view.model()
+    row_idx = table_view.selectionModel().currentIndex().row()
+    return int(model.data(model.index(row_idx, 0)))
+
+
+def display_categorization_rules(content_frame, toolbar):
+    # Clear existing layout
+    layout = content_frame.layout()
+    if layout is not None:
+        while layout.count():
+            child = layout.takeAt(0)
+            if child.widget():
+                child.widget().deleteLater()
+    else:
+        layout = QVBoxLayout(content_frame)
+        content_frame.setLayout(layout)
+
+    # Clear toolbar actions except the last (dark mode toggle)
+    actions_to_keep = toolbar.actions()[-2:]
+    for action in toolbar.actions()[:-2]:
+        toolbar.removeAction(action)
+
+    layout.addWidget(QLabel("<h3>Categorization Rules</h3>"))
+
+    table_view = QTableView()
+    layout.addWidget(table_view)
+    table_view.setAlternatingRowColors(True)
+    table_view.setEditTriggers(QTableView.NoEditTriggers)
+    table_view.setSelectionBehavior(QTableView.SelectRows)
+    table_view.setSortingEnabled(True)
+
+    add_action = QAction(QIcon('icons/add.png'), "Add", toolbar)
+    edit_action = QAction(QIcon('icons/edit.png'), "Edit", toolbar)
+    delete_action = QAction(QIcon('icons/delete.png'), "Delete", toolbar)
+
+    toolbar.insertAction(actions_to_keep[0], add_action)
+    toolbar.insertAction(actions_to_keep[0], edit_action)
+    toolbar.insertAction(actions_to_keep[0], delete_action)
+
+    add_action.triggered.connect(lambda: add_rule(content_frame, table_view))
+    edit_action.triggered.connect(lambda: edit_rule(content_frame, table_view))
+    delete_action.triggered.connect(lambda: delete_rule(content_frame, table_view))
+
+    load_rules(table_view)
+    watch_tables(table_view, ('categorization_rules',), apply_rule_changes)
+
+
+def make_rule_row(rule):
+    """Build the table row items for a rule dict from db.get_all_rules()"""
+    def amount(value):
+        return "" if value is None else f"{value:.2f}"
+
+    values = [str(rule['id']), rule['name'], str(rule['priority']), rule['match_type'], rule['pattern'],
+              rule['direction'], amount(rule['min_amount']), amount(rule['max_amount']),
+              rule['source_account_name'] or ANY_ACCOUNT, rule['counterpart_account_name'] or "",
+              rule['classification_name'] or "", "Yes" if rule['enabled'] else "No"]
+    return [QStandardItem(value) for value in values]
+
+
+def load_rules(table_view):
+    model = QStandardItemModel()
+    model.setHorizontalHeaderLabels(RULE_HEADERS)
+    for rule in db.get_all_rules():
+        model.appendRow(make_rule_row(rule))
+
+    table_view.setModel(model)
+    track_rows(model)
+    fit_columns(table_view, 'categorization_rules')
+
+
+def apply_rule_changes(table_view, changes):
+    """Apply database change notifications to the rules table one row at a time"""
+    model = source_model(table_view)
+    for table, operation, row_id, parent_id in changes:
+        if operation == 'delete':
+            remove_row(model, row_id)
+        else:
+            rule = db.get_rule_by_id(row_id)
+            if rule:
+                upsert_row(model, row_id, make_rule_row(rule))
+
+
+def rule_fields():
+    accounts = db.refs.account_names()
+    return [
+        {'id': 'name', 'label': 'Rule Name', 'type': 'text', 'required': True},
+        {'id': 'priority', 'label': 'Priority (lower runs first)', 'type': 'integer', 'required': True},
+        {'id': 'match_type', 'label': 'Match', 'type': 'combobox', 'options': ['tokens', 'regex']},
+        {'id': 'pattern', 'label': 'Description Pattern', 'type': 'text', 'required': True},
+        {'id': 'direction', 'label': 'Direction', 'type': 'combobox', 'options': ['any', 'debit', 'credit']},
+        {'id': 'min_amount', 'label': 'Minimum Amount', 'type': 'number', 'required': False},
+        {'id': 'max_amount', 'label': 'Maximum Amount', 'type': 'number', 'required': False},
+        {'id': 'source_account', 'label': 'Source Account', 'type': 'combobox', 'options': [ANY_ACCOUNT] + accounts},
+        {'id': 'counterpart_account', 'label': 'Counterpart Account', 'type': 'combobox', 'options': accounts},
+        {'id': 'classification', 'label': 'Classification', 'type': 'combobox', 'required': False,
+         'options': [""] + [item[1] for item in db.refs.classifications()]},
+        {'id': 'enabled', 'label': 'Enabled', 'type': 'checkbox', 'required': False},
+    ]
+
+
+def rule_from_dialog(data):
+    """RULE_FIELDS values from the rule dialog's data"""
+    source = data['source_account']
+    return {
+        'name': data['name'].strip(),
+        'priority': data['priority'] if data['priority'] is not None else 100,
+        'match_type': data['match_type'],
+        'pattern': data['pattern'].strip(),
+        'direction': data['direction'],
+        'min_amount': data['min_amount'],
+        'max_amount': data['max_amount'],
+        'source_account_id': None if source == ANY_ACCOUNT else db.refs.account_id(source),
+        'counterpart_account_id': db.refs.account_id(data['counterpart_account']),
+        'classification_id': db.refs.classification_id(data['classification']) if data['classification'] else None,
+        'enabled': 1 if data['enabled'] else 0,
+    }
+
+
+def rule_dialog(parent, title, initial_data):
+    """Show the rule dialog until it holds a valid rule; returns RULE_FIELDS values or None"""
+    while True:
+        data = show_entity_dialog(parent, title, rule_fields(), initial_data)
+        if not data:
+            return None
+        rule = rule_from_dialog(data)
+        error = validate_rule(rule)
+        if rule['counterpart_account_id'] is None:
+            error = "Please choose a counterpart account."
+        elif rule['source_account_id'] == rule['counterpart_account_id']:
+            error = "The counterpart account must differ from the source account."
+        elif rule['min_amount'] is not None and rule['max_amount'] is not None \
+                and rule['min_amount'] > rule['max_amount']:
+            error = "The minimum amount is larger than the maximum."
+        if not error:
+            return rule
+        QMessageBox.warning(parent, "Invalid Rule", error)
+        initial_data = dict(data, **{field: '' if data[field] is None else str(data[field])
+                                     for field in ('priority', 'min_amount', 'max_amount')})
+
+
+def add_rule(parent, table_view):
+    initial_data = {'priority': '100', 'match_type': 'tokens', 'direction': 'any', 'min_amount': '',
+                    'max_amount': '', 'source_account': ANY_ACCOUNT, 'enabled': True}
+    rule = rule_dialog(parent, "Add Categorization Rule", initial_data)
+    if rule:
+        try:
+            rule_id = db.insert_rule(**rule)
+            select_row_by_id(table_view, rule_id)
+        except Exception as e:
+            QMessageBox.critical(parent, "Error", f"Failed to add rule: {e}")
+
+
+def edit_rule(parent, table_view):
+    rule_id = get_selected_rule_id(table_view)
+    rule = db.get_rule_by_id(rule_id) if rule_id is not None else None
+    if not rule:
+        QMessageBox.warning(parent, "Warning", "Please select a rule to edit.")
+        return
+
+    initial_data = {
+        'name': rule['name'],
+        'priority': str(rule['priority']),
+        'match_type': rule['match_type'],
+        'pattern': rule['pattern'],
+        'direction': rule['direction'],
+        'min_amount': '' if rule['min_amount'] is None else str(rule['min_amount']),
+        'max_amount': '' if rule['max_amount'] is None else str(rule['max_amount']),
+        'source_account': rule['source_account_name'] or ANY_ACCOUNT,
+        'counterpart_account': rule['counterpart_account_name'],
+        'classification': rule['classification_name'] or "",
+        'enabled': bool(rule['enabled']),
+    }
+    updated = rule_dialog(parent, "Edit Categorization Rule", initial_data)
+    if updated:
+        try:
+            db.update_rule(rule_id, **updated)
+        except Exception as e:
+            QMessageBox.critical(parent, "Error", f"Failed to update rule: {e}")
+
+
+def delete_rule(parent, table_view):
+    rule_id = get_selected_rule_id(table_view)
+    rule = db.get_rule_by_id(rule_id) if rule_id is not None else None
+    if not rule:
+        QMessageBox.warning(parent, "Warning", "Please select a rule to delete.")
+        return
+
+    reply = QMessageBox.question(
+        parent,
+        "Confirm Deletion",
+        f"Are you sure you want to delete the rule '{rule['name']}'?\n\nLines it already posted are not affected.",
+        QMessageBox.Yes | QMessageBox.No
+    )
+    if reply == QMessageBox.Yes:
+        try:
+            db.delete_rule(rule_id)
+        except Exception as e:
+            QMessageBox.critical(parent, "Error", f"Failed to delete rule: {e}")
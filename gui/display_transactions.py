@@ -6,109 +6,50 @@ from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon, QDoubleValidat
 from PyQt5.QtCore import Qt, QSortFilterProxyModel, QDate, QTimer, QObject, QEvent
 from gui.dialog_utils import show_entity_dialog
 from gui.import_utils import import_csv_wizard
+from gui.display_orphan_transactions import load_orphan_transactions
+from gui.model_sync import (source_model, track_rows, find_row, upsert_row, remove_row, select_row_by_id,
+                             watch_tables)
+from gui.column_sizing import fit_columns
 from database import db
+from gui.filter_profile_utils import add_saved_views
+from filter_profiles import criteria_from_filter_params
+from journal_queries import (lines_source, build_filtered_lines_query, transaction_export_query, transaction_lines_export_query,
+                             account_balances_export_query, TRANSACTION_EXPORT_HEADERS,
+                             TRANSACTION_LINES_EXPORT_HEADERS, ACCOUNT_BALANCES_EXPORT_HEADERS)
+from collections import OrderedDict
 import datetime
 
-# Add these new cache functions
-# Cache for frequently accessed data
-_account_cache = {}
-_currency_cache = {}
-_classification_cache = {}
+# Recently viewed transactions: transaction_id -> (data version, (debit_lines, credit_lines)), oldest first
+_TRANSACTION_LINES_CACHE_SIZE = 32
+_transaction_lines_cache = OrderedDict()
 
+# Tables whose writes make a cached transaction detail stale
+_TRANSACTION_DETAIL_TABLES = ('transactions', 'transaction_lines', 'accounts', 'classifications')
 
-# Add this function to display_transactions.py - typically near the beginning of the file
-# after imports but before the main display_transactions function:
 
-def load_orphan_transactions(table_view):
-    """Load orphan transaction batches into the table view"""
-    from database import db  # Ensure db is imported if not already
+def get_transaction_lines_split(transaction_id):
+    """Get (debit_lines, credit_lines) for a transaction, served from the recently viewed cache"""
+    version = db.data_version(*_TRANSACTION_DETAIL_TABLES)
+    entry = _transaction_lines_cache.get(transaction_id)
+    if entry is not None and entry[0] == version:
+        _transaction_lines_cache.move_to_end(transaction_id)
+        return entry[1]
 
-    model = QStandardItemModel()
-    model.setHorizontalHeaderLabels(["ID", "Reference", "Import Date", "Status", "Lines"])
-
-    orphan_transactions = db.get_orphan_transactions()
-
-    for transaction in orphan_transactions:
-        transaction_id = transaction[0]
-        reference = transaction[1]
-        import_date = transaction[2]
-        status = transaction[3]
+    # One joined query for all lines, split client-side
+    debit_lines = []
+    credit_lines = []
+    for line in db.get_transaction_details(transaction_id):
+        if line['debit']:
+            debit_lines.append(line)
+        elif line['credit']:
+            credit_lines.append(line)
 
-        # Count lines
-        lines = db.get_orphan_lines(transaction_id)
-        line_count = len(lines)
-        new_count = sum(1 for line in lines if line['status'] == 'new')
-        error_count = sum(1 for line in lines if line['status'] == 'error')
+    _transaction_lines_cache[transaction_id] = (version, (debit_lines, credit_lines))
+    _transaction_lines_cache.move_to_end(transaction_id)
+    if len(_transaction_lines_cache) > _TRANSACTION_LINES_CACHE_SIZE:
+        _transaction_lines_cache.popitem(last=False)
 
-        # Include error count in the summary if any
-        if error_count > 0:
-            status_text = f"{new_count} of {line_count} unprocessed ({error_count} with errors)"
-        else:
-            status_text = f"{new_count} of {line_count} unprocessed"
-
-        row = [
-            QStandardItem(str(transaction_id)),
-            QStandardItem(reference),
-            QStandardItem(import_date),
-            QStandardItem(status),
-            QStandardItem(status_text)
-        ]
-
-        # Apply styling to indicate status
-        if status == 'processed':
-            for item in row:
-                item.setBackground(Qt.lightGray)
-        elif status == 'ignored':
-            for item in row:
-                item.setForeground(Qt.gray)
-
-        model.appendRow(row)
-
-    table_view.setModel(model)
-    table_view.resizeColumnsToContents()
-
-
-def get_cached_account_name(account_id):
-    """Get account name from cache or load it from database"""
-    if account_id not in _account_cache:
-        account_data = db.get_account_by_id(account_id)
-        _account_cache[account_id] = account_data[1] if account_data else "Unknown"
-    return _account_cache[account_id]
-
-
-def get_cached_currency_name(currency_id):
-    """Get currency name from cache or load it from database"""
-    if currency_id not in _currency_cache:
-        currency_data = db.get_currency_by_id(currency_id)
-        _currency_cache[currency_id] = currency_data[1] if currency_data else "Unknown"
-    return _currency_cache[currency_id]
-
-
-def get_cached_classification_name(classification_id):
-    """Get classification name from cache or load it from database"""
-    if classification_id is None:
-        return ""
-    if classification_id not in _classification_cache:
-        classification_data = db.get_classification_by_id(classification_id)
-        _classification_cache[classification_id] = classification_data[1] if classification_data else ""
-    return _classification_cache[classification_id]
-
-
-def warm_cache():
-    """Preload common data into cache"""
-    # Preload all accounts
-    for account in db.get_all_accounts():
-        _account_cache[account[0]] = account[1]
-
-    # Preload all currencies
-    for currency in db.get_all_currencies():
-        _currency_cache[currency[0]] = currency[1]
-
-    # Preload all classifications
-    cursor = db.conn.cursor()
-    cursor.execute("SELECT id, name FROM classifications")
-    for classification in cursor.fetchall():
-        _classification_cache[classification[0]] = classification[1]
+    return debit_lines, credit_lines
 
 
 def get_selected_row_data(table_view):
@@ -220,9 +161,6 @@ def update_summary_counts(transactions_table, debit_table, credit_table,
         debit_lines_count_label.setText("Total Debit Lines: 0")
 
 def display_transactions(content_frame, toolbar):
-    # Warm up the cache with frequently used data
-    warm_cache()
-
     # Clear existing layout
     layout = content_frame.layout()
     if layout is not None:
@@ -458,14 +396,31 @@ def display_transactions(content_frame, toolbar):
     reset_filter_action.triggered.connect(lambda: reset_transaction_filters(content_frame, transactions_table))
     export_action.triggered.connect(lambda: export_transactions_data(content_frame, transactions_table))
 
+    # Saved filter profiles, each applied as one compiled filter with a cached count
+    def apply_saved_view(profile_id):
+        filter_params = db.filter_profiles.filter_params(profile_id) if profile_id is not None else None
+        load_transactions(transactions_table, page=1, page_size=getattr(transactions_table, 'page_size', None),
+                          filter_params=filter_params)
+
+    def current_criteria():
+        filter_params = getattr(transactions_table, 'filter_params', None) or {}
+        if 'profile_id' in filter_params:
+            return db.get_filter_profile(filter_params['profile_id'])['criteria']
+        return criteria_from_filter_params(filter_params)
 
-    def update_pagination_info():
+    transactions_table.saved_views = add_saved_views(content_frame, toolbar, actions_to_keep[0], transactions_table,
+                                                     'transactions', apply_saved_view, current_criteria)
+
+
+    def update_pagination_info(total_count=None):
         current_page = getattr(transactions_table, 'current_page', 1)
         page_size = getattr(transactions_table, 'page_size', None)  # Default to None instead of 20
         filter_params = getattr(transactions_table, 'filter_params', None)
 
-        # Get total count
-        total_count = db.get_transaction_count(filter_params)
+        # Get total count, unless the caller already knows it
+        if total_count is None:
+            total_count = db.get_transaction_count(filter_params)
+        transactions_table.total_count = total_count
 
         # Calculate total pages - handle page_size = None (All records)
         if page_size is None:
@@ -503,15 +458,18 @@ def display_transactions(content_frame, toolbar):
             QTimer.singleShot(10, lambda: load_transaction_details(transaction_id))
 
     def load_transaction_details(transaction_id):
-        # Load detailed transaction data
-        load_transaction_lines(debit_table, transaction_id, is_debit=True)
-        load_transaction_lines(credit_table, transaction_id, is_debit=False)
+        # Load detailed transaction data (one query, or none if recently viewed)
+        debit_lines, credit_lines = get_transaction_lines_split(transaction_id)
+        populate_transaction_lines(debit_table, debit_lines, is_debit=True)
+        populate_transaction_lines(credit_table, credit_lines, is_debit=False)
 
-        # Get pagination info for summary update
+        # Get pagination info for summary update; the total is kept by update_pagination_info
+        # so moving through the journal doesn't recount it
         current_page = getattr(transactions_table, 'current_page', 1)
         page_size = getattr(transactions_table, 'page_size', None)
-        filter_params = getattr(transactions_table, 'filter_params', None)
-        total_count = db.get_transaction_count(filter_params)
+        total_count = getattr(transactions_table, 'total_count', None)
+        if total_count is None:
+            total_count = db.get_transaction_count(getattr(transactions_table, 'filter_params', None))
 
         # Update summary counts with complete info
         update_summary_counts(transactions_table, debit_table, credit_table,
@@ -542,6 +500,9 @@ def display_transactions(content_frame, toolbar):
 
     load_transactions(transactions_table, page=1, page_size=initial_page_size)
 
+    # Later edits update single rows instead of reloading the page
+    watch_tables(transactions_table, ('transactions', 'transaction_lines'), apply_transaction_changes)
+
     # Explicitly update pagination info after initial load to ensure summary shows complete information
     update_pagination_info()
 
@@ -556,93 +517,170 @@ def export_transactions_data(parent, transactions_table):
     """
     Export all filtered transactions data with summarized credit and debit information,
     regardless of pagination. Includes unique account:classification pairs.
+    Every format is streamed straight from the export queries; Excel gets extra
+    Lines and Balances sheets.
     """
-    from gui.export_utils import export_table_data
+    from gui.export_utils import choose_export_path, export_queries
 
     # Get current filter parameters from the table
     filter_params = getattr(transactions_table, 'filter_params', None)
 
-    # Create a temporary table view for export with enhanced columns
-    temp_table = QTableView()
-    temp_model = QStandardItemModel()
-
-    # Set headers including credit and debit summaries
-    temp_model.setHorizontalHeaderLabels([
-        "ID", "Date", "Description", "Amount", "Currency",
-        "Credit Accounts", "Debit Accounts"
-    ])
-
-    # Get ALL transactions that match the current filter (ignoring pagination)
-    transactions = get_transactions_with_summary(limit=None, offset=0, filter_params=filter_params)
-
-    if not transactions:
+    expected_rows = db.get_transaction_count(filter_params)
+    if not expected_rows:
         QMessageBox.information(parent, "Export Info", "No data to export.")
         return
 
-    # Process all transactions
-    for transaction in transactions:
-        transaction_id = transaction['id']
-        date = transaction['date']
-        description = transaction['description']
-        amount = transaction['amount']
-        currency = transaction['currency']
-
-        # Create row items
-        id_item = QStandardItem(str(transaction_id))
-        date_item = QStandardItem(date)
-        description_item = QStandardItem(description)
-        amount_item = QStandardItem(f"{amount:.2f}")
-        currency_item = QStandardItem(currency)
-
-        # Set alignment for ID and amount
-        id_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        amount_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-
-        # Get transaction lines for credit and debit summaries
-        lines = db.get_transaction_lines(transaction_id)
+    file_path = choose_export_path(parent, "transactions_export")
+    if not file_path:
+        return  # User canceled
+
+    # Every row, with its credit and debit account summaries, comes from one query
+    lines = lines_source(db, filter_params)
+    query, params = transaction_export_query(filter_params, lines)
+
+    if file_path.lower().endswith('.xlsx'):
+        lines_query, lines_params = transaction_lines_export_query(filter_params, lines)
+        balances_query, balances_params = account_balances_export_query(filter_params, lines)
+        export_queries(parent, db, [
+            ("Journal", TRANSACTION_EXPORT_HEADERS, query, params),
+            ("Lines", TRANSACTION_LINES_EXPORT_HEADERS, lines_query, lines_params),
+            ("Balances", ACCOUNT_BALANCES_EXPORT_HEADERS, balances_query, balances_params),
+        ], file_path)
+    else:
+        # CSV and PDF take a single sheet; its title heads the PDF
+        export_queries(parent, db, [("Transactions Journal", TRANSACTION_EXPORT_HEADERS, query, params)],
+                       file_path, expected_rows)
+
+
+def make_transaction_row(transaction):
+    """Build the table row items for a get_transactions_with_summary() entry"""
+    transaction_id = transaction['id']
+    date = transaction['date']
+    description = transaction['description']
+    amount = transaction['amount']
+    currency = transaction['currency']
+
+    id_item = QStandardItem(str(transaction_id))
+    description_item = QStandardItem(description)
+    amount_item = QStandardItem(f"{amount:.2f}")
+    date_item = QStandardItem(date)
+    currency_item = QStandardItem(currency)
+
+    # Set alignment for numeric columns
+    id_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+    amount_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
+
+    # Set UserRole data for proper sorting
+    id_item.setData(int(transaction_id), Qt.UserRole)
+    date_item.setData(QDate.fromString(date, "yyyy-MM-dd"), Qt.UserRole)
+    description_item.setData(description.lower(), Qt.UserRole)
+    amount_item.setData(float(amount), Qt.UserRole)
+
+    # Set date for sorting
+    try:
+        date_obj = datetime.datetime.strptime(date, "%Y-%m-%d").date()
+        date_qdate = QDate(date_obj.year, date_obj.month, date_obj.day)
+        date_item.setData(date_qdate, Qt.UserRole)
+    except:
+        # If date parsing fails, use a default old date
+        date_item.setData(QDate(1900, 1, 1), Qt.UserRole)
 
-        # Use sets to track unique account:classification pairs
-        credit_accounts = set()
-        debit_accounts = set()
+    currency_item.setData(currency.lower(), Qt.UserRole)
 
-        for line in lines:
-            account_id = line[2]
-            debit = line[3] if line[3] else 0
-            credit = line[4] if line[4] else 0
-            classification_id = line[7]
+    return [id_item, date_item, description_item, amount_item, currency_item]
 
-            # Get account name
-            account_name = get_cached_account_name(account_id)
 
-            # Get classification name if available
-            classification_name = get_cached_classification_name(classification_id)
+def _page_accepts(table_view, model, date):
+    """
+    Whether a transaction newly matching the filter, dated date, belongs on the page shown:
+    pages run newest first, so it does unless it sorts before the page's first row on a
+    later page or after the last row of a full page.
+    """
+    page_size = getattr(table_view, 'page_size', None)
+    if page_size is None:
+        return True
+    dates = [model.item(row, 1).text() for row in range(model.rowCount())]
+    if not dates:
+        return getattr(table_view, 'current_page', 1) == 1
+    if date > max(dates) and getattr(table_view, 'current_page', 1) > 1:
+        return False
+    return len(dates) < page_size or date >= min(dates)
 
-            # Create account + classification text
-            account_text = account_name
-            if classification_name:
-                account_text += f": {classification_name}"
 
-            if credit > 0:
-                credit_accounts.add(account_text)
-            elif debit > 0:
-                debit_accounts.add(account_text)
+def _drop_oldest_row(model, page_size):
+    """Keep a page at page_size rows after an insert by dropping its oldest row (it moves to the next page)"""
+    while page_size is not None and model.rowCount() > page_size:
+        oldest = min(range(model.rowCount()), key=lambda row: model.item(row, 1).text())
+        remove_row(model, model.item(oldest, 0).text())
 
-        # Create items for credit and debit summaries
-        # Join with line breaks which will work better for wrapping in PDF
-        credit_summary = QStandardItem("\n".join(sorted(credit_accounts)))
-        debit_summary = QStandardItem("\n".join(sorted(debit_accounts)))
 
-        # Add all items to the row
-        temp_model.appendRow([
-            id_item, date_item, description_item, amount_item, currency_item,
-            credit_summary, debit_summary
-        ])
+def apply_transaction_changes(table_view, changes):
+    """Refresh only the summary rows of transactions touched by a write"""
+    model = source_model(table_view)
+    filter_params = getattr(table_view, 'filter_params', None)
 
-    # Set the model to the temporary table
-    temp_table.setModel(temp_model)
+    # Several line writes of one save arrive together; refresh each transaction once
+    deleted_ids = set()
+    inserted_ids = set()
+    touched_ids = []
+    for table, operation, row_id, parent_id in changes:
+        transaction_id = row_id if table == 'transactions' else parent_id
+        if transaction_id is None:
+            continue
+        if table == 'transactions' and operation == 'delete':
+            deleted_ids.add(transaction_id)
+        else:
+            if table == 'transactions' and operation == 'insert':
+                inserted_ids.add(transaction_id)
+            if transaction_id not in touched_ids:
+                touched_ids.append(transaction_id)
+
+    # The total is adjusted by what changed instead of being counted again. That is exact
+    # for rows on the page and when the page holds every match; a transaction on another
+    # page may or may not have matched before the write, so only then is it counted again.
+    page_size = getattr(table_view, 'page_size', None)
+    all_shown = page_size is None
+    count_change = 0
+    recount = False
+    for transaction_id in deleted_ids:
+        if find_row(model, transaction_id) >= 0:
+            count_change -= 1
+        elif not all_shown:
+            recount = True
+        remove_row(model, transaction_id)
+
+    for transaction_id in touched_ids:
+        if transaction_id in deleted_ids:
+            continue
+        # Same query as the page load, narrowed to one transaction and the active filter
+        params = dict(filter_params or {})
+        params['transaction_id'] = transaction_id
+        summary = get_transactions_with_summary(limit=None, offset=0, filter_params=params)
+        shown = find_row(model, transaction_id) >= 0
+        if summary and shown:
+            upsert_row(model, transaction_id, make_transaction_row(summary[0]))
+        elif summary:
+            if all_shown or transaction_id in inserted_ids:
+                count_change += 1
+            else:
+                recount = True
+            # Only added when it sorts onto this page; otherwise it just counts
+            if _page_accepts(table_view, model, summary[0]['date'] or ''):
+                upsert_row(model, transaction_id, make_transaction_row(summary[0]))
+                _drop_oldest_row(model, page_size)
+        elif shown:
+            # Edited so that it no longer matches the filter
+            remove_row(model, transaction_id)
+            count_change -= 1
+        elif not all_shown and transaction_id not in inserted_ids:
+            recount = True
 
-    # Export the data (using our existing PDF export with word wrap support)
-    export_table_data(parent, temp_table, "transactions_export", "Transactions Journal")
+    if hasattr(table_view, 'update_pagination_info'):
+        total_count = getattr(table_view, 'total_count', None)
+        if recount or total_count is None:
+            table_view.update_pagination_info()
+        else:
+            table_view.update_pagination_info(max(0, total_count + count_change))
 
 
 def load_transactions(table_view, page=1, page_size=None, filter_params=None, select_transaction_id=None):
@@ -671,40 +709,9 @@ def load_transactions(table_view, page=1, page_size=None, filter_params=None, se
     # Rest of your existing code
 
     for transaction in transactions:
-        transaction_id = transaction['id']
-        date = transaction['date']
-        description = transaction['description']
-        amount = transaction['amount']
-        currency = transaction['currency']
-
-        id_item = QStandardItem(str(transaction_id))
-        description_item = QStandardItem(description)
-        amount_item = QStandardItem(f"{amount:.2f}")
-        date_item = QStandardItem(date)
-        currency_item = QStandardItem(currency)
-
-        # Set alignment for numeric columns
-        id_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-        amount_item.setTextAlignment(Qt.AlignRight | Qt.AlignVCenter)
-
-        # Set UserRole data for proper sorting
-        id_item.setData(int(transaction_id), Qt.UserRole)
-        date_item.setData(QDate.fromString(date, "yyyy-MM-dd"), Qt.UserRole)
-        description_item.setData(description.lower(), Qt.UserRole)
-        amount_item.setData(float(amount), Qt.UserRole)
-
-        # Set date for sorting
-        try:
-            date_obj = datetime.datetime.strptime(date, "%Y-%m-%d").date()
-            date_qdate = QDate(date_obj.year, date_obj.month, date_obj.day)
-            date_item.setData(date_qdate, Qt.UserRole)
-        except:
-            # If date parsing fails, use a default old date
-            date_item.setData(QDate(1900, 1, 1), Qt.UserRole)
+        model.appendRow(make_transaction_row(transaction))
 
-        currency_item.setData(currency.lower(), Qt.UserRole)
-
-        model.appendRow([id_item, date_item, description_item, amount_item, currency_item])
+    track_rows(model)
 
     # Create proxy model for sorting
     proxy_model = QSortFilterProxyModel()
@@ -733,10 +740,10 @@ def load_transactions(table_view, page=1, page_size=None, filter_params=None, se
             QTimer.singleShot(50, lambda: table_view.selectionModel().selectionChanged.connect(on_transaction_selected)
             if table_view.selectionModel() else None)
 
-    # Resize columns
-    table_view.resizeColumnsToContents()
+    # Size columns from a sample of rows
+    fit_columns(table_view, 'transactions')
 
-    # Sort by date descending by default (most recent first)
+    # Sort by date descending by default (most recent first, newest ID first within a day)
     table_view.sortByColumn(0, Qt.DescendingOrder)
     table_view.sortByColumn(1, Qt.DescendingOrder)
 
@@ -745,17 +752,7 @@ def load_transactions(table_view, page=1, page_size=None, filter_params=None, se
 
     # Restore selection if possible
     if selected_transaction_id:
-        for row in range(proxy_model.rowCount()):
-            if str(proxy_model.data(proxy_model.index(row, 0))) == str(selected_transaction_id):
-                table_view.selectRow(row)
-                break
-
-    # Set sensible column widths
-    table_view.resizeColumnsToContents()
-
-    # Sort by date descending by default (most recent first)
-    table_view.sortByColumn(0, Qt.DescendingOrder)
-    table_view.sortByColumn(1, Qt.DescendingOrder)
+        select_row_by_id(table_view, selected_transaction_id)
 
     # At the end of load_transactions function, add:
     if hasattr(table_view, 'update_pagination_info'):
@@ -763,41 +760,7 @@ def load_transactions(table_view, page=1, page_size=None, filter_params=None, se
 
 def get_transactions_with_summary(limit=20, offset=0, filter_params=None):
     """Get transactions from database with summary information"""
-    # Build the query dynamically based on filters
-    base_query = """
-        SELECT tl.transaction_id, tl.date, tl.debit, tl.account_id
-        FROM transaction_lines tl
-    """
-
-    join_clause = ""
-    where_clauses = []
-    params = []
-
-    # Apply filters if provided
-    if filter_params:
-        if 'date_from' in filter_params:
-            where_clauses.append("tl.date >= ?")
-            params.append(filter_params['date_from'])
-
-        if 'date_to' in filter_params:
-            where_clauses.append("tl.date <= ?")
-            params.append(filter_params['date_to'])
-
-        if 'account_id' in filter_params:
-            where_clauses.append("tl.account_id = ?")
-            params.append(filter_params['account_id'])
-
-        if 'description' in filter_params:
-            join_clause = " JOIN transactions t ON tl.transaction_id = t.id"
-            where_clauses.append("t.description LIKE ?")
-            params.append(f"%{filter_params['description']}%")
-
-    # Build the filtered lines query
-    filtered_query = base_query + join_clause
-
-    # Add WHERE clause if we have conditions
-    if where_clauses:
-        filtered_query += " WHERE " + " AND ".join(where_clauses)
+    filtered_query, params = build_filtered_lines_query(filter_params, lines_source(db, filter_params))
 
     # Main query using the filtered results
     query = f"""
@@ -832,8 +795,8 @@ def get_transactions_with_summary(limit=20, offset=0, filter_params=None):
         total_debit = data[3] or 0
         earliest_date = data[4] or "N/A"
 
-        # Get currency name from cache
-        currency_name = get_cached_currency_name(currency_id)
+        # Get currency name from the shared reference cache
+        currency_name = db.refs.currency_name(currency_id)
 
         # Apply amount filters if specified
         if filter_params:
@@ -853,37 +816,28 @@ def get_transactions_with_summary(limit=20, offset=0, filter_params=None):
 
     return result
 
+
 def load_transaction_lines(table_view, transaction_id, is_debit=True):
     """Load transaction lines into the appropriate table view"""
+    debit_lines, credit_lines = get_transaction_lines_split(transaction_id)
+    populate_transaction_lines(table_view, debit_lines if is_debit else credit_lines, is_debit)
+
+
+def populate_transaction_lines(table_view, lines, is_debit=True):
+    """Fill a lines table from the dicts returned by db.get_transaction_details"""
     model = QStandardItemModel()
     model.setHorizontalHeaderLabels(["ID", "Date", "Account", "Classification", "Amount"])
 
-    # Get transaction lines from database
-    lines = db.get_transaction_lines(transaction_id)
-
     for line in lines:
-        line_id = line[0]
-        account_id = line[2]
-        debit = line[3] if line[3] else 0
-        credit = line[4] if line[4] else 0
-        date = line[5]
-        classification_id = line[7]
-
-        # Skip lines that don't match the requested type (debit/credit)
-        if is_debit and not debit:
-            continue
-        if not is_debit and not credit:
-            continue
-
-        # Get account name from cache
-        account_name = get_cached_account_name(account_id)
-
-        # Get classification name if available
-        classification_name = get_cached_classification_name(classification_id)
+        line_id = line['id']
+        amount = line['debit'] if is_debit else line['credit']
+        date = line['date']
+        account_name = line['account_name']
+        classification_name = line['classification_name']
 
         id_item = QStandardItem(str(line_id))
         account_item = QStandardItem(account_name)
-        amount_item = QStandardItem(f"{debit if is_debit else credit:.2f}")
+        amount_item = QStandardItem(f"{amount:.2f}")
         date_item = QStandardItem(date)
         classification_item = QStandardItem(classification_name)
 
@@ -894,7 +848,7 @@ def load_transaction_lines(table_view, transaction_id, is_debit=True):
         # Set UserRole data for proper sorting
         id_item.setData(int(line_id), Qt.UserRole)
         account_item.setData(account_name.lower(), Qt.UserRole)
-        amount_item.setData(float(debit if is_debit else credit), Qt.UserRole)
+        amount_item.setData(float(amount), Qt.UserRole)
 
         # Parse date for sorting
         try:
@@ -916,7 +870,7 @@ def load_transaction_lines(table_view, transaction_id, is_debit=True):
     # Set the proxy model to the table view
     table_view.setModel(proxy_model)
 
-    table_view.resizeColumnsToContents()
+    fit_columns(table_view, 'transaction_debit_lines' if is_debit else 'transaction_credit_lines')
     # Hide the ID column
     #table_view.hideColumn(0)
 
@@ -934,8 +888,9 @@ def update_transaction_lines_display(transactions_table, lines_widget, debit_tab
     lines_widget.setVisible(True)
 
     # Load lines into appropriate tables
-    load_transaction_lines(debit_table, transaction_id, is_debit=True)
-    load_transaction_lines(credit_table, transaction_id, is_debit=False)
+    debit_lines, credit_lines = get_transaction_lines_split(transaction_id)
+    populate_transaction_lines(debit_table, debit_lines, is_debit=True)
+    populate_transaction_lines(credit_table, credit_lines, is_debit=False)
 
 
 def get_all_descriptions():
@@ -1005,7 +960,7 @@ def add_transaction_wizard(parent, table_view, edit_mode=False, transaction_id=N
 
     details_layout.addWidget(QLabel("Currency:"), 0, 4)
     currency_combo = QComboBox()
-    currencies = [curr[1] for curr in db.get_all_currencies()]
+    currencies = db.refs.currency_names()
     currency_combo.addItems(currencies)
 
     # If editing, pre-fill currency and calculate total
@@ -1438,7 +1393,7 @@ def add_transaction_wizard(parent, table_view, edit_mode=False, transaction_id=N
 
         # Get appropriate accounts based on line type (debit/credit)
         nature_filter = 'debit' if is_debit else 'credit'
-        accounts_data = db.get_accounts_by_nature(nature_filter)
+        accounts_data = db.refs.accounts_by_nature(nature_filter)
 
         accounts = [acc[1] for acc in accounts_data]
         account_combo.addItems(accounts)
@@ -1654,7 +1609,7 @@ def add_transaction_wizard(parent, table_view, edit_mode=False, transaction_id=N
 
     def update_classification_combo(combo, account_name):
         combo.clear()
-        account_id = db.get_account_id(account_name)
+        account_id = db.refs.account_id(account_name)
         classifications = db.get_classifications_for_account(account_id)
 
         # Reset to non-editable first
@@ -1842,8 +1797,8 @@ def add_transaction_wizard(parent, table_view, edit_mode=False, transaction_id=N
                 wizard.transaction_id = new_transaction_id
                 success_message = "Transaction added successfully."
 
-            # Reload transactions and select the transaction
-            load_transactions(table_view, select_transaction_id=wizard.transaction_id)
+            # The saved transaction's row was refreshed by the change notification; select it
+            select_row_by_id(table_view, wizard.transaction_id)
 
             # Force transaction selection update
             if hasattr(table_view, '_on_transaction_selected'):
@@ -1976,36 +1931,21 @@ def edit_transaction_wizard(parent, table_view):
     credit_lines = []
     debit_lines = []
 
-    # Get raw transaction lines
-    lines = db.get_transaction_lines(transaction_id)
-
-    for line in lines:
-        line_id = line[0]
-        account_id = line[2]
-        debit = line[3] if line[3] else 0
-        credit = line[4] if line[4] else 0
-        date = line[5]
-        classification_id = line[7]
-
-        # Get account name
-        account_name = get_cached_account_name(account_id)
-
-        # Get classification name
-        classification_name = get_cached_classification_name(classification_id)
-
+    # Get all lines with account and classification names in one query
+    for line in db.get_transaction_details(transaction_id):
         # Create line data dictionary
         line_data = {
-            'id': line_id,
-            'account_id': account_id,
-            'account_name': account_name,
-            'amount': debit if debit else credit,
-            'date': date,
-            'classification_id': classification_id,
-            'classification_name': classification_name
+            'id': line['id'],
+            'account_id': line['account_id'],
+            'account_name': line['account_name'],
+            'amount': line['debit'] if line['debit'] else line['credit'],
+            'date': line['date'],
+            'classification_id': line['classification_id'],
+            'classification_name': line['classification_name']
         }
 
         # Add to appropriate list
-        if debit > 0:
+        if line['debit'] > 0:
             debit_lines.append(line_data)
         else:
             credit_lines.append(line_data)
@@ -2023,6 +1963,8 @@ def edit_transaction_wizard(parent, table_view):
 def reset_transaction_filters(parent, table_view):
     # Reset filters
     table_view.filter_params = None
+    if hasattr(table_view, 'saved_views'):
+        table_view.saved_views.show_no_view()
 
     # Reset to first page with default page size
     load_transactions(table_view, page=1, page_size=None)
@@ -2177,7 +2119,7 @@ def edit_transaction(parent, table_view):
     transaction_id = int(row_data["ID"])
 
     # Get currencies for dropdown
-    currencies = [curr[1] for curr in db.get_all_currencies()]
+    currencies = db.refs.currency_names()
 
     fields = [
         {'id': 'description', 'label': 'Description', 'type': 'text', 'required': True},
@@ -2197,12 +2139,9 @@ def edit_transaction(parent, table_view):
             # Get currency ID
             currency_id = db.get_currency_id(data['currency'])
 
-            # Update transaction
+            # Update transaction (the row refreshes through the change notification)
             db.update_transaction(transaction_id, data['description'], currency_id)
 
-            # Reload transactions
-            load_transactions(table_view)
-
             QMessageBox.information(parent, "Success", "Transaction updated successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to update transaction: {e}")
@@ -2227,12 +2166,9 @@ def delete_transaction(parent, table_view):
 
     if reply == QMessageBox.Yes:
         try:
-            # Delete transaction
+            # Delete transaction (the row is removed through the change notification)
             db.delete_transaction(transaction_id)
 
-            # Reload transactions
-            load_transactions(table_view)
-
             QMessageBox.information(parent, "Success", "Transaction deleted successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to delete transaction: {e}")
@@ -2248,7 +2184,7 @@ def add_transaction_line(parent, transactions_table, lines_table, is_debit=True)
     transaction_id = int(row_data["ID"])
 
     # Get accounts for dropdown
-    accounts = [acc[1] for acc in db.get_all_accounts()]
+    accounts = list(db.refs.account_names())
 
     # Prepare classifications dropdown for this account
     classifications = ["(None)"]  # Default option
@@ -2301,9 +2237,6 @@ def add_transaction_line(parent, transactions_table, lines_table, is_debit=True)
             # Reload transaction lines
             load_transaction_lines(lines_table, transaction_id, is_debit)
 
-            # Also reload main transaction table as summary might change
-            load_transactions(transactions_table)
-
             QMessageBox.information(parent, "Success", "Transaction line added successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to add transaction line: {e}")
@@ -2318,7 +2251,7 @@ def edit_transaction_line(parent, lines_table):
     line_id = int(row_data["ID"])
 
     # Get accounts for dropdown
-    accounts = [acc[1] for acc in db.get_all_accounts()]
+    accounts = list(db.refs.account_names())
 
     # Get classifications
     classifications = ["(None)"]
@@ -2338,6 +2271,11 @@ def edit_transaction_line(parent, lines_table):
     if not line_data:
         QMessageBox.warning(parent, "Warning", "Transaction line not found.")
         return
+    try:
+        db.check_not_archived(line_data['transaction_id'])
+    except ValueError as e:
+        QMessageBox.warning(parent, "Warning", str(e))
+        return
 
     # Set initial values
     initial_data = {
@@ -2407,6 +2345,11 @@ def delete_transaction_line(parent, lines_table, transactions_table):
     if not line_data:
         QMessageBox.warning(parent, "Warning", "Transaction line not found.")
         return
+    try:
+        db.check_not_archived(line_data['transaction_id'])
+    except ValueError as e:
+        QMessageBox.warning(parent, "Warning", str(e))
+        return
 
     transaction_id = line_data['transaction_id']
     is_debit = "Debit" in line_data['type']
@@ -2426,9 +2369,6 @@ def delete_transaction_line(parent, lines_table, transactions_table):
             # Reload transaction lines
             load_transaction_lines(lines_table, transaction_id, is_debit)
 
-            # Also reload main transaction table as summary might change
-            load_transactions(transactions_table)
-
             QMessageBox.information(parent, "Success", "Transaction line deleted successfully.")
         except Exception as e:
             QMessageBox.critical(parent, "Error", f"Failed to delete transaction line: {e}")
@@ -2437,7 +2377,7 @@ def filter_transactions(parent, table_view):
     """Filter transactions by various criteria"""
     # Get accounts for filtering
     accounts = ["All Accounts"]
-    accounts.extend([acc[1] for acc in db.get_all_accounts()])
+    accounts.extend(db.refs.account_names())
 
     # Get dates for default range (last 30 days)
     today = datetime.date.today()
@@ -2483,8 +2423,11 @@ def filter_transactions(parent, table_view):
         if data.get('max_amount'):
             filter_params['max_amount'] = float(data['max_amount'])
 
+        if hasattr(table_view, 'saved_views'):
+            table_view.saved_views.show_no_view()
+
         # Reload transactions with filter
-        load_transactions(table_view, limit=None, filter_params=filter_params)
+        load_transactions(table_view, page_size=None, filter_params=filter_params)
         # At the end of load_transactions function, add:
         if hasattr(table_view, 'update_pagination_info'):
             table_view.update_pagination_info()
\ No newline at end of file
@@ -0,0 +1,103 @@
+from PyQt5.QtWidgets import QComboBox, QAction, QInputDialog, QMessageBox
+from PyQt5.QtGui import QIcon
+from database import db
+
+NO_PROFILE_TEXT = "(No saved view)"
+
+
+class SavedViewsCombo(QComboBox):
+    """Combo box of saved views that relists them, with fresh counts, each time it opens"""
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.refresh = None
+
+    def showPopup(self):
+        if self.refresh is not None:
+            self.refresh()
+        super().showPopup()
+
+    def show_no_view(self):
+        """Select the no-view entry without applying it (a filter from the dialog replaced the view)"""
+        self.blockSignals(True)
+        self.setCurrentIndex(0)
+        self.blockSignals(False)
+
+
+def add_saved_views(parent, toolbar, before, table_view, target_entity, on_select, current_criteria):
+    """
+    Add a saved views combo box with Save View and Delete View actions to toolbar, in front
+    of the action before, for as long as table_view exists. Each view is listed with its
+    cached result count. Choosing one calls on_select(profile_id), or on_select(None) for
+    the no-view entry. Save View stores current_criteria() (a criteria list, empty when
+    nothing is filtered) under a name. Returns the combo box.
+    """
+    combo = SavedViewsCombo(toolbar)
+    combo.setToolTip("Saved views")
+    combo.setMinimumContentsLength(18)
+    combo.setSizeAdjustPolicy(QComboBox.AdjustToMinimumContentsLengthWithIcon)
+    save_action = QAction(QIcon('icons/add.png'), "Save View", toolbar)
+    delete_action = QAction(QIcon('icons/delete.png'), "Delete View", toolbar)
+    combo_action = toolbar.insertWidget(before, combo)
+    toolbar.insertAction(before, save_action)
+    toolbar.insertAction(before, delete_action)
+    # Switching pages removes the toolbar actions but only deletes the page's widgets
+    for action in (combo_action, save_action, delete_action):
+        table_view.destroyed.connect(action.deleteLater)
+
+    def refresh(select_id=None):
+        """Relist the views with their counts, keeping or moving the selection"""
+        if select_id is None:
+            select_id = combo.currentData()
+        combo.blockSignals(True)
+        combo.clear()
+        combo.addItem(NO_PROFILE_TEXT, None)
+        for profile in db.get_filter_profiles(target_entity):
+            try:
+                label = f"{profile['name']} ({db.filter_profiles.count(profile['id'])})"
+            except ValueError:
+                # Saved by a newer or older version with criteria this one cannot compile
+                label = f"{profile['name']} (invalid)"
+            combo.addItem(label, profile['id'])
+        index = combo.findData(select_id)
+        combo.setCurrentIndex(index if index >= 0 else 0)
+        combo.blockSignals(False)
+
+    def on_index_changed(index):
+        try:
+            on_select(combo.itemData(index))
+        except ValueError as e:
+            QMessageBox.critical(parent, "Saved View", f"The view cannot be applied: {e}")
+
+    def save_view():
+        criteria = current_criteria()
+        if not criteria:
+            QMessageBox.information(parent, "Save View", "Apply a filter first; the view saves the current filter.")
+            return
+        name, ok = QInputDialog.getText(parent, "Save View", "View name:")
+        if not ok or not name.strip():
+            return
+        try:
+            profile_id = db.save_filter_profile(name.strip(), target_entity, criteria)
+        except ValueError as e:
+            QMessageBox.critical(parent, "Save View", f"The view could not be saved: {e}")
+            return
+        refresh(profile_id)
+
+    def delete_view():
+        profile_id = combo.currentData()
+        if profile_id is None:
+            return
+        if QMessageBox.question(parent, "Delete View", f"Delete the saved view '{combo.currentText()}'?",
+                                QMessageBox.Yes | QMessageBox.No) != QMessageBox.Yes:
+            return
+        db.delete_filter_profile(profile_id)
+        refresh(None)
+        on_select(None)
+
+    combo.currentIndexChanged.connect(on_index_changed)
+    save_action.triggered.connect(save_view)
+    delete_action.triggered.connect(delete_view)
+    combo.refresh = refresh
+    refresh()
+    return combo
@@ -1,19 +1,23 @@
 import json
 import os
+import sqlite3
 from PyQt5.QtWidgets import (
     QMainWindow, QTreeView, QVBoxLayout, QToolBar, QWidget, QAction, QMessageBox,
     QSplitter, QFrame, QCheckBox, QSizePolicy, QLabel, QAbstractItemView, QLineEdit, QComboBox, QPushButton
 )
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QIcon
 from PyQt5.QtCore import Qt, QSize, QByteArray, QSettings, QModelIndex
-from database import Database
+from database import Database, db
 from gui.display_categories import display_categories
 from gui.display_accounts import display_accounts
 from gui.display_credit_cards import display_credit_cards
 from gui.display_transactions import display_transactions
 from gui.display_currencies import display_currencies
 from gui.display_classifications import display_classifications
+from gui.display_rules import display_categorization_rules
 from gui.display_orphan_transactions import display_orphan_transactions
+from gui.backup_utils import back_up_now
+from gui.maintenance_utils import IdleMaintenance
 
 class Application(QMainWindow):
     def __init__(self):
@@ -33,12 +37,18 @@ class Application(QMainWindow):
             self.setWindowState(Qt.WindowMaximized)
         # Set initial splitter position if available
         self.splitter_pos = self.config.get('splitter_position', [200, 600])
-        self.database = Database("finance.db")
+        if self.config.get('in_memory_database'):
+            # One working copy in memory, shared with the views (which use database.db)
+            db.use_memory_copy()
+            self.database = db
+        else:
+            self.database = Database("finance.db")
         self.color_mode = self.config.get('color_mode', 'dark')
         self.dark_mode_enabled = self.color_mode == 'dark'
         self.apply_color_mode(self.color_mode)
         self.create_menu()
         self.create_widgets()
+        self.maintenance = IdleMaintenance(self, self.database.db_name, self.config)
 
     # Add a method to save window size
     def resizeEvent(self, event):
@@ -152,6 +162,8 @@ class Application(QMainWindow):
     def create_menu(self):
         menu_bar = self.menuBar()
         file_menu = menu_bar.addMenu("File")
+        file_menu.addAction("Back Up Now", lambda: back_up_now(self, self.load_config()))
+        file_menu.addSeparator()
         exit_action = QAction("Exit", self)
         exit_action.triggered.connect(self.close)
         file_menu.addAction(exit_action)
@@ -232,6 +244,15 @@ class Application(QMainWindow):
             config['window_height'] = self.height()
 
         self.save_config(config)
+        # Let a running backup finish rather than leave a partial snapshot behind
+        if getattr(self, 'backup_worker', None) is not None:
+            self.backup_worker.wait()
+        self.maintenance.stop()
+        # With an in-memory working copy, everything written so far reaches the file now
+        try:
+            self.database.flush()
+        except sqlite3.OperationalError as e:
+            QMessageBox.warning(self, "Close", f"Uncommitted changes are lost: {e}")
         event.accept()
 
     def toggle_dark_mode(self, state):
@@ -286,6 +307,7 @@ class Application(QMainWindow):
         settings_item.appendRow(QStandardItem("Credit Cards"))
         settings_item.appendRow(QStandardItem("Currencies"))
         settings_item.appendRow(QStandardItem("Classifications"))
+        settings_item.appendRow(QStandardItem("Categorization Rules"))
         #self.tree.setAlternatingRowColors(True)
         self.tree.setModel(model)
         #self.tree.expandAll()
@@ -321,6 +343,7 @@ class Application(QMainWindow):
                 "Transactions": self.display_transactions,
                 "Currencies": self.display_currencies,
                 "Classifications": self.display_classifications,
+                "Categorization Rules": self.display_categorization_rules,
                 "Orphan Transactions": self.display_orphan_transactions,
             }
 
@@ -364,6 +387,9 @@ class Application(QMainWindow):
     def display_classifications(self, content_frame):
         display_classifications(content_frame, self.toolbar)
 
+    def display_categorization_rules(self, content_frame):
+        display_categorization_rules(content_frame, self.toolbar)
+
     def display_orphan_transactions(self, content_frame):
         display_orphan_transactions(content_frame, self.toolbar)
 
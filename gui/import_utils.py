@@ -5,11 +5,14 @@ import datetime
 from PyQt5.QtWidgets import (
     QDialog, QWizard, QWizardPage, QVBoxLayout, QHBoxLayout, QLabel, QScrollArea,
     QLineEdit, QComboBox, QPushButton, QCheckBox, QMessageBox, QHeaderView,
-    QFileDialog, QGroupBox, QFormLayout, QTextEdit, QTableView, QWidget, QSizePolicy
+    QFileDialog, QGroupBox, QFormLayout, QTextEdit, QTableView, QWidget, QSizePolicy, QProgressDialog,
+    QApplication
 )
 from PyQt5.QtGui import QStandardItemModel, QStandardItem, QPixmap, QColor, QFont
 from PyQt5.QtCore import Qt, QDate
 from database import db
+from csv_import import (import_csv_file, file_sha256, column_indices, parse_amount_column, detect_date_format,
+                        CsvPreviewSession)
 
 
 
@@ -99,15 +102,13 @@ def import_csv_wizard(parent):
     account_combo = QComboBox()
     #account_combo.setMinimumHeight(30)
     account_combo.addItem("Multiple accounts (in CSV)")
-    accounts = db.get_all_accounts()
-    for account in accounts:
-        account_combo.addItem(account[1])
+    account_combo.addItems(db.refs.account_names())
     details_layout.addRow("Source Account:", account_combo)
 
     # Add currency selection
     currency_combo = QComboBox()
     #currency_combo.setMinimumHeight(30)
-    currencies = db.get_all_currencies()
+    currencies = db.refs.currencies()
     for currency in currencies:
         currency_combo.addItem(currency[1])
 
@@ -443,16 +444,19 @@ def import_csv_wizard(parent):
             directory = os.path.dirname(file_path)
             update_import_path(directory)
 
+    # The head of the chosen file, read once and shared by every preview below
+    preview_cache = {'session': None}
+
+    def preview_session(file_path):
+        session = preview_cache['session']
+        if session is None or not session.is_current(file_path):
+            session = CsvPreviewSession(file_path)
+            preview_cache['session'] = session
+        return session
+
     def update_preview(file_path, max_lines=10):
         try:
-            with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-                preview_lines = []
-                for i, line in enumerate(csvfile):
-                    if i >= max_lines:
-                        break
-                    preview_lines.append(line.strip())
-
-                preview_text.setPlainText('\n'.join(preview_lines))
+            preview_text.setPlainText('\n'.join(preview_session(file_path).text_lines[:max_lines]))
         except Exception as e:
             preview_text.setPlainText(f"Error reading file: {str(e)}")
 
@@ -464,225 +468,179 @@ def import_csv_wizard(parent):
             # Clear current headers
             header_model.clear()
 
-            # Detect CSV dialect
-            with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-                sample = csvfile.read(1024)
-                csvfile.seek(0)
+            # Dialect, header guess and the first rows come from the cached head of the file
+            session = preview_session(file_path)
+            has_header = has_header_checkbox.isChecked() and session.header_guess is not False
+            headers = session.headers(has_header)
+
+            # Display headers in the first row
+            for i, header in enumerate(headers):
+                header_model.setItem(0, i, QStandardItem(header))
+
+            # Get the first data row for the sample (not the header)
+            data_rows = session.data_rows(has_header)
+            sample_row = data_rows[0] if data_rows else None
+            if sample_row:
+                for i, cell in enumerate(sample_row):
+                    if i < len(headers):
+                        header_model.setItem(1, i, QStandardItem(cell))
+            else:
+                # If no data row available, create empty cells
+                for i in range(len(headers)):
+                    header_model.setItem(1, i, QStandardItem(""))
+
+            # Update column combo boxes
+            for combo in [date_combo, description_combo, amount_combo, debit_combo, credit_combo,
+                          account_col_combo, currency_col_combo]:
+                combo.clear()
+                combo.addItem("Not mapped")
+                combo.addItems(headers)
+
+            # Auto-map columns with improved detection
+            best_matches = {
+                'date': {'score': 0, 'index': -1},
+                'description': {'score': 0, 'index': -1},
+                'amount': {'score': 0, 'index': -1},
+                'debit': {'score': 0, 'index': -1},
+                'credit': {'score': 0, 'index': -1},
+                'account': {'score': 0, 'index': -1},
+                'currency': {'score': 0, 'index': -1}
+            }
 
-                sniffer = csv.Sniffer()
-                try:
-                    dialect = sniffer.sniff(sample)
-                    has_header = sniffer.has_header(sample) if has_header_checkbox.isChecked() else False
-                except:
-                    # If sniffing fails, use defaults
-                    dialect = csv.excel
-                    has_header = has_header_checkbox.isChecked()
-
-                reader = csv.reader(csvfile, dialect)
-
-                # Get headers
-                headers = next(reader) if has_header else []
-                if not has_header:
-                    # Create column numbers as headers
-                    row = next(reader)
-                    headers = [f"Column {i + 1}" for i in range(len(row))]
-
-                # Display headers in the first row
+            date_keywords = ['date', 'day', 'time', 'when']
+            desc_keywords = ['desc', 'narr', 'detail', 'note', 'memo', 'part', 'ref', 'subject']
+            amount_keywords = ['amount', 'sum', 'value', 'total', 'number']
+            debit_keywords = ['debit', 'withdrawal', 'out', 'payment', 'dr', 'withdraw', 'spent']
+            credit_keywords = ['credit', 'deposit', 'in', 'received', 'cr', 'income', 'incoming']
+            account_keywords = ['account', 'acct', 'acc', 'category', 'cat', 'type', 'source']
+            currency_keywords = ['currency', 'curr', 'ccy', 'fx', 'cur', 'money']
+
+            for i, header in enumerate(headers):
+                header_lower = header.lower()
+
+                # Date mapping
+                for keyword in date_keywords:
+                    if keyword in header_lower:
+                        best_matches['date']['score'] += 10
+                        best_matches['date']['index'] = i
+                        # Exact match gets higher score
+                        if header_lower == keyword:
+                            best_matches['date']['score'] += 20
+
+                # Description mapping
+                for keyword in desc_keywords:
+                    if keyword in header_lower:
+                        best_matches['description']['score'] += 10
+                        best_matches['description']['index'] = i
+                        if header_lower == keyword or header_lower == 'description':
+                            best_matches['description']['score'] += 20
+
+                # Amount mapping
+                for keyword in amount_keywords:
+                    if keyword in header_lower:
+                        best_matches['amount']['score'] += 10
+                        best_matches['amount']['index'] = i
+                        if header_lower == keyword:
+                            best_matches['amount']['score'] += 20
+
+                # Debit mapping
+                for keyword in debit_keywords:
+                    if keyword in header_lower:
+                        best_matches['debit']['score'] += 10
+                        best_matches['debit']['index'] = i
+                        if header_lower == keyword:
+                            best_matches['debit']['score'] += 20
+
+                # Credit mapping
+                for keyword in credit_keywords:
+                    if keyword in header_lower:
+                        best_matches['credit']['score'] += 10
+                        best_matches['credit']['index'] = i
+                        if header_lower == keyword:
+                            best_matches['credit']['score'] += 20
+
+                # Account mapping
+                for keyword in account_keywords:
+                    if keyword in header_lower:
+                        best_matches['account']['score'] += 10
+                        best_matches['account']['index'] = i
+                        if header_lower == keyword:
+                            best_matches['account']['score'] += 20
+
+                # Currency mapping
+                for keyword in currency_keywords:
+                    if keyword in header_lower:
+                        best_matches['currency']['score'] += 10
+                        best_matches['currency']['index'] = i
+                        if header_lower == keyword:
+                            best_matches['currency']['score'] += 20
+
+            # Apply best matches if score exceeds threshold
+            if best_matches['date']['score'] > 0:
+                date_combo.setCurrentIndex(best_matches['date']['index'] + 1)  # +1 for "Not mapped"
+
+            if best_matches['description']['score'] > 0:
+                description_combo.setCurrentIndex(best_matches['description']['index'] + 1)
+
+            if best_matches['amount']['score'] > 0:
+                amount_combo.setCurrentIndex(best_matches['amount']['index'] + 1)
+            elif best_matches['debit']['score'] == 0 and best_matches['credit']['score'] == 0:
+                # If no debit/credit but amount exists, use amount
                 for i, header in enumerate(headers):
-                    header_model.setItem(0, i, QStandardItem(header))
-
-                # Get a real data row for the sample (not the header)
-                csvfile.seek(0)
-                reader = csv.reader(csvfile, dialect)
-
-                # Skip the header if present
-                if has_header:
-                    next(reader)
-
-                # Get the first data row
-                sample_row = next(reader, None)
-                if sample_row:
-                    for i, cell in enumerate(sample_row):
-                        if i < len(sample_row) and i < len(headers):
-                            header_model.setItem(1, i, QStandardItem(cell))
-                else:
-                    # If no data row available, create empty cells
-                    for i in range(len(headers)):
-                        header_model.setItem(1, i, QStandardItem(""))
-                if sample_row:
-                    for i, cell in enumerate(sample_row):
-                        if i < len(sample_row) and i < len(headers):
-                            header_model.setItem(1, i, QStandardItem(cell))
-                else:
-                    # If no sample row, create empty cells for the second row
-                    for i in range(len(headers)):
-                        header_model.setItem(1, i, QStandardItem(""))
-
-                # Update column combo boxes
-                for combo in [date_combo, description_combo, amount_combo, debit_combo, credit_combo,
-                              account_col_combo, currency_col_combo]:
-                    combo.clear()
-                    combo.addItem("Not mapped")
-                    combo.addItems(headers)
-
-                # Auto-map columns with improved detection
-                best_matches = {
-                    'date': {'score': 0, 'index': -1},
-                    'description': {'score': 0, 'index': -1},
-                    'amount': {'score': 0, 'index': -1},
-                    'debit': {'score': 0, 'index': -1},
-                    'credit': {'score': 0, 'index': -1},
-                    'account': {'score': 0, 'index': -1},
-                    'currency': {'score': 0, 'index': -1}
-                }
-
-                date_keywords = ['date', 'day', 'time', 'when']
-                desc_keywords = ['desc', 'narr', 'detail', 'note', 'memo', 'part', 'ref', 'subject']
-                amount_keywords = ['amount', 'sum', 'value', 'total', 'number']
-                debit_keywords = ['debit', 'withdrawal', 'out', 'payment', 'dr', 'withdraw', 'spent']
-                credit_keywords = ['credit', 'deposit', 'in', 'received', 'cr', 'income', 'incoming']
-                account_keywords = ['account', 'acct', 'acc', 'category', 'cat', 'type', 'source']
-                currency_keywords = ['currency', 'curr', 'ccy', 'fx', 'cur', 'money']
+                    if "amount" in header.lower():
+                        amount_combo.setCurrentIndex(i + 1)
+                        break
 
-                for i, header in enumerate(headers):
-                    header_lower = header.lower()
-
-                    # Date mapping
-                    for keyword in date_keywords:
-                        if keyword in header_lower:
-                            best_matches['date']['score'] += 10
-                            best_matches['date']['index'] = i
-                            # Exact match gets higher score
-                            if header_lower == keyword:
-                                best_matches['date']['score'] += 20
-
-                    # Description mapping
-                    for keyword in desc_keywords:
-                        if keyword in header_lower:
-                            best_matches['description']['score'] += 10
-                            best_matches['description']['index'] = i
-                            if header_lower == keyword or header_lower == 'description':
-                                best_matches['description']['score'] += 20
-
-                    # Amount mapping
-                    for keyword in amount_keywords:
-                        if keyword in header_lower:
-                            best_matches['amount']['score'] += 10
-                            best_matches['amount']['index'] = i
-                            if header_lower == keyword:
-                                best_matches['amount']['score'] += 20
-
-                    # Debit mapping
-                    for keyword in debit_keywords:
-                        if keyword in header_lower:
-                            best_matches['debit']['score'] += 10
-                            best_matches['debit']['index'] = i
-                            if header_lower == keyword:
-                                best_matches['debit']['score'] += 20
-
-                    # Credit mapping
-                    for keyword in credit_keywords:
-                        if keyword in header_lower:
-                            best_matches['credit']['score'] += 10
-                            best_matches['credit']['index'] = i
-                            if header_lower == keyword:
-                                best_matches['credit']['score'] += 20
-
-                    # Account mapping
-                    for keyword in account_keywords:
-                        if keyword in header_lower:
-                            best_matches['account']['score'] += 10
-                            best_matches['account']['index'] = i
-                            if header_lower == keyword:
-                                best_matches['account']['score'] += 20
-
-                    # Currency mapping
-                    for keyword in currency_keywords:
-                        if keyword in header_lower:
-                            best_matches['currency']['score'] += 10
-                            best_matches['currency']['index'] = i
-                            if header_lower == keyword:
-                                best_matches['currency']['score'] += 20
-
-                # Apply best matches if score exceeds threshold
-                if best_matches['date']['score'] > 0:
-                    date_combo.setCurrentIndex(best_matches['date']['index'] + 1)  # +1 for "Not mapped"
-
-                if best_matches['description']['score'] > 0:
-                    description_combo.setCurrentIndex(best_matches['description']['index'] + 1)
-
-                if best_matches['amount']['score'] > 0:
-                    amount_combo.setCurrentIndex(best_matches['amount']['index'] + 1)
-                elif best_matches['debit']['score'] == 0 and best_matches['credit']['score'] == 0:
-                    # If no debit/credit but amount exists, use amount
-                    for i, header in enumerate(headers):
-                        if "amount" in header.lower():
-                            amount_combo.setCurrentIndex(i + 1)
-                            break
-
-                if best_matches['debit']['score'] > 0:
-                    debit_combo.setCurrentIndex(best_matches['debit']['index'] + 1)
-
-                if best_matches['credit']['score'] > 0:
-                    credit_combo.setCurrentIndex(best_matches['credit']['index'] + 1)
-
-                if best_matches['account']['score'] > 0:
-                    account_col_combo.setCurrentIndex(best_matches['account']['index'] + 1)
-
-                if best_matches['currency']['score'] > 0:
-                    currency_col_combo.setCurrentIndex(best_matches['currency']['index'] + 1)
-
-                # Highlight mapped columns
-                for i in range(header_model.columnCount()):
-                    for col in range(header_model.columnCount()):
-                        item = header_model.item(0, col)
-                        if item:
-                            # Reset background initially
-                            item.setBackground(QColor(60, 60, 60))
-                            item.setForeground(QColor(180, 180, 180))
-
-                # Update the column highlighting to show mapping
-                update_column_highlighting()
-
-                # Try to auto-detect date format from sample data
-                try:
-                    if date_combo.currentText() != "Not mapped":
-                        date_col_index = headers.index(date_combo.currentText())
-                        # Get a few sample dates
-                        sample_dates = []
-                        csvfile.seek(0)
-                        reader = csv.reader(csvfile, dialect)
-                        if has_header:
-                            next(reader)  # Skip header
-
-                        for i, row in enumerate(reader):
-                            if i >= 5:  # Get up to 5 samples
+            if best_matches['debit']['score'] > 0:
+                debit_combo.setCurrentIndex(best_matches['debit']['index'] + 1)
+
+            if best_matches['credit']['score'] > 0:
+                credit_combo.setCurrentIndex(best_matches['credit']['index'] + 1)
+
+            if best_matches['account']['score'] > 0:
+                account_col_combo.setCurrentIndex(best_matches['account']['index'] + 1)
+
+            if best_matches['currency']['score'] > 0:
+                currency_col_combo.setCurrentIndex(best_matches['currency']['index'] + 1)
+
+            # Highlight mapped columns
+            for i in range(header_model.columnCount()):
+                for col in range(header_model.columnCount()):
+                    item = header_model.item(0, col)
+                    if item:
+                        # Reset background initially
+                        item.setBackground(QColor(60, 60, 60))
+                        item.setForeground(QColor(180, 180, 180))
+
+            # Update the column highlighting to show mapping
+            update_column_highlighting()
+
+            # Try to auto-detect date format from sample data
+            try:
+                if date_combo.currentText() != "Not mapped":
+                    date_col_index = headers.index(date_combo.currentText())
+                    # Sample dates from every cached row
+                    sample_dates = [row[date_col_index] for row in data_rows if len(row) > date_col_index]
+
+                    # Try to determine format from samples
+                    if sample_dates:
+                        # Common formats to try
+                        formats = [
+                            ("%Y-%m-%d", "YYYY-MM-DD"),
+                            ("%m/%d/%Y", "MM/DD/YYYY"),
+                            ("%d/%m/%Y", "DD/MM/YYYY"),
+                            ("%Y/%m/%d", "YYYY/MM/DD")
+                        ]
+
+                        # Pick the format that reads the most samples, not just the first one
+                        detected = detect_date_format(sample_dates)
+                        for fmt, display_fmt in formats:
+                            if fmt == detected:
+                                date_format_combo.setCurrentText(display_fmt)
                                 break
-                            if len(row) > date_col_index:
-                                sample_dates.append(row[date_col_index])
-
-                        # Try to determine format from samples
-                        if sample_dates:
-                            # Common formats to try
-                            formats = [
-                                ("%Y-%m-%d", "YYYY-MM-DD"),
-                                ("%m/%d/%Y", "MM/DD/YYYY"),
-                                ("%d/%m/%Y", "DD/MM/YYYY"),
-                                ("%Y/%m/%d", "YYYY/MM/DD")
-                            ]
-
-                            for fmt, display_fmt in formats:
-                                try:
-                                    # Try to parse the first date
-                                    datetime.datetime.strptime(sample_dates[0], fmt)
-                                    # If successful, select this format
-                                    date_format_combo.setCurrentText(display_fmt)
-                                    break
-                                except:
-                                    continue
-                except:
-                    # If auto-detection fails, leave as Auto-detect
-                    pass
+            except:
+                # If auto-detection fails, leave as Auto-detect
+                pass
 
         except Exception as e:
             QMessageBox.warning(parent, "Error", f"Failed to parse CSV file: {str(e)}")
@@ -806,215 +764,186 @@ def import_csv_wizard(parent):
             # Get default currency
             default_currency = wizard.field("currency")
 
-            # Parse and display preview
-            with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-                reader = csv.reader(csvfile)
+            # Parse and display preview from the cached head of the file
+            session = preview_session(file_path)
+            csv_headers = session.rows[0] if has_header and session.rows else []
+            col_indices = column_indices({'has_header': has_header, 'columns': mappings}, csv_headers)
 
-                # Get the actual CSV headers first
-                csv_headers = []
-                if has_header:
-                    csv_headers = next(reader)
+            total_rows = 0
+            valid_rows = 0
+            invalid_rows = 0
 
-                # Create column index mapping directly from CSV headers
-                col_indices = {}
-                for field, mapped_column in mappings.items():
-                    if mapped_column != "Not mapped":
-                        try:
-                            if has_header:
-                                # Direct match with CSV headers
-                                col_indices[field] = csv_headers.index(mapped_column)
-                            else:
-                                # For files without headers, extract column number
-                                col_indices[field] = int(mapped_column.split()[-1]) - 1
-                        except (ValueError, IndexError) as e:
-                            print(f"Could not map {field} to {mapped_column}: {e}")
-                            continue
-
-                # Debug output
-                print("=" * 50)
-                print(f"CSV Headers from file: {csv_headers}")
-                print(f"Mappings from wizard: {mappings}")
-                print(f"Column Indices calculated: {col_indices}")
-                print("=" * 50)
-
-                total_rows = 0
-                valid_rows = 0
-                invalid_rows = 0
-
-                for row_index, row in enumerate(reader):
-                    if row_index >= 20:  # Limit preview to 20 rows
-                        break
+            for row in session.data_rows(has_header)[:20]:  # Limit preview to 20 rows
+                total_rows += 1
 
-                    total_rows += 1
-
-                    # Create a dict from the row using the pre-calculated indices
-                    row_dict = {}
-                    for field, col_index in col_indices.items():
-                        if 0 <= col_index < len(row):
-                            row_dict[field] = row[col_index]
-                        else:
-                            print(f"Column index {col_index} out of range for field {field}")
-
-                    # Process the row
-                    try:
-                        preview_row = []
-
-                        # Date
-                        date_str = row_dict.get('date', '')
-                        if date_str:
-                            if date_format != "Auto-detect":
-                                try:
-                                    # Parse with specified format
-                                    date_obj = datetime.datetime.strptime(date_str, date_format)
-                                    date_str = date_obj.strftime("%Y-%m-%d")
-                                except:
-                                    date_str = f"{date_str} (format error)"
-                            preview_row.append(QStandardItem(date_str))
-                        else:
-                            preview_row.append(QStandardItem(""))
-
-                        # Description
-                        description = row_dict.get('description', '')
-                        preview_row.append(QStandardItem(description))
-
-                        # Debit
-                        debit = None
-                        if 'debit' in row_dict:
-                            try:
-                                debit_str = row_dict['debit'].replace(',', '')
-                                debit = float(debit_str) if debit_str else None
-                                preview_row.append(QStandardItem(f"{debit:.2f}" if debit else ""))
-                            except ValueError:
-                                preview_row.append(QStandardItem("INVALID"))
-                        elif 'amount' in row_dict:
-                            try:
-                                amount_str = row_dict['amount'].replace(',', '')
-                                amount = float(amount_str) if amount_str else None
-                                if amount and amount > 0:
-                                    debit = amount
-                                    preview_row.append(QStandardItem(f"{debit:.2f}"))
-                                else:
-                                    preview_row.append(QStandardItem(""))
-                            except ValueError:
-                                preview_row.append(QStandardItem("INVALID"))
-                        else:
-                            preview_row.append(QStandardItem(""))
-
-                        # Credit
-                        credit = None
-                        if 'credit' in row_dict:
-                            try:
-                                credit_str = row_dict['credit'].replace(',', '')
-                                credit = float(credit_str) if credit_str else None
-                                preview_row.append(QStandardItem(f"{credit:.2f}" if credit else ""))
-                            except ValueError:
-                                preview_row.append(QStandardItem("INVALID"))
-                        elif 'amount' in row_dict:
-                            try:
-                                amount_str = row_dict['amount'].replace(',', '')
-                                amount = float(amount_str) if amount_str else None
-                                if amount and amount < 0:
-                                    credit = abs(amount)
-                                    preview_row.append(QStandardItem(f"{credit:.2f}"))
-                                else:
-                                    preview_row.append(QStandardItem(""))
-                            except ValueError:
-                                preview_row.append(QStandardItem("INVALID"))
-                        else:
-                            preview_row.append(QStandardItem(""))
-
-                        # Account
-                        if wizard.field("account") == "Multiple accounts (in CSV)":
-                            account = row_dict.get('account', '')
-                            preview_row.append(QStandardItem(account))
-                        else:
-                            preview_row.append(QStandardItem(wizard.field("account")))
-
-                        # Currency
-                        if 'currency' in row_dict and row_dict['currency']:
-                            currency = row_dict['currency']
-                            preview_row.append(QStandardItem(currency))
-                        else:
-                            # Use default currency
-                            preview_row.append(QStandardItem(default_currency))
-
-                        # Status
-                        is_valid = (
-                            (debit is not None or credit is not None) and
-                            description and
-                            date_str
-                        )
-
-                        if is_valid:
-                            valid_rows += 1
-                            status_item = QStandardItem("Valid")
-                            # Set green background for valid rows
-                            for item in preview_row:
-                                item.setBackground(QColor(0, 100, 0, 40))  # Light green
-                        else:
-                            invalid_rows += 1
-                            status_item = QStandardItem("Missing data")
-                            # Set red background for invalid rows
-                            for item in preview_row:
-                                item.setBackground(QColor(100, 0, 0, 40))  # Light red
-
-                        preview_row.append(status_item)
-                        data_model.appendRow(preview_row)
-
-                    except Exception as e:
-                        invalid_rows += 1
-                        error_row = [
-                            QStandardItem("ERROR"),
-                            QStandardItem(str(e)),
-                            QStandardItem(""),
-                            QStandardItem(""),
-                            QStandardItem(""),
-                            QStandardItem(default_currency),
-                            QStandardItem("Invalid")
-                        ]
-                        # Set red background for error rows
-                        for item in error_row:
-                            item.setBackground(QColor(120, 0, 0, 60))  # Darker red
-
-                        data_model.appendRow(error_row)
-
-                # Update summary labels
+                # Create a dict from the row using the pre-calculated indices
+                row_dict = {}
+                for field, col_index in col_indices.items():
+                    if 0 <= col_index < len(row):
+                        row_dict[field] = row[col_index]
+                    else:
+                        print(f"Column index {col_index} out of range for field {field}")
 
-                total_rows_label.setText(str(total_rows))
-                valid_rows_label.setText(str(valid_rows))
-                invalid_rows_label.setText(str(invalid_rows))
+                # Process the row
+                try:
+                    preview_row = []
 
-                # Update notes
-                notes = []
-                if invalid_rows > 0:
-                    notes.append(f"⚠️ {invalid_rows} rows have validation issues.")
+                    # Date
+                    date_str = row_dict.get('date', '')
+                    if date_str:
+                        if date_format != "Auto-detect":
+                            try:
+                                # Parse with specified format
+                                date_obj = datetime.datetime.strptime(date_str, date_format)
+                                date_str = date_obj.strftime("%Y-%m-%d")
+                            except:
+                                date_str = f"{date_str} (format error)"
+                        preview_row.append(QStandardItem(date_str))
+                    else:
+                        preview_row.append(QStandardItem(""))
 
-                if not mappings.get('date'):
-                    notes.append("❌ No date column mapped. Dates are required.")
+                    # Description
+                    description = row_dict.get('description', '')
+                    preview_row.append(QStandardItem(description))
 
-                if not mappings.get('description'):
-                    notes.append("⚠️ No description column mapped. Descriptions are recommended.")
+                    # Debit
+                    debit = None
+                    if 'debit' in row_dict:
+                        try:
+                            debit_str = row_dict['debit'].replace(',', '')
+                            debit = float(debit_str) if debit_str else None
+                            preview_row.append(QStandardItem(f"{debit:.2f}" if debit else ""))
+                        except ValueError:
+                            preview_row.append(QStandardItem("INVALID"))
+                    elif 'amount' in row_dict:
+                        try:
+                            amount_str = row_dict['amount'].replace(',', '')
+                            amount = float(amount_str) if amount_str else None
+                            if amount and amount > 0:
+                                debit = amount
+                                preview_row.append(QStandardItem(f"{debit:.2f}"))
+                            else:
+                                preview_row.append(QStandardItem(""))
+                        except ValueError:
+                            preview_row.append(QStandardItem("INVALID"))
+                    else:
+                        preview_row.append(QStandardItem(""))
 
-                if not (mappings.get('amount') or (mappings.get('debit') and mappings.get('credit'))):
-                    notes.append(
-                        "❌ No amount columns mapped. Either 'Amount' or both 'Debit' and 'Credit' are required.")
+                    # Credit
+                    credit = None
+                    if 'credit' in row_dict:
+                        try:
+                            credit_str = row_dict['credit'].replace(',', '')
+                            credit = float(credit_str) if credit_str else None
+                            preview_row.append(QStandardItem(f"{credit:.2f}" if credit else ""))
+                        except ValueError:
+                            preview_row.append(QStandardItem("INVALID"))
+                    elif 'amount' in row_dict:
+                        try:
+                            amount_str = row_dict['amount'].replace(',', '')
+                            amount = float(amount_str) if amount_str else None
+                            if amount and amount < 0:
+                                credit = abs(amount)
+                                preview_row.append(QStandardItem(f"{credit:.2f}"))
+                            else:
+                                preview_row.append(QStandardItem(""))
+                        except ValueError:
+                            preview_row.append(QStandardItem("INVALID"))
+                    else:
+                        preview_row.append(QStandardItem(""))
 
-                if wizard.field("account") == "Multiple accounts (in CSV)" and not mappings.get('account'):
-                    notes.append("❌ You selected 'Multiple accounts' but no account column is mapped.")
+                    # Account
+                    if wizard.field("account") == "Multiple accounts (in CSV)":
+                        account = row_dict.get('account', '')
+                        preview_row.append(QStandardItem(account))
+                    else:
+                        preview_row.append(QStandardItem(wizard.field("account")))
 
-                # Apply color-coding to notes
-                styled_notes = []
-                for note in notes:
-                    if "❌" in note:
-                        styled_notes.append(f"<span style='color:#ff5555;'>{note}</span>")
+                    # Currency
+                    if 'currency' in row_dict and row_dict['currency']:
+                        currency = row_dict['currency']
+                        preview_row.append(QStandardItem(currency))
                     else:
-                        styled_notes.append(f"<span style='color:#ffaa00;'>{note}</span>")
+                        # Use default currency
+                        preview_row.append(QStandardItem(default_currency))
+
+                    # Status
+                    is_valid = (
+                        (debit is not None or credit is not None) and
+                        description and
+                        date_str
+                    )
+
+                    if is_valid:
+                        valid_rows += 1
+                        status_item = QStandardItem("Valid")
+                        # Set green background for valid rows
+                        for item in preview_row:
+                            item.setBackground(QColor(0, 100, 0, 40))  # Light green
+                    else:
+                        invalid_rows += 1
+                        status_item = QStandardItem("Missing data")
+                        # Set red background for invalid rows
+                        for item in preview_row:
+                            item.setBackground(QColor(100, 0, 0, 40))  # Light red
+
+                    preview_row.append(status_item)
+                    data_model.appendRow(preview_row)
+
+                except Exception as e:
+                    invalid_rows += 1
+                    error_row = [
+                        QStandardItem("ERROR"),
+                        QStandardItem(str(e)),
+                        QStandardItem(""),
+                        QStandardItem(""),
+                        QStandardItem(""),
+                        QStandardItem(default_currency),
+                        QStandardItem("Invalid")
+                    ]
+                    # Set red background for error rows
+                    for item in error_row:
+                        item.setBackground(QColor(120, 0, 0, 60))  # Darker red
+
+                    data_model.appendRow(error_row)
+
+            # Update summary labels
+
+            total_rows_label.setText(str(total_rows))
+            valid_rows_label.setText(str(valid_rows))
+            invalid_rows_label.setText(str(invalid_rows))
+
+            # Update notes
+            notes = []
+            if invalid_rows > 0:
+                notes.append(f"⚠️ {invalid_rows} rows have validation issues.")
+
+            if not mappings.get('date'):
+                notes.append("❌ No date column mapped. Dates are required.")
+
+            if not mappings.get('description'):
+                notes.append("⚠️ No description column mapped. Descriptions are recommended.")
+
+            if not (mappings.get('amount') or (mappings.get('debit') and mappings.get('credit'))):
+                notes.append(
+                    "❌ No amount columns mapped. Either 'Amount' or both 'Debit' and 'Credit' are required.")
+
+            if wizard.field("account") == "Multiple accounts (in CSV)" and not mappings.get('account'):
+                notes.append("❌ You selected 'Multiple accounts' but no account column is mapped.")
+
+            # Apply color-coding to notes
+            styled_notes = []
+            for note in notes:
+                if "❌" in note:
+                    styled_notes.append(f"<span style='color:#ff5555;'>{note}</span>")
+                else:
+                    styled_notes.append(f"<span style='color:#ffaa00;'>{note}</span>")
 
-                notes_text.setHtml("<br>".join(styled_notes))
+            notes_text.setHtml("<br>".join(styled_notes))
 
-                # Update status of the finish button based on errors
-                has_critical_errors = any("❌" in note for note in notes)
-                wizard.button(QWizard.FinishButton).setEnabled(not has_critical_errors and valid_rows > 0)
+            # Update status of the finish button based on errors
+            has_critical_errors = any("❌" in note for note in notes)
+            wizard.button(QWizard.FinishButton).setEnabled(not has_critical_errors and valid_rows > 0)
 
         except Exception as e:
             QMessageBox.warning(parent, "Error", f"Failed to preview data: {str(e)}")
@@ -1051,196 +980,66 @@ def import_csv_wizard(parent):
             elif date_format == "DD/MM/YYYY":
                 date_format = "%d/%m/%Y"
 
-            # Get default account if not using multiple accounts
-            default_account_id = None
-            if wizard.field("account") != "Multiple accounts (in CSV)":
-                account_name = wizard.field("account")
-                default_account_id = db.get_account_id(account_name)
-
-            # Get default currency
-            default_currency_id = None
-            currency_name = wizard.field("currency")
-            default_currency_id = db.get_currency_id(currency_name)
-
-            # Process CSV
-            lines_data = []
-
-            # Read the entire CSV into memory once
-            with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-                all_rows = list(csv.reader(csvfile))
+            # Same mapping format as batch imports (csv_import); None means accounts come from the CSV
+            import_mapping = {
+                'has_header': has_header,
+                'columns': mappings,
+                'date_format': date_format,
+                'account': None if wizard.field("account") == "Multiple accounts (in CSV)" else wizard.field("account"),
+                'currency': wizard.field("currency"),
+                # Split rows the way the preview did
+                'delimiter': preview_session(file_path).delimiter,
+            }
 
-            # Split headers and data rows
-            if has_header and all_rows:
-                csv_headers = all_rows[0]
-                data_rows = all_rows[1:]
-            else:
-                csv_headers = []
-                data_rows = all_rows
-
-            # Create column index mapping based on actual CSV headers
-            col_indices = {}
-            for field, mapped_column in mappings.items():
-                if mapped_column != "Not mapped":
-                    try:
-                        # Find index in actual CSV headers
-                        if has_header and mapped_column in csv_headers:
-                            col_indices[field] = csv_headers.index(mapped_column)
-                        else:
-                            # For files without headers, extract column number
-                            col_num = int(mapped_column.split()[-1]) - 1
-                            col_indices[field] = col_num
-                    except (ValueError, IndexError):
-                        print(f"Could not map {field} to {mapped_column}")
-                        continue
-
-            # Debug: Print mapping information
-            print("=" * 50)
-            print(f"CSV Headers: {csv_headers}")
-            print(f"Mappings: {mappings}")
-            print(f"Column Indices: {col_indices}")
-            print("=" * 50)
-
-            # Process rows
-            for row_index, row in enumerate(data_rows):
-                    try:
-                        # Get fields from the row
-                        date_str = row[col_indices.get('date', -1)] if 'date' in col_indices and col_indices[
-                            'date'] < len(row) else ''
-                        description = row[col_indices.get('description', -1)] if 'description' in col_indices and \
-                                                                                 col_indices['description'] < len(
-                            row) else ''
-
-                        # Handle amount, debit and credit
-                        debit = None
-                        credit = None
-
-                        if 'debit' in col_indices and col_indices['debit'] < len(row):
-                            debit_str = row[col_indices['debit']].replace(',', '').strip()
-                            if debit_str:
-                                try:
-                                    debit = float(debit_str)
-                                except ValueError:
-                                    debit = None
-
-                        if 'credit' in col_indices and col_indices['credit'] < len(row):
-                            credit_str = row[col_indices['credit']].replace(',', '').strip()
-                            if credit_str:
-                                try:
-                                    credit = float(credit_str)
-                                except ValueError:
-                                    credit = None
-
-                        if debit is None and credit is None and 'amount' in col_indices and col_indices['amount'] < len(
-                                row):
-                            amount_str = row[col_indices['amount']].replace(',', '').strip()
-                            if amount_str:
-                                try:
-                                    amount = float(amount_str)
-                                    if amount > 0:
-                                        debit = amount
-                                    else:
-                                        credit = abs(amount)
-                                except ValueError:
-                                    pass
-
-                        # Get account if using multiple accounts
-                        account_id = default_account_id
-                        account_valid = True
-                        account_name = None
-
-                        if wizard.field("account") == "Multiple accounts (in CSV)" and 'account' in col_indices and \
-                                col_indices['account'] < len(row):
-                            account_name = row[col_indices['account']]
-                            try:
-                                account_id = db.get_account_id(account_name)
-                            except:
-                                # Instead of skipping, mark as invalid but keep the row
-                                account_valid = False
-                                account_id = None
-
-                        # Get currency if specified
-                        currency_id = default_currency_id
-                        currency_valid = True
-
-                        if 'currency' in col_indices and col_indices['currency'] < len(row):
-                            currency_code = row[col_indices['currency']].strip()
-                            if currency_code:
-                                try:
-                                    # Try to get currency by name
-                                    currency_id = db.get_currency_id(currency_code)
-                                except:
-                                    # If not found by name, the default will be used
-                                    currency_valid = False
-
-                        # Format date
-                        if date_str:
-                            try:
-                                if date_format != "Auto-detect":
-                                    try:
-                                        date_obj = datetime.datetime.strptime(date_str, date_format)
-                                        date_str = date_obj.strftime("%Y-%m-%d")
-                                    except ValueError:
-                                        # Try common formats if specified format fails
-                                        for fmt in ["%Y-%m-%d", "%m/%d/%Y", "%d/%m/%Y", "%Y/%m/%d"]:
-                                            try:
-                                                date_obj = datetime.datetime.strptime(date_str, fmt)
-                                                date_str = date_obj.strftime("%Y-%m-%d")
-                                                break
-                                            except ValueError:
-                                                continue
-                            except:
-                                # If date parsing fails, use current date
-                                date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-                        else:
-                            # Use current date if none provided
-                            date_str = datetime.datetime.now().strftime("%Y-%m-%d")
-
-                        # Only skip rows with no amount information at all
-                        if debit is None and credit is None:
-                            continue
-
-                        # Create line data with validity information and currency
-                        line = {
-                            'description': description,
-                            'account_id': account_id,
-                            'account_name': account_name,  # Store the original name for reference
-                            'debit': debit,
-                            'credit': credit,
-                            'date': date_str,
-                            'currency_id': currency_id,
-                            'valid': account_valid and currency_valid and (debit is not None or credit is not None)
-                        }
-
-                        # Debug output
-                        print(f"Line {row_index}: {line}")
-                        print(f"  account_valid: {account_valid}, currency_valid: {currency_valid}")
-                        print(f"  debit: {debit}, credit: {credit}")
-                        print(f"  valid: {line['valid']}")
-
-                        lines_data.append(line)
-
-                    except Exception as e:
-                        print(f"Error processing row {row_index}: {str(e)}")
-                        # Still add the row with error info
-                        lines_data.append({
-                            'description': f"Error in row {row_index + 1}: {str(e)}",
-                            'account_id': None,
-                            'account_name': None,
-                            'debit': None,
-                            'credit': None,
-                            'date': datetime.datetime.now().strftime("%Y-%m-%d"),
-                            'currency_id': default_currency_id,
-                            'valid': False,
-                        })
-                        continue
-
-            # Insert orphan transaction if we have any lines
-            if lines_data:
-                orphan_id = db.insert_orphan_transaction(reference, lines_data)
-                return orphan_id
-            else:
-                QMessageBox.warning(parent, "Import Error", "No transaction lines found in the CSV file.")
+            # Remember the mapping so batch imports of the same bank's files can reuse it
+            config = load_config()
+            config['last_import_mapping'] = import_mapping
+            save_config(config)
+
+            # An earlier import of this file that stopped part way can continue from its checkpoint
+            resume = True
+            checkpoint = db.get_import_checkpoint(file_sha256(file_path))
+            if checkpoint:
+                answer = QMessageBox.question(
+                    parent, "Resume Import",
+                    f"An import of this file stopped after {checkpoint['last_row']} rows "
+                    f"(last saved {checkpoint['updated_at']}).\n\n"
+                    f"Resume it? Choose No to discard the partial batch and start over.",
+                    QMessageBox.Yes | QMessageBox.No | QMessageBox.Cancel, QMessageBox.Yes)
+                if answer == QMessageBox.Cancel:
+                    return None
+                resume = answer == QMessageBox.Yes
+
+            # Rows are parsed and committed a chunk at a time; canceling keeps what was saved
+            progress_dialog = QProgressDialog("Importing...", "Cancel", 0, 1000, parent)
+            progress_dialog.setWindowTitle("Import CSV")
+            progress_dialog.setWindowModality(Qt.WindowModal)
+            progress_dialog.setMinimumDuration(500)
+
+            def progress(bytes_done, bytes_total):
+                progress_dialog.setValue(int(bytes_done * 1000 / bytes_total) if bytes_total else 1000)
+                QApplication.processEvents()
+                return not progress_dialog.wasCanceled()
+
+            report = import_csv_file(db, file_path, import_mapping, reference, resume, progress)
+            progress_dialog.close()
+            for error in report['errors']:
+                print(f"Error processing {error}")
+
+            if not report['complete']:
+                QMessageBox.information(
+                    parent, "Import Paused",
+                    f"The import stopped after {report['resumed_from'] + report['rows']} rows, which are saved "
+                    f"in batch #{report['orphan_id']}. Import the same file again to resume.")
                 return None
+            if report['duplicates']:
+                QMessageBox.information(
+                    parent, "Duplicates Found",
+                    f"{report['duplicates']} of the imported lines were already imported or posted. "
+                    f"They were added as ignored lines, marked as duplicates in their notes.")
+            if report['orphan_id'] is None:
+                QMessageBox.warning(parent, "Import Error", "No transaction lines found in the CSV file.")
+            return report['orphan_id']
 
         except Exception as e:
             QMessageBox.critical(parent, "Import Error", f"Failed to import CSV: {str(e)}")
@@ -1341,7 +1140,7 @@ def update_import_path(directory):
 def save_config(config):
     try:
         with open('config.json', 'w') as f:
-            json.dump(config, indent=4, sort_keys=True)
+            json.dump(config, f, indent=4)
     except:
         pass
 
@@ -1349,59 +1148,53 @@ def save_config(config):
 
 def parse_csv_data(file_path, mapping):
     """Parse CSV data with column mapping"""
-    lines_data = []
-
     with open(file_path, 'r', newline='', encoding='utf-8') as csvfile:
-        reader = csv.DictReader(csvfile)
-        for row in reader:
-            # Process each row according to mapping
-            line = {}
-
-            # Map basic fields
-            line['description'] = row.get(mapping['description'], '')
-            line['date'] = row.get(mapping['date'], '')
-            line['account_id'] = mapping['account_id']  # From wizard selection
-
-            # Handle amount - this needs to determine debit vs. credit
-            if 'amount' in mapping and mapping['amount'] in row:
-                # Single amount column - determine debit/credit by sign or indicator
-                amount_str = row[mapping['amount']].replace(',', '')
-
-                # Check if there's a separate type/indicator column
-                if 'type' in mapping and mapping['type'] in row:
-                    type_indicator = row[mapping['type']].lower()
+        rows = list(csv.DictReader(csvfile))
+
+    def column(key):
+        name = mapping.get(key)
+        return [row.get(name) for row in rows] if name else [None] * len(rows)
+
+    descriptions = column('description')
+    dates = column('date')
+
+    # Amounts are parsed a whole column at a time with one detected number format
+    if 'amount' in mapping and rows and mapping['amount'] in rows[0]:
+        amounts, _ = parse_amount_column(column('amount'))
+        debits, credits = [], []
+        types = column('type') if 'type' in mapping else None
+        for index, amount in enumerate(amounts):
+            debit = credit = None
+            if amount is not None:
+                if types is not None and types[index] is not None:
                     # Logic to determine if debit or credit based on indicator
-                    is_credit = any(word in type_indicator for word in ['cr', 'credit', 'deposit', '+'])
-                    is_debit = any(word in type_indicator for word in ['dr', 'debit', 'withdrawal', '-'])
-
-                    if is_credit:
-                        line['credit'] = abs(float(amount_str))
-                        line['debit'] = None
-                    elif is_debit:
-                        line['debit'] = abs(float(amount_str))
-                        line['credit'] = None
-                else:
+                    type_indicator = types[index].lower()
+                    if any(word in type_indicator for word in ['cr', 'credit', 'deposit', '+']):
+                        credit = abs(amount)
+                    elif any(word in type_indicator for word in ['dr', 'debit', 'withdrawal', '-']):
+                        debit = abs(amount)
+                elif amount < 0:
                     # No indicator - determine by sign
-                    amount = float(amount_str)
-                    if amount < 0:
-                        line['credit'] = abs(amount)
-                        line['debit'] = None
-                    else:
-                        line['debit'] = amount
-                        line['credit'] = None
-            else:
-                # Separate debit and credit columns
-                debit_str = row.get(mapping.get('debit', ''), '0')
-                credit_str = row.get(mapping.get('credit', ''), '0')
-
-                debit = float(debit_str.replace(',', '') or '0')
-                credit = float(credit_str.replace(',', '') or '0')
-
-                line['debit'] = debit if debit > 0 else None
-                line['credit'] = credit if credit > 0 else None
-
-            # Only add lines with valid amounts
-            if line['debit'] or line['credit']:
-                lines_data.append(line)
+                    credit = abs(amount)
+                else:
+                    debit = amount
+            debits.append(debit)
+            credits.append(credit)
+    else:
+        # Separate debit and credit columns
+        debits = [amount if amount and amount > 0 else None for amount in parse_amount_column(column('debit'))[0]]
+        credits = [amount if amount and amount > 0 else None for amount in parse_amount_column(column('credit'))[0]]
 
-    return lines_data
\ No newline at end of file
+    lines_data = []
+    for description, date, debit, credit in zip(descriptions, dates, debits, credits):
+        # Only add lines with valid amounts
+        if debit or credit:
+            lines_data.append({
+                'description': description or '',
+                'date': date or '',
+                'account_id': mapping['account_id'],  # From wizard selection
+                'debit': debit,
+                'credit': credit,
+            })
+
+    return lines_data
@@ -0,0 +1,93 @@
+from PyQt5.QtWidgets import QApplication
+from PyQt5.QtCore import QObject, QThread, QTimer, QElapsedTimer, QEvent, pyqtSignal
+from maintenance import MaintenanceRun, format_maintenance_report, MAINTENANCE_BUDGET
+
+# Seconds without keyboard or mouse input before maintenance starts
+MAINTENANCE_IDLE_SECONDS = 120
+
+# Seconds between idle runs; the tasks themselves skip when nothing changed
+MAINTENANCE_CHECK_INTERVAL = 3600
+
+# Events that count as the user being back
+USER_INPUT_EVENTS = frozenset((QEvent.KeyPress, QEvent.MouseButtonPress, QEvent.MouseMove, QEvent.Wheel,
+                               QEvent.TouchBegin))
+
+
+class MaintenanceWorker(QThread):
+    """Run a MaintenanceRun off the UI thread"""
+    failed = pyqtSignal(str)
+    done = pyqtSignal(list)
+
+    def __init__(self, maintenance_run):
+        super().__init__()
+        self.maintenance_run = maintenance_run
+
+    def run(self):
+        try:
+            results = self.maintenance_run.run()
+        except Exception as e:
+            self.failed.emit(str(e))
+            return
+        self.done.emit(results)
+
+
+class IdleMaintenance(QObject):
+    """
+    Start database maintenance once the application has had no user input for idle_seconds,
+    at most once per MAINTENANCE_CHECK_INTERVAL, and cancel it as soon as input arrives.
+    Configured by maintenance_idle_seconds (0 turns it off) and maintenance_budget in config.json.
+
+    It is off with in_memory_database: maintenance works on the file, so its statistics would
+    not reach the working copy the queries run on, and its writes would race the write-behind
+    (VACUUM may renumber the rowids it writes by). Run "python -m cli maintain" while the
+    application is closed instead.
+    """
+
+    def __init__(self, window, db_name, config):
+        super().__init__(window)
+        self.window = window
+        self.db_name = db_name
+        self.idle_seconds = config.get('maintenance_idle_seconds', MAINTENANCE_IDLE_SECONDS)
+        if config.get('in_memory_database'):
+            self.idle_seconds = 0
+        self.budget = config.get('maintenance_budget', MAINTENANCE_BUDGET)
+        self.worker = None
+        self._last_start = None
+        self._timer = QTimer(self)
+        self._timer.setSingleShot(True)
+        self._timer.timeout.connect(self.start)
+        if self.idle_seconds:
+            QApplication.instance().installEventFilter(self)
+            self._timer.start(self.idle_seconds * 1000)
+
+    def eventFilter(self, watched, event):
+        if event.type() in USER_INPUT_EVENTS:
+            if self.worker is not None and self.worker.isRunning():
+                self.worker.maintenance_run.cancel()
+            self._timer.start(self.idle_seconds * 1000)
+        return False
+
+    def start(self):
+        """Run maintenance now unless it is running or ran within MAINTENANCE_CHECK_INTERVAL"""
+        if self.worker is not None and self.worker.isRunning():
+            return
+        if self._last_start is not None and self._last_start.elapsed() < MAINTENANCE_CHECK_INTERVAL * 1000:
+            return
+        self.worker = MaintenanceWorker(MaintenanceRun(self.db_name, budget=self.budget))
+        self.worker.done.connect(self.on_done)
+        self.worker.failed.connect(lambda error: print(f"Database maintenance failed: {error}"))
+        self._last_start = QElapsedTimer()
+        self._last_start.start()
+        self.worker.start()
+
+    def on_done(self, results):
+        if any(result['status'] == 'done' for result in results):
+            self.window.statusBar().showMessage("Database maintenance: " +
+                                                format_maintenance_report(results).replace("\n", "; "), 10000)
+
+    def stop(self):
+        """Cancel a running maintenance and wait for it, before the application closes"""
+        self._timer.stop()
+        if self.worker is not None:
+            self.worker.maintenance_run.cancel()
+            self.worker.wait()
@@ -0,0 +1,81 @@
+from PyQt5.QtCore import QPersistentModelIndex, QSortFilterProxyModel
+from database import db
+
+
+def source_model(table_view):
+    """Get the QStandardItemModel behind a table view (unwrapping a sort proxy)"""
+    model = table_view.model()
+    if isinstance(model, QSortFilterProxyModel):
+        model = model.sourceModel()
+    return model
+
+
+def track_rows(model, id_column=0):
+    """Index the rows of a freshly loaded model by the ID in id_column"""
+    model.row_index = {}
+    model.id_column = id_column
+    for row in range(model.rowCount()):
+        row_id = model.item(row, id_column).text()
+        model.row_index[row_id] = QPersistentModelIndex(model.index(row, id_column))
+
+
+def find_row(model, row_id):
+    """Current row number of row_id in a tracked model, or -1"""
+    index = getattr(model, 'row_index', {}).get(str(row_id))
+    if index is None or not index.isValid():
+        return -1
+    return index.row()
+
+
+def upsert_row(model, row_id, items):
+    """Replace the row with row_id, or append it if the model doesn't have it yet"""
+    row = find_row(model, row_id)
+    if row < 0:
+        model.appendRow(items)
+        row = model.rowCount() - 1
+        model.row_index[str(row_id)] = QPersistentModelIndex(model.index(row, model.id_column))
+    else:
+        for column, item in enumerate(items):
+            model.setItem(row, column, item)
+    return row
+
+
+def remove_row(model, row_id):
+    """Remove the row with row_id if present"""
+    row = find_row(model, row_id)
+    if row >= 0:
+        model.removeRow(row)
+    getattr(model, 'row_index', {}).pop(str(row_id), None)
+
+
+def select_row_by_id(table_view, row_id):
+    """Select the row showing row_id, mapping through a sort proxy if there is one"""
+    model = source_model(table_view)
+    row = find_row(model, row_id) if model is not None else -1
+    if row < 0:
+        return False
+    index = model.index(row, 0)
+    view_model = table_view.model()
+    if isinstance(view_model, QSortFilterProxyModel):
+        index = view_model.mapFromSource(index)
+    table_view.selectRow(index.row())
+    table_view.scrollTo(index)
+    return True
+
+
+def watch_tables(table_view, tables, handler):
+    """
+    Call handler(table_view, changes) for Database change notifications on tables while
+    table_view exists. changes holds only the (table, operation, row_id, parent_id)
+    tuples for the watched tables.
+    """
+    tables = set(tables)
+
+    def listener(changes):
+        relevant = [change for change in changes if change[0] in tables]
+        if relevant and source_model(table_view) is not None:
+            handler(table_view, relevant)
+
+    db.add_change_listener(listener)
+    table_view.destroyed.connect(lambda: db.remove_change_listener(listener))
+    return listener
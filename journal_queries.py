@@ -0,0 +1,186 @@
+"""
+Queries over the journal that both the transactions page and the command-line tools run:
+the filtered transaction lines behind the transactions list, and the journal, lines and
+account balance exports. filter_params is the dict the transactions filter dialog builds
+(date_from, date_to, account_id, transaction_id, description, min_amount, max_amount), or
+the one a saved filter profile compiles to, which adds a predicate over the lines (tl).
+Every builder returns (query, params).
+
+lines is the table expression the transaction lines are read from: transaction_lines, or
+with year archives the one lines_source() returns for the filter's date range.
+"""
+
+
+def lines_source(database, filter_params=None):
+    """database.transaction_lines_source() for the date range of filter_params"""
+    filter_params = filter_params or {}
+    return database.transaction_lines_source(filter_params.get('date_from'), filter_params.get('date_to'))
+
+
+def build_filtered_lines_query(filter_params=None, lines="transaction_lines"):
+    """
+    Build the query selecting the transaction lines that match filter_params
+    (date range, account, transaction and description filters). Returns (query, params).
+    """
+    # Build the query dynamically based on filters
+    base_query = f"""
+        SELECT tl.transaction_id, tl.date, tl.debit, tl.account_id
+        FROM {lines} tl
+    """
+
+    join_clause = ""
+    where_clauses = []
+    params = []
+
+    # Apply filters if provided
+    if filter_params:
+        if 'date_from' in filter_params:
+            where_clauses.append("tl.date >= ?")
+            params.append(filter_params['date_from'])
+
+        if 'date_to' in filter_params:
+            where_clauses.append("tl.date <= ?")
+            params.append(filter_params['date_to'])
+
+        if 'account_id' in filter_params:
+            where_clauses.append("tl.account_id = ?")
+            params.append(filter_params['account_id'])
+
+        if 'transaction_id' in filter_params:
+            where_clauses.append("tl.transaction_id = ?")
+            params.append(filter_params['transaction_id'])
+
+        if 'description' in filter_params:
+            join_clause = " JOIN transactions t ON tl.transaction_id = t.id"
+            where_clauses.append("t.description LIKE ?")
+            params.append(f"%{filter_params['description']}%")
+
+        # A compiled saved filter profile (filter_profiles.compile_criteria)
+        if 'predicate' in filter_params:
+            where_clauses.append(f"({filter_params['predicate']})")
+            params.extend(filter_params['predicate_params'])
+
+    # Build the filtered lines query
+    filtered_query = base_query + join_clause
+
+    # Add WHERE clause if we have conditions
+    if where_clauses:
+        filtered_query += " WHERE " + " AND ".join(where_clauses)
+
+    return filtered_query, params
+
+
+TRANSACTION_EXPORT_HEADERS = ["ID", "Date", "Description", "Amount", "Currency",
+                              "Credit Accounts", "Debit Accounts"]
+TRANSACTION_LINES_EXPORT_HEADERS = ["Line ID", "Transaction ID", "Date", "Description", "Account",
+                                    "Classification", "Debit", "Credit", "Currency"]
+ACCOUNT_BALANCES_EXPORT_HEADERS = ["Account", "Category", "Currency", "Total Debit", "Total Credit", "Balance"]
+
+
+def _export_summary_cte(filter_params=None, lines="transaction_lines"):
+    """
+    The "summary" CTE shared by the export queries: one row per transaction matching
+    filter_params, as in get_transactions_with_summary but without paging.
+    Returns (cte, params).
+    """
+    filtered_query, params = build_filtered_lines_query(filter_params, lines)
+
+    # Amount filters work on the summed debit, so they go in HAVING
+    having_clauses = []
+    if filter_params:
+        if 'min_amount' in filter_params:
+            having_clauses.append("total_debit >= ?")
+            params.append(filter_params['min_amount'])
+        if 'max_amount' in filter_params:
+            having_clauses.append("total_debit <= ?")
+            params.append(filter_params['max_amount'])
+    having = (" HAVING " + " AND ".join(having_clauses)) if having_clauses else ""
+
+    cte = f"""
+        WITH filtered_lines AS ({filtered_query}),
+        summary AS (
+            SELECT t.id, t.description, t.currency_id,
+                   SUM(IFNULL(fl.debit, 0)) as total_debit,
+                   MIN(fl.date) as earliest_date
+            FROM transactions t
+            JOIN filtered_lines fl ON t.id = fl.transaction_id
+            GROUP BY t.id, t.description, t.currency_id{having}
+        )
+    """
+    return cte, params
+
+
+def transaction_export_query(filter_params=None, lines="transaction_lines"):
+    """
+    One query producing every exported journal row: the transaction summary plus the
+    distinct "account: classification" pairs of each side, newline-separated.
+    Returns (query, params); rows match TRANSACTION_EXPORT_HEADERS.
+    """
+    cte, params = _export_summary_cte(filter_params, lines)
+
+    # A line counts on the credit side if it has a credit, otherwise on the debit side if it has a debit
+    side_accounts = f"""
+        (SELECT GROUP_CONCAT(label, char(10)) FROM (
+            SELECT DISTINCT IFNULL(a.name, 'Unknown') || IFNULL(': ' || NULLIF(c.name, ''), '') AS label
+            FROM {lines} tl
+            LEFT JOIN accounts a ON tl.account_id = a.id
+            LEFT JOIN classifications c ON tl.classification_id = c.id
+            WHERE tl.transaction_id = s.id AND {{side}}
+            ORDER BY label))
+    """
+    query = f"""{cte}
+        SELECT s.id, IFNULL(s.earliest_date, 'N/A'), s.description,
+               printf('%.2f', s.total_debit), IFNULL(cur.name, 'Unknown'),
+               {side_accounts.format(side="tl.credit > 0")},
+               {side_accounts.format(side="IFNULL(tl.credit, 0) <= 0 AND tl.debit > 0")}
+        FROM summary s
+        LEFT JOIN currency cur ON s.currency_id = cur.id
+        ORDER BY s.earliest_date DESC, s.id DESC
+    """
+    return query, params
+
+
+def transaction_page_query(filter_params=None, limit=50, offset=0, lines="transaction_lines"):
+    """One page of the journal rows of transaction_export_query(), newest first"""
+    query, params = transaction_export_query(filter_params, lines)
+    return query + " LIMIT ? OFFSET ?", params + [limit, offset]
+
+
+def transaction_count_query(filter_params=None, lines="transaction_lines"):
+    """The number of transactions matching filter_params, amount filters included"""
+    cte, params = _export_summary_cte(filter_params, lines)
+    return f"{cte} SELECT COUNT(*) FROM summary", params
+
+
+def transaction_lines_export_query(filter_params=None, lines="transaction_lines"):
+    """Every line of the exported transactions; rows match TRANSACTION_LINES_EXPORT_HEADERS"""
+    cte, params = _export_summary_cte(filter_params, lines)
+    query = f"""{cte}
+        SELECT tl.id, tl.transaction_id, tl.date, s.description, IFNULL(a.name, 'Unknown'),
+               IFNULL(c.name, ''), tl.debit, tl.credit, IFNULL(cur.name, 'Unknown')
+        FROM summary s
+        JOIN {lines} tl ON tl.transaction_id = s.id
+        LEFT JOIN accounts a ON tl.account_id = a.id
+        LEFT JOIN classifications c ON tl.classification_id = c.id
+        LEFT JOIN currency cur ON s.currency_id = cur.id
+        ORDER BY s.earliest_date DESC, tl.transaction_id, tl.id
+    """
+    return query, params
+
+
+def account_balances_export_query(filter_params=None, lines="transaction_lines"):
+    """Per-account totals over the exported transactions; rows match ACCOUNT_BALANCES_EXPORT_HEADERS"""
+    cte, params = _export_summary_cte(filter_params, lines)
+    query = f"""{cte}
+        SELECT IFNULL(a.name, 'Unknown'), IFNULL(cat.name, ''), IFNULL(cur.name, ''),
+               ROUND(SUM(IFNULL(tl.debit, 0)), 2), ROUND(SUM(IFNULL(tl.credit, 0)), 2),
+               ROUND(SUM(IFNULL(tl.debit, 0)) - SUM(IFNULL(tl.credit, 0)), 2)
+        FROM summary s
+        JOIN {lines} tl ON tl.transaction_id = s.id
+        LEFT JOIN accounts a ON tl.account_id = a.id
+        LEFT JOIN cat ON a.cat_id = cat.id
+        LEFT JOIN currency cur ON a.default_currency_id = cur.id
+        GROUP BY tl.account_id
+        ORDER BY IFNULL(a.name, 'Unknown')
+    """
+    return query, params
@@ -0,0 +1,219 @@
+"""
+Database maintenance: PRAGMA optimize, ANALYZE and VACUUM, run while the application is
+idle (gui/maintenance_utils.py) or from the command line:
+
+    python -m cli maintain --budget 60
+
+MaintenanceRun works through the tasks on its own connection within a time budget. A task
+is skipped when nothing was committed to the file since it last ran (the maintenance_runs
+table records when each task ran, how long it took and the file's change counter after
+the run), when it ran less than its interval ago, or when its last run took longer than
+the budget left; VACUUM also waits until enough of the file is free pages. A SQLite progress
+handler stops the running statement as soon as the budget runs out or cancel() is called,
+and an interrupted ANALYZE or VACUUM rolls back, leaving the database as it was.
+"""
+import json
+import time
+import sqlite3
+import datetime
+
+# Tasks in the order they run, cheapest first
+MAINTENANCE_TASKS = ('optimize', 'analyze', 'vacuum')
+
+# Seconds a task waits after its last run before it runs again, even if the data changed
+TASK_INTERVALS = {'optimize': 3600, 'analyze': 86400, 'vacuum': 7 * 86400}
+
+# Seconds a run may take; a statement still going then is interrupted
+MAINTENANCE_BUDGET = 30.0
+
+# Rows PRAGMA optimize samples per index when it decides to re-analyze (SQLite's recommendation)
+OPTIMIZE_ANALYSIS_LIMIT = 400
+
+# VACUUM only when at least this share of the file's pages are free
+VACUUM_MIN_FREE_RATIO = 0.1
+
+# Seconds to wait for the application to release the file before giving up on a task
+MAINTENANCE_BUSY_TIMEOUT = 1.0
+
+# SQLite virtual machine steps between checks of the budget and cancel()
+_PROGRESS_STEPS = 1000
+
+
+def change_mark(db_name):
+    """
+    The file change counter of db_name's header, which SQLite increments with every
+    committed write in the rollback journal mode the application uses, updates included.
+    Reading it is one small read however large the database is.
+    """
+    with open(db_name, 'rb') as f:
+        header = f.read(28)
+    return int.from_bytes(header[24:28], 'big')
+
+
+def last_runs(conn):
+    """{task: (last_run datetime, seconds, change mark)} from maintenance_runs"""
+    return {task: (datetime.datetime.fromisoformat(last_run), seconds, json.loads(mark))
+            for task, last_run, seconds, mark in conn.execute(
+                "SELECT task, last_run, seconds, change_mark FROM maintenance_runs")}
+
+
+def free_ratio(conn):
+    """Share of the main file's pages that are on the freelist"""
+    pages = conn.execute("PRAGMA page_count").fetchone()[0]
+    return conn.execute("PRAGMA freelist_count").fetchone()[0] / pages if pages else 0.0
+
+
+def _optimize(conn):
+    conn.execute(f"PRAGMA analysis_limit = {OPTIMIZE_ANALYSIS_LIMIT}")
+    conn.execute("PRAGMA optimize")
+
+
+def _analyze(conn):
+    conn.execute("PRAGMA analysis_limit = 0")
+    conn.execute("ANALYZE")
+
+
+def _vacuum(conn):
+    conn.execute("VACUUM")
+
+
+TASK_STATEMENTS = {'optimize': _optimize, 'analyze': _analyze, 'vacuum': _vacuum}
+
+
+class MaintenanceRun:
+    """
+    One maintenance run over db_name. run() may be called on a worker thread and cancel()
+    from any other; tasks defaults to MAINTENANCE_TASKS, and force runs every task
+    regardless of changes, intervals and free pages (still within the budget).
+    """
+
+    def __init__(self, db_name, tasks=None, budget=MAINTENANCE_BUDGET, force=False):
+        unknown = [task for task in tasks or () if task not in TASK_STATEMENTS]
+        if unknown:
+            raise ValueError(f"Unknown maintenance tasks: {', '.join(unknown)}")
+        self.db_name = db_name
+        self.tasks = [task for task in MAINTENANCE_TASKS if tasks is None or task in tasks]
+        self.budget = budget
+        self.force = force
+        self._cancelled = False
+        self._deadline = None
+
+    def cancel(self):
+        """Stop the run: the running statement is interrupted and no further task starts"""
+        self._cancelled = True
+
+    def _interrupt(self):
+        # Non-zero stops the statement with "interrupted"
+        return self._cancelled or time.perf_counter() > self._deadline
+
+    def _skip_reason(self, conn, task, last, mark, remaining):
+        if self.force:
+            return None
+        if task == 'vacuum':
+            ratio = free_ratio(conn)
+            if ratio < VACUUM_MIN_FREE_RATIO:
+                return f"{ratio:.0%} of the file is free pages"
+        if last is None:
+            return None
+        last_run, seconds, last_mark = last
+        if last_mark == mark:
+            return "nothing changed since the last run"
+        if (datetime.datetime.now() - last_run).total_seconds() < TASK_INTERVALS[task]:
+            return f"ran at {last_run:%Y-%m-%d %H:%M}"
+        if seconds > remaining:
+            return f"the last run took {seconds:.1f}s, more than the {remaining:.1f}s left"
+        return None
+
+    def run(self, progress=None):
+        """
+        Run the tasks in order and return one result dict per task: task, status ('done',
+        'skipped', 'cancelled', 'out of time' or 'busy'), reason and seconds.
+        progress(task) is called before each task starts.
+        """
+        start = time.perf_counter()
+        self._deadline = start + self.budget
+        results = []
+        conn = sqlite3.connect(self.db_name, timeout=MAINTENANCE_BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False)
+        try:
+            conn.set_progress_handler(self._interrupt, _PROGRESS_STEPS)
+            runs = last_runs(conn)
+            mark = change_mark(self.db_name)
+            busy = False
+            for task in self.tasks:
+                result = {'task': task, 'status': 'skipped', 'reason': None, 'seconds': 0.0}
+                results.append(result)
+                # Once the application holds the file, the remaining tasks would only wait for it too
+                if busy:
+                    result.update(status='busy', reason="the database is in use")
+                    continue
+                if self._cancelled:
+                    result.update(status='cancelled', reason="cancelled before it started")
+                    continue
+                remaining = self._deadline - time.perf_counter()
+                if remaining <= 0:
+                    result.update(status='out of time', reason="the budget ran out before it started")
+                    continue
+                try:
+                    reason = self._skip_reason(conn, task, runs.get(task), mark, remaining)
+                    if reason:
+                        result['reason'] = reason
+                        continue
+                    if progress:
+                        progress(task)
+                    task_start = time.perf_counter()
+                    TASK_STATEMENTS[task](conn)
+                    result['seconds'] = time.perf_counter() - task_start
+                    conn.execute("INSERT OR REPLACE INTO maintenance_runs (task, last_run, seconds, change_mark) "
+                                 "VALUES (?, datetime('now', 'localtime'), ?, ?)",
+                                 (task, result['seconds'], json.dumps(mark)))
+                    result['status'] = 'done'
+                except sqlite3.OperationalError as e:
+                    if 'interrupted' in str(e):
+                        result.update(status='cancelled' if self._cancelled else 'out of time',
+                                      reason="interrupted and rolled back")
+                    elif 'locked' in str(e) or 'busy' in str(e):
+                        result.update(status='busy', reason="the database is in use")
+                        busy = True
+                    else:
+                        raise
+            self._settle_marks(conn, [result['task'] for result in results if result['status'] == 'done'])
+        finally:
+            conn.close()
+        return results
+
+    def _settle_marks(self, conn, tasks):
+        """
+        Record the change counter the file will have once this run's own writes are done,
+        so they do not count as changes next time: the counter is read inside the final
+        write transaction, which raises it by one when it commits.
+        """
+        if not tasks:
+            return
+        conn.set_progress_handler(None, 0)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except sqlite3.OperationalError:
+            # The application is writing; the tasks count the file as changed next time
+            return
+        try:
+            conn.execute(f"UPDATE maintenance_runs SET change_mark = ? "
+                         f"WHERE task IN ({', '.join('?' * len(tasks))})",
+                         [json.dumps(change_mark(self.db_name) + 1), *tasks])
+            conn.execute("COMMIT")
+        except sqlite3.Error:
+            conn.execute("ROLLBACK")
+            raise
+
+
+def run_maintenance(db_name, tasks=None, budget=MAINTENANCE_BUDGET, force=False):
+    """Run the maintenance tasks of db_name once; see MaintenanceRun.run()"""
+    return MaintenanceRun(db_name, tasks, budget, force).run()
+
+
+def format_maintenance_report(results):
+    """One line per task of a MaintenanceRun.run() result"""
+    return "\n".join(f"{result['task']}: {result['status']}"
+                     + (f" in {result['seconds']:.2f}s" if result['status'] == 'done' else "")
+                     + (f" ({result['reason']})" if result['reason'] else "")
+                     for result in results)
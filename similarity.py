@@ -0,0 +1,191 @@
+"""
+Similarity clustering of orphan line descriptions with MinHash and LSH.
+
+Descriptions are reduced to a key without digits (card numbers, references and dates vary
+between otherwise identical lines) and to a skeleton of each word without its inner vowels,
+so abbreviations land close to the full name ("AMZN Mktp" and "AMAZON MARKETPLACE" become
+"amzn mktp" and "amzn mrktplc"). Character shingles of the skeleton are MinHashed into a
+fixed-length signature whose agreement estimates the Jaccard similarity of two descriptions.
+The first word, which is nearly always the payee, counts twice, so "ACME PHARMACY" is
+closer to "ACME" than to "BELLO PHARMACY".
+
+cluster_lines() hashes every distinct key of a batch once, buckets the signatures by LSH
+bands and joins lines that share a bucket and agree closely enough, so building the
+clusters stays close to linear in the number of lines instead of comparing every pair.
+"""
+import re
+import zlib
+import random
+
+from database import normalize_description
+
+# Characters per shingle, taken from each skeleton word padded with spaces
+SHINGLE_SIZE = 3
+
+# Signature length, split into LSH_BANDS bands of NUM_PERMUTATIONS // LSH_BANDS values
+NUM_PERMUTATIONS = 64
+LSH_BANDS = 32
+
+# Estimated Jaccard similarity at which two descriptions belong to the same cluster
+SIMILARITY_THRESHOLD = 0.4
+
+# Card and transfer boilerplate that banks put around the payee
+FILLER_WORDS = frozenset({'pos', 'card', 'purchase', 'payment', 'debit', 'credit', 'visa', 'mastercard', 'ach',
+                          'transfer', 'trf', 'atm', 'online', 'contactless', 'ref'})
+
+# Words in more than this share of a batch's descriptions (and at least COMMON_WORD_MINIMUM
+# of them) say nothing about the payee and are left out of the shingles
+COMMON_WORD_SHARE = 0.05
+COMMON_WORD_MINIMUM = 20
+
+# Universal hashing modulus (a Mersenne prime above every 32-bit shingle hash)
+_PRIME = (1 << 61) - 1
+
+_INNER_VOWELS = re.compile(r'(?<=.)[aeiou]+')
+
+
+def description_key(description):
+    """Normalised description without the words that contain digits"""
+    return ' '.join(word for word in normalize_description(description).split()
+                    if not any(char.isdigit() for char in word))
+
+
+def skeleton(key):
+    """Words of a description key without their vowels after the first letter"""
+    return ' '.join(_INNER_VOWELS.sub('', word) for word in key.split())
+
+
+def shingles(key, size=SHINGLE_SIZE):
+    """Character shingles of the skeleton of a description key, plus marked copies of the first word's"""
+    result = set()
+    for position, word in enumerate(skeleton(key).split()):
+        padded = f" {word} "
+        word_shingles = [padded[i:i + size] for i in range(len(padded) - size + 1)]
+        result.update(word_shingles)
+        if position == 0:
+            result.update('^' + shingle for shingle in word_shingles)
+    return result
+
+
+class MinHasher:
+    """
+    MinHash signatures of shingle sets under num_permutations seeded hash functions. The
+    permuted values of each shingle are computed once and reused by every description
+    containing it, which is what makes a batch of thousands of lines cheap to hash.
+    """
+
+    def __init__(self, num_permutations=NUM_PERMUTATIONS, seed=1):
+        generator = random.Random(seed)
+        self.num_permutations = num_permutations
+        self._coefficients = [(generator.randrange(1, _PRIME), generator.randrange(0, _PRIME))
+                              for _ in range(num_permutations)]
+        self._shingle_values = {}
+
+    def _values(self, shingle):
+        values = self._shingle_values.get(shingle)
+        if values is None:
+            base = zlib.crc32(shingle.encode('utf-8'))
+            values = tuple((a * base + b) % _PRIME for a, b in self._coefficients)
+            self._shingle_values[shingle] = values
+        return values
+
+    def signature(self, shingle_set):
+        """Signature tuple of a shingle set, or None for an empty set"""
+        if not shingle_set:
+            return None
+        return tuple(map(min, zip(*(self._values(shingle) for shingle in shingle_set))))
+
+
+def estimated_similarity(signature, other):
+    """Fraction of agreeing signature values, an estimate of the Jaccard similarity"""
+    if signature is None or other is None:
+        return 0.0
+    return sum(1 for a, b in zip(signature, other) if a == b) / len(signature)
+
+
+def _find(parents, item):
+    root = item
+    while parents[root] != root:
+        root = parents[root]
+    # Path compression keeps later lookups flat
+    while parents[item] != root:
+        parents[item], item = root, parents[item]
+    return root
+
+
+def common_words(keys, share=COMMON_WORD_SHARE, minimum=COMMON_WORD_MINIMUM):
+    """FILLER_WORDS plus the words found in more than share of the keys (and at least minimum of them)"""
+    counts = {}
+    for key in keys:
+        for word in set(key.split()):
+            counts[word] = counts.get(word, 0) + 1
+    limit = max(minimum, share * len(keys))
+    return FILLER_WORDS | {word for word, count in counts.items() if count > limit}
+
+
+def cluster_keys(keys, threshold=SIMILARITY_THRESHOLD, hasher=None, bands=LSH_BANDS):
+    """
+    Group description keys by similarity. Returns {key: cluster leader key}; keys with no
+    shingles (nothing but digits) stay on their own.
+    """
+    hasher = hasher or MinHasher()
+    rows = hasher.num_permutations // bands
+    keys = list(keys)
+    ignored = common_words(keys)
+    signatures = {}
+    for key in keys:
+        words = [word for word in key.split() if word not in ignored]
+        # A description made only of common words is still compared on those words
+        signatures[key] = hasher.signature(shingles(' '.join(words) if words else key))
+
+    # Union-find over keys; the root of each set is its leader, the first key that started it.
+    # A key only joins a cluster whose leader it resembles, so clusters cannot drift through
+    # long chains of each-slightly-different descriptions.
+    parents = {key: key for key in keys}
+    buckets = {}
+    for key in keys:
+        signature = signatures[key]
+        if signature is None:
+            continue
+        for band in range(bands):
+            bucket = (band, signature[band * rows:(band + 1) * rows])
+            representative = buckets.setdefault(bucket, key)
+            if representative == key:
+                continue
+            root, leader = _find(parents, key), _find(parents, representative)
+            if root != leader and estimated_similarity(signatures[root], signatures[leader]) >= threshold:
+                parents[root] = leader
+
+    return {key: _find(parents, key) for key in keys}
+
+
+def cluster_lines(lines, threshold=SIMILARITY_THRESHOLD, min_size=2, hasher=None):
+    """
+    Cluster orphan line dicts by description. Returns lists of lines with at least min_size
+    members, largest first, each in the order the lines were given.
+    """
+    keys = [description_key(line['description']) for line in lines]
+    roots = cluster_keys(set(keys), threshold, hasher)
+
+    clusters = {}
+    for line, key in zip(lines, keys):
+        clusters.setdefault(roots[key], []).append(line)
+    return sorted((members for members in clusters.values() if len(members) >= min_size),
+                  key=lambda members: (-len(members), members[0]['id']))
+
+
+def cluster_orphan_lines(database, orphan_transaction_id=None, status='new', threshold=SIMILARITY_THRESHOLD,
+                         min_size=2):
+    """cluster_lines() over the orphan lines of one batch (or of every batch) with the given status"""
+    return cluster_lines(database.get_orphan_lines(orphan_transaction_id, status=status), threshold, min_size)
+
+
+def cluster_label(cluster, max_length=60):
+    """Short description of a cluster for lists: its most common description and size"""
+    counts = {}
+    for line in cluster:
+        counts[line['description']] = counts.get(line['description'], 0) + 1
+    description = max(counts, key=counts.get)
+    if len(description) > max_length:
+        description = description[:max_length - 3] + "..."
+    return f"{description} ({len(cluster)} lines)"
@@ -0,0 +1,250 @@
+"""
+OFX/QFX and QIF bank statement imports on the same orphan transaction pipeline as CSV.
+
+Both readers stream the file and yield each transaction as a row in STATEMENT_COLUMNS
+order, with the byte offset just past it. From there the rows take the CSV path:
+parse_csv_rows() converts dates and amounts a chunk at a time, and write_import_rows()
+checks duplicates and bulk-inserts each chunk with a checkpoint. Memory and time per
+transaction stay the same however many years the export covers.
+
+A statement mapping is the CSV mapping without 'columns' or 'has_header':
+    'account':     account name for every line, or None to use the account in the file
+    'currency':    default currency name, for lines whose file names no currency
+    'date_format': QIF only; strptime format tried first, or "Auto-detect"
+    'duplicates':  'flag' (default) or 'skip'
+"""
+import os
+import re
+import json
+import time
+import codecs
+import html
+import itertools
+
+from csv_import import (DETECTION_SAMPLE_ROWS, IMPORT_CHUNK_ROWS, begin_import, fix_formats, parse_csv_rows,
+                        write_import_rows)
+
+# Column order of the rows the readers yield
+STATEMENT_COLUMNS = ['date', 'description', 'amount', 'account', 'currency']
+STATEMENT_INDICES = {field: index for index, field in enumerate(STATEMENT_COLUMNS)}
+
+OFX_EXTENSIONS = ('.ofx', '.qfx')
+QIF_EXTENSIONS = ('.qif',)
+STATEMENT_EXTENSIONS = OFX_EXTENSIONS + QIF_EXTENSIONS
+
+# Bytes read and tokenized at a time
+READ_BLOCK_SIZE = 256 * 1024
+
+# OFX dates start with YYYYMMDD; the time and time zone that may follow are dropped
+OFX_DATE_FORMAT = "%Y%m%d"
+
+# One OFX element: closing flag, tag name and the text up to the next tag. SGML (OFX 1.x)
+# leaves leaf elements unclosed, so a tag followed by text is a value in both versions.
+OFX_TAG_RE = re.compile(r"<(/?)([A-Za-z0-9_.]+)[^>]*>([^<]*)")
+
+# QIF account types whose records are transactions (lists of categories, classes and
+# memorized payees use the same record syntax and are skipped)
+QIF_TRANSACTION_TYPES = ('bank', 'cash', 'ccard', 'oth a', 'oth l', 'invst')
+
+
+def statement_kind(file_path):
+    """'ofx', 'qif' or None, from the file extension"""
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension in OFX_EXTENSIONS:
+        return 'ofx'
+    if extension in QIF_EXTENSIONS:
+        return 'qif'
+    return None
+
+
+def _description(name, memo):
+    """Payee and memo as one description, without repeating the memo when it equals the payee"""
+    name = (name or '').strip()
+    memo = (memo or '').strip()
+    if name and memo and memo != name:
+        return f"{name} - {memo}"
+    return name or memo
+
+
+def _ofx_encoding(head):
+    """Text encoding of an OFX file from its first bytes: the SGML CHARSET header or the XML declaration"""
+    charset = re.search(rb"CHARSET:\s*(\S+)", head)
+    if charset and charset.group(1).isdigit():
+        return f"cp{charset.group(1).decode('ascii')}"
+    declared = re.search(rb"encoding=[\"']([A-Za-z0-9_-]+)", head)
+    if declared:
+        return declared.group(1).decode('ascii')
+    return 'utf-8'
+
+
+def read_ofx(file_path):
+    """
+    Yield (row, end_offset) for every STMTTRN of an OFX or QFX file (1.x SGML or 2.x XML),
+    reading READ_BLOCK_SIZE bytes at a time. The account is the statement's ACCTID and the
+    currency the transaction's CURSYM, else the statement's CURDEF.
+    """
+    with open(file_path, 'rb') as statement:
+        head = statement.read(1024)
+        statement.seek(0)
+        try:
+            decoder = codecs.getincrementaldecoder(_ofx_encoding(head))(errors='replace')
+        except LookupError:
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+        account = None
+        currency = None
+        transaction = None
+        bytes_read = 0
+        pending = ''
+        while True:
+            block = statement.read(READ_BLOCK_SIZE)
+            bytes_read += len(block)
+            text = pending + decoder.decode(block, final=not block)
+            # Tokenize up to the last '<': a value's text always ends where the next tag starts
+            cut = len(text) if not block else text.rfind('<')
+            if cut <= 0:
+                pending = text
+                if not block:
+                    break
+                continue
+            pending = text[cut:]
+
+            for match in OFX_TAG_RE.finditer(text, 0, cut):
+                closing, tag, value = match.groups()
+                tag = tag.upper()
+                if closing:
+                    if tag == 'STMTTRN' and transaction is not None:
+                        yield [transaction.get('DTPOSTED', '')[:8],
+                               _description(transaction.get('NAME'), transaction.get('MEMO'))
+                               or transaction.get('TRNTYPE', ''),
+                               transaction.get('TRNAMT', ''),
+                               account,
+                               transaction.get('CURSYM') or currency], bytes_read
+                        transaction = None
+                    continue
+                if tag == 'STMTTRN':
+                    transaction = {}
+                    continue
+                value = value.strip()
+                if not value:
+                    continue
+                value = html.unescape(value)
+                if transaction is not None:
+                    transaction.setdefault(tag, value)
+                elif tag == 'ACCTID':
+                    account = value
+                elif tag == 'CURDEF':
+                    currency = value
+
+            if not block:
+                break
+
+
+def read_qif(file_path):
+    """
+    Yield (row, end_offset) for every transaction record of a QIF file. Records of the
+    !Account blocks set the account of the transactions that follow; category, class and
+    memorized lists are skipped. Split lines are left out, the record total is used.
+    """
+    with open(file_path, 'rb') as statement:
+        transactions = True
+        in_account_block = False
+        account = None
+        record = {}
+        for raw_line in iter(statement.readline, b''):
+            line = raw_line.decode('utf-8', errors='replace').rstrip('\r\n')
+            if not line:
+                continue
+            code, value = line[0], line[1:].strip()
+
+            if code == '!':
+                header = value.lower()
+                if header.startswith('type:'):
+                    transactions = header[5:].strip() in QIF_TRANSACTION_TYPES
+                    in_account_block = False
+                elif header == 'account':
+                    in_account_block = True
+                record = {}
+                continue
+
+            if code == '^':
+                if in_account_block:
+                    account = record.get('N') or account
+                elif transactions and ('T' in record or 'U' in record):
+                    # QIF writes two-digit years after an apostrophe (1/ 5'24) and pads with spaces
+                    date = record.get('D', '').replace("'", '/').replace(' ', '')
+                    yield [date,
+                           _description(record.get('P'), record.get('M')) or record.get('L', ''),
+                           record.get('T', record.get('U', '')),
+                           account,
+                           None], statement.tell()
+                record = {}
+                continue
+
+            # Keep the first value of each code; later S/E/$ codes belong to splits
+            record.setdefault(code, value)
+
+
+def read_statement(file_path):
+    """(row, end_offset) pairs of an OFX/QFX or QIF file"""
+    kind = statement_kind(file_path)
+    if kind == 'ofx':
+        return read_ofx(file_path)
+    if kind == 'qif':
+        return read_qif(file_path)
+    raise ValueError(f"Unsupported statement format: {os.path.basename(file_path)}")
+
+
+def parse_statement_file(file_path, mapping):
+    """
+    Parse a whole statement file without the database, like csv_import.parse_csv_file().
+    Returns a report dict: file, rows, lines, errors and seconds.
+    """
+    start = time.perf_counter()
+    import_mapping = _statement_mapping(file_path, mapping)
+    rows = [row for row, _ in read_statement(file_path)]
+    import_mapping = fix_formats(import_mapping, rows[:DETECTION_SAMPLE_ROWS], STATEMENT_INDICES)
+    lines, errors = parse_csv_rows(rows, STATEMENT_INDICES, import_mapping)
+    return {
+        'file': file_path,
+        'rows': len(rows),
+        'lines': lines,
+        'errors': errors,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def _statement_mapping(file_path, mapping):
+    """The CSV-style mapping for a statement file's rows"""
+    import_mapping = dict(mapping, has_header=False)
+    import_mapping['columns'] = {field: f"Column {index + 1}" for field, index in STATEMENT_INDICES.items()}
+    if statement_kind(file_path) == 'ofx':
+        import_mapping['date_format'] = OFX_DATE_FORMAT
+        # OFX amounts may use either separator, so it is detected rather than assumed
+        import_mapping.pop('decimal_separator', None)
+    return import_mapping
+
+
+def import_statement_file(database, file_path, mapping, reference=None, resume=True, progress=None,
+                          chunk_rows=IMPORT_CHUNK_ROWS):
+    """
+    Stream an OFX/QFX or QIF file into an orphan transaction batch in checkpointed chunks,
+    like csv_import.import_csv_file() (same arguments and report). An interrupted import
+    resumes by skipping the transactions the checkpoint says were already written.
+    """
+    start = time.perf_counter()
+    file_hash, checkpoint, report = begin_import(database, file_path, resume)
+
+    if checkpoint:
+        import_mapping = json.loads(checkpoint['mapping'])
+    else:
+        # Date format and decimal separator come from the first transactions and stay fixed
+        sample = [row for row, _ in itertools.islice(read_statement(file_path), DETECTION_SAMPLE_ROWS)]
+        import_mapping = fix_formats(_statement_mapping(file_path, mapping), sample, STATEMENT_INDICES)
+        checkpoint = database.start_import_checkpoint(
+            file_hash, os.path.abspath(file_path), reference or os.path.basename(file_path),
+            json.dumps(import_mapping))
+
+    rows = itertools.islice(read_statement(file_path), checkpoint['last_row'], None)
+    return write_import_rows(database, checkpoint, rows, STATEMENT_INDICES, import_mapping, report, start,
+                             progress, os.path.getsize(file_path), chunk_rows)
@@ -0,0 +1,33 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from categorization import RuleMatcher, validate_rule
+
+
+def make_rule(rule_id, pattern, match_type='regex'):
+    return {'id': rule_id, 'name': f"rule {rule_id}", 'pattern': pattern, 'match_type': match_type,
+            'direction': 'any', 'min_amount': None, 'max_amount': None, 'source_account_id': None}
+
+
+def test_global_inline_flag_is_rejected():
+    # Compiles on its own, but not inside the combined expression
+    assert validate_rule(make_rule(1, '(?i)amzn')) is not None
+
+
+def test_global_inline_flag_does_not_break_other_rules():
+    bad = make_rule(1, '(?i)amzn')
+    good = make_rule(2, r'uber\s+trip')
+    words = make_rule(3, 'coffee shop', match_type='tokens')
+    matcher = RuleMatcher([bad, good, words])
+    assert [rule for rule, error in matcher.invalid] == [bad]
+    assert matcher.match('UBER   TRIP 1234') is good
+    assert matcher.match('The Coffee Shop') is words
+    assert matcher.match('AMZN Mktp') is None
+
+
+def test_scoped_inline_flag_is_accepted():
+    rule = make_rule(1, '(?i:amzn)')
+    assert validate_rule(rule) is None
+    assert RuleMatcher([rule]).match('amzn mktp') is rule
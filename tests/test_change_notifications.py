@@ -0,0 +1,41 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import Database
+
+
+def test_listeners_see_bumped_versions(tmp_path):
+    db = Database(str(tmp_path / 'finance.db'))
+    seen = []
+    db.add_change_listener(lambda changes: seen.append((changes, db.data_version('currency'),
+                                                        db.refs.currency_names())))
+    version = db.data_version('currency')
+    row_id = db.insert_currency('EUR', 1.1)
+    assert seen == [([('currency', 'insert', row_id, None)], db.data_version('currency'), ['EUR'])]
+    # One bump per write
+    assert db.data_version('currency') == (version[0] + 1,)
+    db.close_connection()
+
+
+def test_transaction_changes_are_sent_at_commit(tmp_path):
+    db = Database(str(tmp_path / 'finance.db'))
+    account_id = db.insert_account('Cash', db.insert_category('Assets'))
+    transaction_id = db.insert_transaction('Groceries', db.insert_currency('EUR', 1.0))
+    db.conn.commit()
+    seen = []
+    db.add_change_listener(seen.append)
+    db.begin_transaction()
+    first = db.insert_transaction_line(transaction_id, account_id, debit=10, date='2025-01-02')
+    second = db.insert_transaction_line(transaction_id, account_id, credit=10, date='2025-01-02')
+    assert seen == []
+    db.commit_transaction()
+    assert seen == [[('transaction_lines', 'insert', first, transaction_id),
+                     ('transaction_lines', 'insert', second, transaction_id)]]
+
+    db.begin_transaction()
+    db.insert_transaction_line(transaction_id, account_id, debit=5, date='2025-01-03')
+    db.rollback_transaction()
+    assert len(seen) == 1
+    db.close_connection()
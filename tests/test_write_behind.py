@@ -0,0 +1,62 @@
+import os
+import sys
+import sqlite3
+import subprocess
+import textwrap
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from database import Database
+
+
+def currencies(db_name):
+    conn = sqlite3.connect(db_name)
+    try:
+        return dict(conn.execute("SELECT name, exchange_rate FROM currency"))
+    finally:
+        conn.close()
+
+
+def test_close_writes_changes_and_removes_journal(tmp_path):
+    db_name, journal_path = str(tmp_path / 'finance.db'), str(tmp_path / 'local' / 'finance.journal.db')
+    Database(db_name).close_connection()
+    db = Database(db_name)
+    db.use_memory_copy(interval=3600, journal_path=journal_path)
+    db.conn.execute("INSERT INTO currency (name, exchange_rate) VALUES ('EUR', 1.1)")
+    db.conn.execute("INSERT OR REPLACE INTO currency (id, name, exchange_rate) "
+                    "SELECT id, 'EUR', 1.2 FROM currency WHERE name = 'EUR'")
+    db.conn.commit()
+    db.close_connection()
+    assert currencies(db_name) == {'EUR': 1.2}
+    assert not os.path.exists(journal_path)
+
+
+def test_journal_left_by_a_crash_is_replayed(tmp_path):
+    db_name, journal_path = str(tmp_path / 'finance.db'), str(tmp_path / 'local' / 'finance.journal.db')
+    Database(db_name).close_connection()
+    # Commits, then ends without flushing or closing
+    crash = textwrap.dedent(f"""
+        import os, sys
+        sys.path.insert(0, {ROOT!r})
+        from database import Database
+        db = Database({db_name!r})
+        db.use_memory_copy(interval=3600, journal_path={journal_path!r})
+        db.conn.execute("INSERT INTO currency (name, exchange_rate) VALUES ('EUR', 1.1)")
+        db.conn.execute("INSERT INTO currency (name, exchange_rate) VALUES ('USD', 1.0)")
+        db.conn.commit()
+        db.conn.execute("DELETE FROM currency WHERE name = 'USD'")
+        db.conn.commit()
+        db.conn.execute("INSERT INTO currency (name, exchange_rate) VALUES ('GBP', 0.9)")
+        os._exit(1)
+    """)
+    subprocess.run([sys.executable, '-c', crash], check=False)
+    assert currencies(db_name) == {}
+    assert os.path.exists(journal_path)
+
+    db = Database(db_name)
+    db.use_memory_copy(interval=3600, journal_path=journal_path)
+    assert currencies(db_name) == {'EUR': 1.1}
+    assert dict(db.conn.execute("SELECT name, exchange_rate FROM currency")) == {'EUR': 1.1}
+    db.close_connection()
+    assert not os.path.exists(journal_path)